@@ -50,10 +50,34 @@ DB_PATH = os.path.join(BASE_DIR, 'vpn_bot.db')
 CLIENTS_DIR = os.path.join(BASE_DIR, 'clients')
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
+# Настройки пула соединений с базой данных
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '4'))  # Количество постоянных соединений
+DB_TIMEOUT = float(os.getenv('DB_TIMEOUT', '30'))  # Ожидание блокировки базы (секунды)
+
+# Параметры SQLite (журнал WAL позволяет читать во время записи)
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', '16384'))  # Кэш страниц на соединение
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024)))  # Отображение файла в память
+DB_CHECKPOINT_INTERVAL = 5  # Интервал контрольных точек WAL по умолчанию (минуты)
+
 # Настройки Wireguard
+WG_INTERFACE = os.getenv('WG_INTERFACE', 'wg0')
 WG_CONFIG_PATH = '/etc/wireguard/wg0.conf'
 WG_SERVER_PRIVKEY_PATH = '/etc/wireguard/server_private.key'
 WG_SERVER_PUBKEY_PATH = '/etc/wireguard/server_public.key'
+WG_SUBNET = os.getenv('WG_SUBNET', '10.0.0.0/24')  # Подсеть клиентов (IPv4 или IPv6)
+WG_IP_POOL_PATH = os.path.join(BASE_DIR, 'ip_pool.bin')  # Карта занятых адресов подсети
+WG_COMMAND_TIMEOUT = float(os.getenv('WG_COMMAND_TIMEOUT', '15'))  # Ожидание команд wg и systemctl status (секунды)
+WG_RESTART_TIMEOUT = float(os.getenv('WG_RESTART_TIMEOUT', '60'))  # Ожидание перезапуска службы WireGuard (секунды)
+WG_STATUS_TTL = float(os.getenv('WG_STATUS_TTL', '5'))  # Время жизни снимка wg show и systemctl status (секунды)
+
+# Режим webhook (включается заданием WEBHOOK_URL, иначе используется long polling)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # Внешний HTTPS-адрес бота, например https://vpn.example.com
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # Секретный токен запросов Telegram (по умолчанию новый при каждом запуске)
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '127.0.0.1')  # Адрес локального веб-сервера (за обратным прокси)
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))  # Одновременных запросов от Telegram (1-100)
+WEBHOOK_KEEPALIVE_TIMEOUT = float(os.getenv('WEBHOOK_KEEPALIVE_TIMEOUT', '75'))  # Удержание соединений keep-alive (секунды)
 
 # Настройки сайта и поддержки
 WEBSITE_URL = os.getenv('WEBSITE_URL', 'https://рукодер.рф/vpn')
@@ -68,6 +92,36 @@ COPYRIGHT = '© 2025 RUCODER. Все права защищены.'
 CPU_THRESHOLD = 80  # Процент использования CPU для оповещения
 MEMORY_THRESHOLD = 80  # Процент использования памяти для оповещения
 DISK_THRESHOLD = 90  # Процент использования диска для оповещения
+LOOP_LAG_INTERVAL = 0.5  # Период измерения задержки цикла событий (секунды)
+LOOP_LAG_THRESHOLD = 0.25  # Задержка цикла событий, при которой пишется предупреждение (секунды)
+TRAFFIC_COLLECT_INTERVAL = 60  # Период сбора трафика клиентов из wg show dump (секунды)
+WG_SESSION_TIMEOUT = 180  # Время без рукопожатия, после которого сессия считается завершённой (секунды)
+METRICS_RAW_RETENTION_DAYS = int(os.getenv('METRICS_RAW_RETENTION_DAYS', '7'))  # Хранение исходных замеров метрик (дни)
+METRICS_HOURLY_RETENTION_DAYS = int(os.getenv('METRICS_HOURLY_RETENTION_DAYS', '90'))  # Хранение почасовых агрегатов (суточные хранятся всегда)
+
+# Настройки рассылки
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '25'))  # Сообщений в секунду (лимит Telegram - около 30)
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '10'))  # Одновременных запросов к Bot API
+BROADCAST_BATCH_SIZE = 500  # Получателей в одной порции (после каждой порции сохраняется прогресс)
+BROADCAST_PROGRESS_INTERVAL = 5  # Период обновления сообщения о ходе рассылки (секунды)
+BROADCAST_MAX_RETRIES = 3  # Повторов отправки при сетевых ошибках и ответе 429
+QR_CACHE_SIZE = 256  # Количество QR-кодов конфигураций, хранимых в памяти
+
+# Хранилище состояний FSM
+FSM_CACHE_SIZE = int(os.getenv('FSM_CACHE_SIZE', '1024'))  # Состояний, хранимых в памяти
+FSM_FLUSH_INTERVAL = float(os.getenv('FSM_FLUSH_INTERVAL', '1'))  # Период записи изменений в базу (секунды)
+FSM_STATE_TTL = int(os.getenv('FSM_STATE_TTL', str(24 * 60 * 60)))  # Время жизни неизменяемого состояния (секунды)
+
+# Тест скорости соединения
+SPEED_TEST_CACHE_TTL = int(os.getenv('SPEED_TEST_CACHE_TTL', '300'))  # Время, в течение которого показывается последний результат (секунды)
+SPEED_TEST_USER_INTERVAL = int(os.getenv('SPEED_TEST_USER_INTERVAL', '600'))  # Минимальный интервал между запусками теста одним пользователем (секунды)
+SPEED_TEST_DOWNLOAD_CONCURRENCY = int(os.getenv('SPEED_TEST_DOWNLOAD_CONCURRENCY', '1'))  # Одновременных загрузок тестовых файлов
+
+# Обработка обновлений пулом воркеров (0 - отдельная задача на каждое обновление)
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', '0'))  # Одновременно обрабатываемых чатов
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', '1000'))  # Обновлений в очереди, после которых прием приостанавливается
+UPDATE_DRAIN_TIMEOUT = 30  # Ожидание обработки очереди при остановке бота (секунды)
+QR_RENDER_PROCESSES = int(os.getenv('QR_RENDER_PROCESSES', '0'))  # Процессов отрисовки QR-кодов (0 - пул потоков)
 
 # Информация о системе
 SYSTEM_INFO = {
@@ -17,14 +17,14 @@ from config import DB_PATH, MIGRATIONS_TABLE, MIGRATIONS_DIRECTORY
 
 logger = logging.getLogger(__name__)
 
-async def run_migrations():
-    """Запускает все доступные миграции базы данных"""
+async def run_migrations(db_path=DB_PATH):
+    """Запускает все доступные миграции базы данных (по умолчанию - базы бота)"""
     try:
         # Создаем директорию для миграций, если её нет
         os.makedirs(MIGRATIONS_DIRECTORY, exist_ok=True)
         
         # Подключаемся к базе данных
-        conn = sqlite3.connect(DB_PATH)
+        conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
         
         # Проверяем существование таблицы миграций
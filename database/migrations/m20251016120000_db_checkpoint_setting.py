@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Миграция: db_checkpoint_setting
+Создана: 2025-10-16 12:00:00
+Автор: RUCODER (https://рукодер.рф/vpn)
+"""
+
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+async def migrate(conn, cursor):
+    """
+    Переводит базу данных в режим WAL и добавляет настройку интервала контрольных точек
+    
+    Args:
+        conn: Соединение с базой данных
+        cursor: Курсор базы данных
+    """
+    # Начало транзакции
+    try:
+        # Режим журнала сохраняется в файле базы данных
+        cursor.execute("PRAGMA journal_mode=WAL")
+        
+        cursor.execute(
+            "INSERT OR IGNORE INTO settings (name, value, description, updated_at) VALUES (?, ?, ?, ?)",
+            (
+                "db_checkpoint_interval",
+                "5",
+                "Интервал контрольных точек WAL базы данных (минуты, 0 - отключено)",
+                datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            )
+        )
+        
+        # Подтверждение транзакции
+        conn.commit()
+    except Exception as e:
+        # Откат транзакции в случае ошибки
+        conn.rollback()
+        logger.error(f"Ошибка миграции: {e}")
+        raise e
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Миграция: stats_client_traffic_index
+Создана: 2025-10-16 13:00:00
+Автор: RUCODER (https://рукодер.рф/vpn)
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+async def migrate(conn, cursor):
+    """
+    Добавляет покрывающий индекс для суммирования трафика по клиентам
+    
+    Args:
+        conn: Соединение с базой данных
+        cursor: Курсор базы данных
+    """
+    # Начало транзакции
+    try:
+        # Суммы трафика по клиентам считаются только по индексу, без чтения строк stats
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_stats_client_traffic ON stats(client_id, bytes_received, bytes_sent)"
+        )
+        
+        # Подтверждение транзакции
+        conn.commit()
+    except Exception as e:
+        # Откат транзакции в случае ошибки
+        conn.rollback()
+        logger.error(f"Ошибка миграции: {e}")
+        raise e
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Миграция: broadcasts
+Создана: 2025-10-16 14:00:00
+Автор: RUCODER (https://рукодер.рф/vpn)
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+async def migrate(conn, cursor):
+    """
+    Создает таблицу заданий рассылки (для продолжения рассылки после перезапуска)
+    
+    Args:
+        conn: Соединение с базой данных
+        cursor: Курсор базы данных
+    """
+    # Начало транзакции
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                text TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'running',
+                chat_id INTEGER,
+                message_id INTEGER,
+                last_client_id INTEGER NOT NULL DEFAULT 0,
+                total INTEGER NOT NULL DEFAULT 0,
+                sent INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        ''')
+        
+        # Подтверждение транзакции
+        conn.commit()
+    except Exception as e:
+        # Откат транзакции в случае ошибки
+        conn.rollback()
+        logger.error(f"Ошибка миграции: {e}")
+        raise e
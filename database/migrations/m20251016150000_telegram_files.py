@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Миграция: telegram_files
+Создана: 2025-10-16 15:00:00
+Автор: RUCODER (https://рукодер.рф/vpn)
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+async def migrate(conn, cursor):
+    """
+    Создает таблицу file_id файлов, уже загруженных в Telegram
+    
+    Args:
+        conn: Соединение с базой данных
+        cursor: Курсор базы данных
+    """
+    # Начало транзакции
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS telegram_files (
+                client_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                file_id TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                PRIMARY KEY (client_id, kind)
+            )
+        ''')
+        
+        # Подтверждение транзакции
+        conn.commit()
+    except Exception as e:
+        # Откат транзакции в случае ошибки
+        conn.rollback()
+        logger.error(f"Ошибка миграции: {e}")
+        raise e
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Миграция: server_metrics_rollups
+Создана: 2025-10-16 16:00:00
+Автор: RUCODER (https://рукодер.рф/vpn)
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+ROLLUPS = (
+    ("server_metrics_hourly", "%Y-%m-%d %H:00:00"),
+    ("server_metrics_daily", "%Y-%m-%d 00:00:00"),
+)
+
+async def migrate(conn, cursor):
+    """
+    Создает почасовые и суточные агрегаты метрик сервера и заполняет их по имеющимся данным
+    
+    Args:
+        conn: Соединение с базой данных
+        cursor: Курсор базы данных
+    """
+    # Начало транзакции
+    try:
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_server_metrics_timestamp ON server_metrics(timestamp)')
+        
+        for table, period_format in ROLLUPS:
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    period TEXT PRIMARY KEY,
+                    samples INTEGER NOT NULL DEFAULT 0,
+                    cpu_sum REAL NOT NULL DEFAULT 0,
+                    cpu_max REAL,
+                    cpu_p95 REAL,
+                    memory_sum REAL NOT NULL DEFAULT 0,
+                    memory_max REAL,
+                    memory_p95 REAL,
+                    disk_sum REAL NOT NULL DEFAULT 0,
+                    disk_max REAL,
+                    network_in REAL NOT NULL DEFAULT 0,
+                    network_out REAL NOT NULL DEFAULT 0,
+                    connections_sum INTEGER NOT NULL DEFAULT 0,
+                    connections_max INTEGER,
+                    connections_p95 INTEGER,
+                    finalized INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            
+            # Процентили считаются при закрытии периода (ServerMetricsModel.finalize_rollups)
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO {table} 
+                (period, samples, cpu_sum, cpu_max, memory_sum, memory_max, disk_sum, disk_max, 
+                 network_in, network_out, connections_sum, connections_max) 
+                SELECT 
+                    strftime('{period_format}', timestamp), 
+                    COUNT(*), 
+                    COALESCE(SUM(cpu_usage), 0), MAX(cpu_usage), 
+                    COALESCE(SUM(memory_usage), 0), MAX(memory_usage), 
+                    COALESCE(SUM(disk_usage), 0), MAX(disk_usage), 
+                    COALESCE(SUM(network_in), 0), COALESCE(SUM(network_out), 0), 
+                    COALESCE(SUM(active_connections), 0), MAX(active_connections) 
+                FROM server_metrics 
+                GROUP BY 1
+            ''')
+        
+        # Подтверждение транзакции
+        conn.commit()
+    except Exception as e:
+        # Откат транзакции в случае ошибки
+        conn.rollback()
+        logger.error(f"Ошибка миграции: {e}")
+        raise e
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Миграция: epoch_timestamps
+Создана: 2025-10-16 17:00:00
+Автор: RUCODER (https://рукодер.рф/vpn)
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _column_type(cursor, table, column):
+    for row in cursor.execute(f"PRAGMA table_info({table})").fetchall():
+        if row[1] == column:
+            return row[2].upper()
+    return None
+
+async def migrate(conn, cursor):
+    """
+    Переводит даты stats и server_metrics из текста "%Y-%m-%d %H:%M:%S" (местное время)
+    в целые unix-метки и создает покрывающие индексы
+    
+    Тип столбца в SQLite задается при создании таблицы, поэтому таблицы пересоздаются.
+    
+    Args:
+        conn: Соединение с базой данных
+        cursor: Курсор базы данных
+    """
+    # Начало транзакции
+    try:
+        # Новая база (init_db) уже создана с целыми метками
+        if _column_type(cursor, "stats", "connection_date") != "INTEGER":
+            cursor.execute('''
+                CREATE TABLE stats_new (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    client_id INTEGER NOT NULL,
+                    connection_date INTEGER NOT NULL,
+                    disconnection_date INTEGER,
+                    session_duration INTEGER DEFAULT 0,
+                    ip_address TEXT,
+                    bytes_received INTEGER DEFAULT 0,
+                    bytes_sent INTEGER DEFAULT 0,
+                    FOREIGN KEY (client_id) REFERENCES clients (id)
+                )
+            ''')
+            # Модификатор 'utc' переводит местное время в UTC перед расчетом метки
+            cursor.execute('''
+                INSERT INTO stats_new 
+                (id, client_id, connection_date, disconnection_date, session_duration, ip_address, bytes_received, bytes_sent) 
+                SELECT 
+                    id, client_id, 
+                    CAST(strftime('%s', connection_date, 'utc') AS INTEGER), 
+                    CAST(strftime('%s', disconnection_date, 'utc') AS INTEGER), 
+                    session_duration, ip_address, bytes_received, bytes_sent 
+                FROM stats
+            ''')
+            cursor.execute("DROP TABLE stats")
+            cursor.execute("ALTER TABLE stats_new RENAME TO stats")
+        
+        if _column_type(cursor, "server_metrics", "timestamp") != "INTEGER":
+            cursor.execute('''
+                CREATE TABLE server_metrics_new (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp INTEGER NOT NULL,
+                    cpu_usage REAL,
+                    memory_usage REAL,
+                    disk_usage REAL,
+                    network_in INTEGER,
+                    network_out INTEGER,
+                    active_connections INTEGER
+                )
+            ''')
+            cursor.execute('''
+                INSERT INTO server_metrics_new 
+                (id, timestamp, cpu_usage, memory_usage, disk_usage, network_in, network_out, active_connections) 
+                SELECT 
+                    id, CAST(strftime('%s', timestamp, 'utc') AS INTEGER), 
+                    cpu_usage, memory_usage, disk_usage, network_in, network_out, active_connections 
+                FROM server_metrics
+            ''')
+            cursor.execute("DROP TABLE server_metrics")
+            cursor.execute("ALTER TABLE server_metrics_new RENAME TO server_metrics")
+        
+        # Индексы по client_id и client_id + трафик покрываются новым индексом
+        cursor.execute("DROP INDEX IF EXISTS idx_stats_client_id")
+        cursor.execute("DROP INDEX IF EXISTS idx_stats_client_traffic")
+        cursor.execute("DROP INDEX IF EXISTS idx_stats_connection_date")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_stats_client_connection "
+            "ON stats(client_id, connection_date, bytes_received, bytes_sent)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_stats_connection_traffic "
+            "ON stats(connection_date, bytes_received, bytes_sent)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_stats_open_sessions ON stats(client_id) WHERE disconnection_date IS NULL"
+        )
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_server_metrics_timestamp ON server_metrics(timestamp)")
+        
+        # Подтверждение транзакции
+        conn.commit()
+    except Exception as e:
+        # Откат транзакции в случае ошибки
+        conn.rollback()
+        logger.error(f"Ошибка миграции: {e}")
+        raise e
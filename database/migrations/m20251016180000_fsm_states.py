@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Миграция: fsm_states
+Создана: 2025-10-16 18:00:00
+Автор: RUCODER (https://рукодер.рф/vpn)
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+async def migrate(conn, cursor):
+    """
+    Создает таблицу состояний FSM (диалоги не теряются при перезапуске бота)
+    
+    Args:
+        conn: Соединение с базой данных
+        cursor: Курсор базы данных
+    """
+    # Начало транзакции
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fsm_states (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL DEFAULT '{}',
+                updated_at INTEGER NOT NULL
+            )
+        ''')
+        
+        # Для удаления устаревших состояний
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states(updated_at)')
+        
+        # Подтверждение транзакции
+        conn.commit()
+    except Exception as e:
+        # Откат транзакции в случае ошибки
+        conn.rollback()
+        logger.error(f"Ошибка миграции: {e}")
+        raise e
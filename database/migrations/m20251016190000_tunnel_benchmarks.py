@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Миграция: tunnel_benchmarks
+Создана: 2025-10-16 19:00:00
+Автор: RUCODER (https://рукодер.рф/vpn)
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+async def migrate(conn, cursor):
+    """
+    Создает таблицу результатов нагрузочного теста туннеля
+    
+    Args:
+        conn: Соединение с базой данных
+        cursor: Курсор базы данных
+    """
+    # Начало транзакции
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tunnel_benchmarks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at INTEGER NOT NULL,
+                mode TEXT NOT NULL,
+                mtu INTEGER NOT NULL,
+                peers INTEGER NOT NULL,
+                duration REAL NOT NULL,
+                goodput_mbps REAL,
+                pps REAL,
+                loss REAL,
+                latency_avg_ms REAL,
+                latency_p95_ms REAL,
+                cpu_count INTEGER
+            )
+        ''')
+        
+        # Подтверждение транзакции
+        conn.commit()
+    except Exception as e:
+        # Откат транзакции в случае ошибки
+        conn.rollback()
+        logger.error(f"Ошибка миграции: {e}")
+        raise e
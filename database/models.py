@@ -6,96 +6,230 @@
 Автор: RUCODER (https://рукодер.рф/vpn)
 """
 
+import time
 import sqlite3
+import asyncio
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import os
-from config import DB_PATH
+from config import (
+    DB_PATH, DB_POOL_SIZE, DB_TIMEOUT, DB_CACHE_SIZE_KB, DB_MMAP_SIZE,
+    METRICS_RAW_RETENTION_DAYS, METRICS_HOURLY_RETENTION_DAYS
+)
+from database.rows import Client, StatRecord, Metric, BenchmarkResult
 
 logger = logging.getLogger(__name__)
 
+def to_epoch(value):
+    """Переводит datetime, строку "%Y-%m-%d %H:%M:%S" (местное время) или число в unix-метку"""
+    if isinstance(value, str):
+        value = datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    return int(value)
+
+def configure_connection(conn):
+    """Включает журнал WAL и настраивает параметры производительности соединения"""
+    conn.execute("PRAGMA journal_mode=WAL")
+    # В режиме WAL NORMAL не теряет целостность, но не делает fsync на каждую транзакцию
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+class ConnectionPool:
+    """Пул потоков базы данных, каждый из которых держит постоянное соединение"""
+    
+    def __init__(self, db_path, size=DB_POOL_SIZE):
+        self.db_path = db_path
+        self.size = max(1, size)
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="db")
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+    
+    def _get_thread_connection(self):
+        """Возвращает соединение текущего потока пула, открывая его при первом обращении"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=DB_TIMEOUT, check_same_thread=False)
+            configure_connection(conn)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+    
+    def _call(self, func, args):
+        return func(self._get_thread_connection(), *args)
+    
+    async def run(self, func, *args):
+        """Выполняет func(conn, *args) в потоке пула, не блокируя цикл событий"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, func, args)
+    
+    def close(self):
+        """Останавливает потоки пула и закрывает соединения"""
+        self._executor.shutdown(wait=True)
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except Exception as e:
+                    logger.error(f"Ошибка при закрытии соединения с базой данных: {e}")
+            self._connections.clear()
+
 class Database:
+    # Пулы соединений общие для всех моделей, работающих с одним файлом
+    _pools = {}
+    
     def __init__(self, db_path=DB_PATH):
         self.db_path = db_path
     
+    @property
+    def pool(self):
+        """Возвращает пул соединений для файла базы данных"""
+        pool = Database._pools.get(self.db_path)
+        if pool is None:
+            pool = ConnectionPool(self.db_path)
+            Database._pools[self.db_path] = pool
+        return pool
+    
+    @classmethod
+    def close_all(cls):
+        """Закрывает все пулы соединений"""
+        for pool in cls._pools.values():
+            pool.close()
+        cls._pools.clear()
+    
     def get_connection(self):
-        """Получает соединение с базой данных"""
-        return sqlite3.connect(self.db_path)
+        """Получает отдельное синхронное соединение с базой данных (для скриптов)"""
+        return configure_connection(sqlite3.connect(self.db_path, timeout=DB_TIMEOUT))
+    
+    async def run(self, func, *args):
+        """Выполняет func(conn, *args) на соединении из пула"""
+        return await self.pool.run(func, *args)
+    
+    async def checkpoint(self, mode="PASSIVE"):
+        """Переносит страницы из журнала WAL в основной файл базы данных"""
+        return await self.fetch_one(f"PRAGMA wal_checkpoint({mode})")
+    
+    @staticmethod
+    def _execute(conn, query, params):
+        try:
+            cursor = conn.execute(query, params)
+            conn.commit()
+            return cursor
+        except Exception:
+            conn.rollback()
+            raise
+    
+    @staticmethod
+    def _cursor(conn, query, params, row_class):
+        cursor = conn.execute(query, params)
+        if row_class is not None:
+            cursor.row_factory = row_class.factory(cursor.description)
+        return cursor
+    
+    @staticmethod
+    def _fetch_all(conn, query, params, row_class=None):
+        return Database._cursor(conn, query, params, row_class).fetchall()
+    
+    @staticmethod
+    def _fetch_one(conn, query, params, row_class=None):
+        return Database._cursor(conn, query, params, row_class).fetchone()
     
     async def execute(self, query, params=None):
         """Выполняет запрос к базе данных"""
         params = params or ()
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            conn.commit()
-            return cursor
+            return await self.run(self._execute, query, params)
         except Exception as e:
             logger.error(f"Ошибка выполнения запроса: {e}\nЗапрос: {query}\nПараметры: {params}")
             raise e
-        finally:
-            if conn:
-                conn.close()
     
-    async def fetch_all(self, query, params=None):
-        """Выполняет запрос и возвращает все результаты"""
+    async def fetch_all(self, query, params=None, row_class=None):
+        """Выполняет запрос и возвращает все результаты (объектами row_class, если он задан)"""
         params = params or ()
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            return cursor.fetchall()
+            return await self.run(self._fetch_all, query, params, row_class)
         except Exception as e:
             logger.error(f"Ошибка выполнения запроса: {e}\nЗапрос: {query}\nПараметры: {params}")
             raise e
-        finally:
-            if conn:
-                conn.close()
     
-    async def fetch_one(self, query, params=None):
-        """Выполняет запрос и возвращает один результат"""
+    async def fetch_one(self, query, params=None, row_class=None):
+        """Выполняет запрос и возвращает один результат (объектом row_class, если он задан)"""
         params = params or ()
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            return cursor.fetchone()
+            return await self.run(self._fetch_one, query, params, row_class)
         except Exception as e:
             logger.error(f"Ошибка выполнения запроса: {e}\nЗапрос: {query}\nПараметры: {params}")
             raise e
-        finally:
-            if conn:
-                conn.close()
 
 class ClientModel:
     def __init__(self, db=None):
         self.db = db or Database()
     
-    async def get_all_clients(self):
+    async def get_all_clients(self, fields=Client.LIST_FIELDS):
         """Получает список всех клиентов"""
-        query = "SELECT * FROM clients ORDER BY create_date DESC"
-        return await self.db.fetch_all(query)
+        query = f"SELECT {Client.columns(fields)} FROM clients ORDER BY create_date DESC"
+        return await self.db.fetch_all(query, row_class=Client)
+    
+    async def count_clients(self, active_only=False):
+        """Получает количество клиентов (или только активных и незаблокированных)"""
+        query = "SELECT COUNT(*) FROM clients"
+        if active_only:
+            query += " WHERE is_active = 1 AND is_blocked = 0"
+        result = await self.db.fetch_one(query)
+        return result[0] if result else 0
     
-    async def get_active_clients(self):
+    async def get_clients_page(self, page_size=5, after_id=None, before_id=None):
+        """
+        Получает страницу клиентов (keyset-пагинация по убыванию ID)
+        
+        Args:
+            page_size: Количество клиентов на странице
+            after_id: ID последнего клиента предыдущей страницы (переход вперёд)
+            before_id: ID первого клиента следующей страницы (переход назад)
+            
+        Returns:
+            Кортеж (клиенты_страницы, общее_количество_клиентов)
+        """
+        columns = Client.columns(Client.LIST_FIELDS)
+        
+        if before_id is not None:
+            query = f"SELECT {columns} FROM clients WHERE id > ? ORDER BY id ASC LIMIT ?"
+            clients = list(reversed(await self.db.fetch_all(query, (before_id, page_size), Client)))
+        elif after_id is not None:
+            query = f"SELECT {columns} FROM clients WHERE id < ? ORDER BY id DESC LIMIT ?"
+            clients = await self.db.fetch_all(query, (after_id, page_size), Client)
+        else:
+            query = f"SELECT {columns} FROM clients ORDER BY id DESC LIMIT ?"
+            clients = await self.db.fetch_all(query, (page_size,), Client)
+        
+        return clients, await self.count_clients()
+    
+    async def get_active_clients(self, fields=Client.LIST_FIELDS):
         """Получает список активных клиентов"""
-        query = "SELECT * FROM clients WHERE is_active = 1 AND is_blocked = 0 ORDER BY create_date DESC"
-        return await self.db.fetch_all(query)
+        query = f"SELECT {Client.columns(fields)} FROM clients WHERE is_active = 1 AND is_blocked = 0 ORDER BY create_date DESC"
+        return await self.db.fetch_all(query, row_class=Client)
     
-    async def get_client_by_id(self, client_id):
-        """Получает клиента по ID"""
-        query = "SELECT * FROM clients WHERE id = ?"
-        return await self.db.fetch_one(query, (client_id,))
+    async def get_client_by_id(self, client_id, fields=Client.PROFILE_FIELDS):
+        """Получает клиента по ID (только поля fields)"""
+        query = f"SELECT {Client.columns(fields)} FROM clients WHERE id = ?"
+        return await self.db.fetch_one(query, (client_id,), Client)
     
-    async def get_client_by_name(self, name):
-        """Получает клиента по имени"""
-        query = "SELECT * FROM clients WHERE name = ?"
-        return await self.db.fetch_one(query, (name,))
+    async def get_client_by_name(self, name, fields=Client.PROFILE_FIELDS):
+        """Получает клиента по имени (только поля fields)"""
+        query = f"SELECT {Client.columns(fields)} FROM clients WHERE name = ?"
+        return await self.db.fetch_one(query, (name,), Client)
     
-    async def get_client_by_user_id(self, user_id):
-        """Получает клиента по ID пользователя Telegram"""
-        query = "SELECT * FROM clients WHERE user_id = ?"
-        return await self.db.fetch_one(query, (user_id,))
+    async def get_client_by_user_id(self, user_id, fields=Client.PROFILE_FIELDS):
+        """Получает клиента по ID пользователя Telegram (только поля fields)"""
+        query = f"SELECT {Client.columns(fields)} FROM clients WHERE user_id = ?"
+        return await self.db.fetch_one(query, (user_id,), Client)
     
     async def create_client(self, name, user_id=None, email=None, expiry_days=30, 
                             public_key=None, private_key=None):
@@ -113,6 +247,56 @@ class ClientModel:
         # Получаем созданного клиента
         return await self.get_client_by_name(name)
     
+    async def get_existing_names(self, names):
+        """Возвращает множество имен из списка, уже занятых клиентами"""
+        names = list(names)
+        existing = set()
+        
+        # Ограничение SQLite на количество параметров запроса
+        for i in range(0, len(names), 500):
+            chunk = names[i:i + 500]
+            query = f"SELECT name FROM clients WHERE name IN ({', '.join('?' * len(chunk))})"
+            existing.update(row[0] for row in await self.db.fetch_all(query, chunk))
+        
+        return existing
+    
+    async def create_clients_bulk(self, clients):
+        """
+        Создает нескольких клиентов в одной транзакции
+        
+        Args:
+            clients: Список кортежей (name, user_id, email, expiry_days, public_key, private_key)
+            
+        Returns:
+            Список ID созданных клиентов в порядке clients
+        """
+        now = datetime.now()
+        create_date = now.strftime("%Y-%m-%d %H:%M:%S")
+        query = """
+            INSERT INTO clients 
+            (name, user_id, email, create_date, expiry_date, is_active, public_key, private_key) 
+            VALUES (?, ?, ?, ?, ?, 1, ?, ?)
+        """
+        
+        def write(conn):
+            try:
+                client_ids = []
+                for name, user_id, email, expiry_days, public_key, private_key in clients:
+                    expiry_date = (now + timedelta(days=expiry_days)).strftime("%Y-%m-%d %H:%M:%S") if expiry_days else None
+                    cursor = conn.execute(query, (name, user_id, email, create_date, expiry_date, public_key, private_key))
+                    client_ids.append(cursor.lastrowid)
+                conn.commit()
+                return client_ids
+            except Exception:
+                conn.rollback()
+                raise
+        
+        try:
+            return await self.db.run(write)
+        except Exception as e:
+            logger.error(f"Ошибка при массовом создании клиентов: {e}")
+            raise e
+    
     async def update_client(self, client_id, **kwargs):
         """Обновляет данные клиента"""
         # Формируем части запроса
@@ -138,6 +322,9 @@ class ClientModel:
         """Удаляет клиента"""
         query = "DELETE FROM clients WHERE id = ?"
         await self.db.execute(query, (client_id,))
+        
+        # Загруженные в Telegram файлы клиента больше не нужны
+        await self.db.execute("DELETE FROM telegram_files WHERE client_id = ?", (client_id,))
     
     async def activate_client(self, client_id):
         """Активирует клиента"""
@@ -157,14 +344,23 @@ class ClientModel:
     
     async def update_client_usage(self, client_id, bytes_received, bytes_sent):
         """Обновляет использование трафика клиентом"""
-        client = await self.get_client_by_id(client_id)
-        if not client:
+        query = """
+            UPDATE clients 
+            SET data_used = COALESCE(data_used, 0) + ?, last_connection = ? 
+            WHERE id = ?
+        """
+        cursor = await self.db.execute(query, (
+            bytes_received + bytes_sent, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), client_id
+        ))
+        if not cursor.rowcount:
             return None
         
-        current_usage = client[13] or 0  # data_used колонка
-        new_usage = current_usage + bytes_received + bytes_sent
-        
-        return await self.update_client(client_id, data_used=new_usage, last_connection=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        return await self.get_client_by_id(client_id)
+    
+    async def get_public_key_map(self):
+        """Получает соответствие публичных ключей WireGuard и ID клиентов"""
+        query = "SELECT public_key, id FROM clients WHERE public_key IS NOT NULL"
+        return dict(await self.db.fetch_all(query))
     
     async def check_expired_clients(self):
         """Проверяет и деактивирует просроченные аккаунты клиентов"""
@@ -180,12 +376,12 @@ class ClientModel:
         
         # Возвращаем список деактивированных клиентов
         query = f"""
-            SELECT * FROM clients 
+            SELECT {Client.columns(Client.LIST_FIELDS)} FROM clients 
             WHERE expiry_date IS NOT NULL 
             AND expiry_date < '{now}' 
             AND is_active = 0
         """
-        return await self.db.fetch_all(query)
+        return await self.db.fetch_all(query, row_class=Client)
 
 class StatsModel:
     def __init__(self, db=None):
@@ -193,54 +389,104 @@ class StatsModel:
     
     async def log_connection(self, client_id, ip_address):
         """Логирует подключение клиента"""
-        connection_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        connection_date = int(time.time())
         query = """
             INSERT INTO stats 
             (client_id, connection_date, ip_address, bytes_received, bytes_sent) 
             VALUES (?, ?, ?, 0, 0)
         """
-        await self.db.execute(query, (client_id, connection_date, ip_address))
+        cursor = await self.db.execute(query, (client_id, connection_date, ip_address))
         
-        # Получаем ID созданной записи
-        query = "SELECT last_insert_rowid()"
-        result = await self.db.fetch_one(query)
-        return result[0] if result else None
+        # ID созданной записи (last_insert_rowid привязан к соединению)
+        return cursor.lastrowid
     
     async def log_disconnection(self, stats_id, bytes_received, bytes_sent):
         """Логирует отключение клиента"""
-        disconnection_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Получаем текущую запись
-        query = "SELECT connection_date FROM stats WHERE id = ?"
-        stats = await self.db.fetch_one(query, (stats_id,))
+        disconnection_date = int(time.time())
         
-        if not stats:
-            return None
-        
-        # Вычисляем продолжительность сессии
-        connection_date = datetime.strptime(stats[0], "%Y-%m-%d %H:%M:%S")
-        disconnection_date_obj = datetime.now()
-        session_duration = int((disconnection_date_obj - connection_date).total_seconds())
-        
-        # Обновляем запись
+        # Продолжительность сессии считается по метке подключения той же записи
         query = """
             UPDATE stats 
-            SET disconnection_date = ?, bytes_received = ?, bytes_sent = ?, session_duration = ? 
-            WHERE id = ?
+            SET disconnection_date = ?1, bytes_received = ?2, bytes_sent = ?3, 
+                session_duration = MAX(0, ?1 - connection_date) 
+            WHERE id = ?4
+        """
+        cursor = await self.db.execute(query, (disconnection_date, bytes_received, bytes_sent, stats_id))
+        
+        return stats_id if cursor.rowcount else None
+    
+    async def get_open_sessions(self):
+        """Получает незавершённые сессии в виде {client_id: stats_id}"""
+        query = "SELECT client_id, id FROM stats WHERE disconnection_date IS NULL ORDER BY id"
+        return dict(await self.db.fetch_all(query))
+    
+    async def record_traffic(self, opened=(), updated=(), closed=(), usage=()):
         """
-        await self.db.execute(query, (disconnection_date, bytes_received, bytes_sent, session_duration, stats_id))
+        Записывает результаты одного цикла сбора трафика в одной транзакции
         
-        return stats_id
+        Args:
+            opened: Новые сессии [(client_id, connection_date, ip_address, bytes_received, bytes_sent)]
+            updated: Прирост трафика открытых сессий [(bytes_received, bytes_sent, stats_id)]
+            closed: Завершённые сессии [(disconnection_date, bytes_received, bytes_sent, stats_id)]
+            (даты сессий - unix-метки)
+            usage: Прирост трафика клиентов [(bytes, last_connection, client_id)]
+            
+        Returns:
+            Список ID созданных сессий в порядке opened
+        """
+        def write(conn):
+            try:
+                opened_ids = []
+                for row in opened:
+                    cursor = conn.execute("""
+                        INSERT INTO stats 
+                        (client_id, connection_date, ip_address, bytes_received, bytes_sent) 
+                        VALUES (?, ?, ?, ?, ?)
+                    """, row)
+                    opened_ids.append(cursor.lastrowid)
+                
+                conn.executemany("""
+                    UPDATE stats 
+                    SET bytes_received = bytes_received + ?, bytes_sent = bytes_sent + ? 
+                    WHERE id = ?
+                """, updated)
+                
+                conn.executemany("""
+                    UPDATE stats 
+                    SET disconnection_date = ?1, 
+                        bytes_received = bytes_received + ?2, 
+                        bytes_sent = bytes_sent + ?3, 
+                        session_duration = MAX(0, ?1 - connection_date) 
+                    WHERE id = ?4
+                """, closed)
+                
+                conn.executemany("""
+                    UPDATE clients 
+                    SET data_used = COALESCE(data_used, 0) + ?, last_connection = ? 
+                    WHERE id = ?
+                """, usage)
+                
+                conn.commit()
+                return opened_ids
+            except Exception:
+                conn.rollback()
+                raise
+        
+        try:
+            return await self.db.run(write)
+        except Exception as e:
+            logger.error(f"Ошибка при записи статистики трафика: {e}")
+            raise e
     
     async def get_client_stats(self, client_id, limit=10):
-        """Получает статистику клиента"""
+        """Получает последние сессии клиента (StatRecord)"""
         query = """
             SELECT * FROM stats 
             WHERE client_id = ? 
             ORDER BY connection_date DESC 
             LIMIT ?
         """
-        return await self.db.fetch_all(query, (client_id, limit))
+        return await self.db.fetch_all(query, (client_id, limit), StatRecord)
     
     async def get_client_usage_total(self, client_id):
         """Получает общее использование трафика клиентом"""
@@ -252,14 +498,73 @@ class StatsModel:
         result = await self.db.fetch_one(query, (client_id,))
         return result or (0, 0)
     
+    async def get_clients_usage_page(self, page=1, page_size=15, sort="recent"):
+        """
+        Получает страницу активных клиентов с суммарным трафиком одним запросом
+        
+        Args:
+            page: Номер страницы (с 1)
+            page_size: Количество клиентов на странице
+            sort: Порядок сортировки: "recent" - новые клиенты первыми,
+                "traffic" - по убыванию суммарного трафика
+            
+        Returns:
+            Кортеж (строки, общее_количество_активных_клиентов), где строка -
+            (client_id, name, last_connection, total_received, total_sent)
+        """
+        offset = (max(page, 1) - 1) * page_size
+        
+        if sort == "traffic":
+            # Для сортировки по трафику суммы нужны для всех клиентов (по индексу idx_stats_client_connection)
+            query = """
+                SELECT c.id, c.name, c.last_connection, 
+                       COALESCE(s.total_received, 0), COALESCE(s.total_sent, 0) 
+                FROM clients c 
+                LEFT JOIN (
+                    SELECT client_id, SUM(bytes_received) AS total_received, SUM(bytes_sent) AS total_sent 
+                    FROM stats 
+                    GROUP BY client_id
+                ) s ON s.client_id = c.id 
+                WHERE c.is_active = 1 AND c.is_blocked = 0 
+                ORDER BY COALESCE(s.total_received, 0) + COALESCE(s.total_sent, 0) DESC, c.id DESC 
+                LIMIT ? OFFSET ?
+            """
+        else:
+            # Суммы считаются только для клиентов выбранной страницы
+            query = """
+                SELECT c.id, c.name, c.last_connection, 
+                       COALESCE(SUM(s.bytes_received), 0), COALESCE(SUM(s.bytes_sent), 0) 
+                FROM (
+                    SELECT id, name, last_connection 
+                    FROM clients 
+                    WHERE is_active = 1 AND is_blocked = 0 
+                    ORDER BY id DESC 
+                    LIMIT ? OFFSET ?
+                ) c 
+                LEFT JOIN stats s ON s.client_id = c.id 
+                GROUP BY c.id 
+                ORDER BY c.id DESC
+            """
+        
+        rows = await self.db.fetch_all(query, (page_size, offset))
+        total = await self.db.fetch_one("SELECT COUNT(*) FROM clients WHERE is_active = 1 AND is_blocked = 0")
+        
+        return rows, total[0] if total else 0
+    
     async def get_client_usage_by_period(self, client_id, start_date, end_date):
-        """Получает использование трафика клиентом за период"""
+        """
+        Получает использование трафика клиентом за период
+        
+        Args:
+            start_date, end_date: Границы периода (datetime, строка "%Y-%m-%d %H:%M:%S" или unix-метка)
+        """
+        # Суммы считаются только по индексу idx_stats_client_connection
         query = """
             SELECT SUM(bytes_received) as total_received, SUM(bytes_sent) as total_sent 
             FROM stats 
             WHERE client_id = ? AND connection_date BETWEEN ? AND ?
         """
-        result = await self.db.fetch_one(query, (client_id, start_date, end_date))
+        result = await self.db.fetch_one(query, (client_id, to_epoch(start_date), to_epoch(end_date)))
         return result or (0, 0)
     
     async def get_overall_stats(self):
@@ -276,19 +581,20 @@ class StatsModel:
         query3 = "SELECT COUNT(*) FROM stats WHERE disconnection_date IS NULL"
         active_sessions = await self.db.fetch_one(query3)
         
-        # Статистика по дням за последний месяц
+        # Статистика по дням за последний месяц (только по индексу idx_stats_connection_traffic)
+        month_ago = datetime.combine(datetime.now().date() - timedelta(days=30), datetime.min.time())
         query4 = """
             SELECT 
-                date(connection_date) as day, 
+                date(connection_date, 'unixepoch', 'localtime') as day, 
                 COUNT(*) as connections, 
                 SUM(bytes_received) as received, 
                 SUM(bytes_sent) as sent 
             FROM stats 
-            WHERE connection_date >= date('now', '-30 days') 
+            WHERE connection_date >= ? 
             GROUP BY day 
             ORDER BY day
         """
-        daily_stats = await self.db.fetch_all(query4)
+        daily_stats = await self.db.fetch_all(query4, (to_epoch(month_ago),))
         
         return {
             "connections_count": connections_count[0] if connections_count else 0,
@@ -343,12 +649,10 @@ class NotificationModel:
             INSERT INTO notifications (type, message, created_at, read, importance) 
             VALUES (?, ?, ?, 0, ?)
         """
-        await self.db.execute(query, (notification_type, message, created_at, importance))
+        cursor = await self.db.execute(query, (notification_type, message, created_at, importance))
         
-        # Получаем ID созданного уведомления
-        query = "SELECT last_insert_rowid()"
-        result = await self.db.fetch_one(query)
-        return result[0] if result else None
+        # ID созданного уведомления (last_insert_rowid привязан к соединению)
+        return cursor.lastrowid
     
     async def get_unread_notifications(self, limit=10):
         """Получает непрочитанные уведомления"""
@@ -408,12 +712,10 @@ class FeedbackModel:
             INSERT INTO feedback (user_id, message, created_at, processed) 
             VALUES (?, ?, ?, 0)
         """
-        await self.db.execute(query, (user_id, message, created_at))
+        cursor = await self.db.execute(query, (user_id, message, created_at))
         
-        # Получаем ID созданной обратной связи
-        query = "SELECT last_insert_rowid()"
-        result = await self.db.fetch_one(query)
-        return result[0] if result else None
+        # ID созданной обратной связи (last_insert_rowid привязан к соединению)
+        return cursor.lastrowid
     
     async def get_unprocessed_feedback(self, limit=10):
         """Получает необработанную обратную связь"""
@@ -448,66 +750,193 @@ class FeedbackModel:
         query = "SELECT * FROM feedback WHERE id = ?"
         return await self.db.fetch_one(query, (feedback_id,))
 
+# Агрегаты метрик сервера: (таблица, формат периода, длительность периода)
+METRICS_ROLLUPS = (
+    ("server_metrics_hourly", "%Y-%m-%d %H:00:00", timedelta(hours=1)),
+    ("server_metrics_daily", "%Y-%m-%d 00:00:00", timedelta(days=1)),
+)
+
+def _percentile(values, percent):
+    """Процентиль по методу ближайшего ранга"""
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * percent // 100))
+    return values[int(rank) - 1]
+
 class ServerMetricsModel:
     def __init__(self, db=None):
         self.db = db or Database()
     
     async def log_metrics(self, cpu_usage, memory_usage, disk_usage, network_in, network_out, active_connections):
-        """Логирует метрики сервера"""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        query = """
-            INSERT INTO server_metrics 
-            (timestamp, cpu_usage, memory_usage, disk_usage, network_in, network_out, active_connections) 
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """Логирует метрики сервера и добавляет замер в почасовой и суточный агрегаты"""
+        now = datetime.now()
+        timestamp = int(now.timestamp())
+        values = (cpu_usage, cpu_usage, memory_usage, memory_usage, disk_usage, disk_usage,
+                  network_in, network_out, active_connections, active_connections)
+        
+        def write(conn):
+            try:
+                conn.execute("""
+                    INSERT INTO server_metrics 
+                    (timestamp, cpu_usage, memory_usage, disk_usage, network_in, network_out, active_connections) 
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (timestamp, cpu_usage, memory_usage, disk_usage, network_in, network_out, active_connections))
+                
+                for table, period_format, _ in METRICS_ROLLUPS:
+                    conn.execute(f"""
+                        INSERT INTO {table} 
+                        (period, samples, cpu_sum, cpu_max, memory_sum, memory_max, disk_sum, disk_max, 
+                         network_in, network_out, connections_sum, connections_max) 
+                        VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) 
+                        ON CONFLICT(period) DO UPDATE SET 
+                            samples = samples + 1, 
+                            cpu_sum = cpu_sum + excluded.cpu_sum, 
+                            cpu_max = MAX(COALESCE(cpu_max, excluded.cpu_max), excluded.cpu_max), 
+                            memory_sum = memory_sum + excluded.memory_sum, 
+                            memory_max = MAX(COALESCE(memory_max, excluded.memory_max), excluded.memory_max), 
+                            disk_sum = disk_sum + excluded.disk_sum, 
+                            disk_max = MAX(COALESCE(disk_max, excluded.disk_max), excluded.disk_max), 
+                            network_in = network_in + excluded.network_in, 
+                            network_out = network_out + excluded.network_out, 
+                            connections_sum = connections_sum + excluded.connections_sum, 
+                            connections_max = MAX(COALESCE(connections_max, excluded.connections_max), excluded.connections_max), 
+                            finalized = 0
+                    """, (now.strftime(period_format),) + values)
+                
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        
+        await self.db.run(write)
+    
+    async def finalize_rollups(self):
         """
-        await self.db.execute(query, (timestamp, cpu_usage, memory_usage, disk_usage, 
-                                      network_in, network_out, active_connections))
+        Рассчитывает 95-й процентиль для завершившихся периодов агрегатов
+        
+        Процентиль нельзя накапливать по мере поступления замеров, поэтому он
+        считается один раз по исходным замерам, когда период закончился.
+        
+        Returns:
+            Количество обработанных периодов
+        """
+        now = datetime.now()
+        
+        def write(conn):
+            try:
+                finalized = 0
+                for table, period_format, length in METRICS_ROLLUPS:
+                    periods = conn.execute(
+                        f"SELECT period FROM {table} WHERE finalized = 0 AND period < ? ORDER BY period",
+                        (now.strftime(period_format),)
+                    ).fetchall()
+                    
+                    for (period,) in periods:
+                        period_start = datetime.strptime(period, "%Y-%m-%d %H:%M:%S")
+                        rows = conn.execute("""
+                            SELECT cpu_usage, memory_usage, active_connections 
+                            FROM server_metrics 
+                            WHERE timestamp >= ? AND timestamp < ?
+                        """, (to_epoch(period_start), to_epoch(period_start + length))).fetchall()
+                        
+                        if rows:
+                            cpu, memory, connections = zip(*rows)
+                            conn.execute(f"""
+                                UPDATE {table} 
+                                SET cpu_p95 = ?, memory_p95 = ?, connections_p95 = ?, finalized = 1 
+                                WHERE period = ?
+                            """, (_percentile(cpu, 95), _percentile(memory, 95), _percentile(connections, 95), period))
+                        else:
+                            # Исходные замеры уже удалены - процентиль ограничиваем максимумом
+                            conn.execute(f"""
+                                UPDATE {table} 
+                                SET cpu_p95 = COALESCE(cpu_p95, cpu_max), 
+                                    memory_p95 = COALESCE(memory_p95, memory_max), 
+                                    connections_p95 = COALESCE(connections_p95, connections_max), 
+                                    finalized = 1 
+                                WHERE period = ?
+                            """, (period,))
+                        finalized += 1
+                
+                conn.commit()
+                return finalized
+            except Exception:
+                conn.rollback()
+                raise
+        
+        return await self.db.run(write)
     
     async def get_latest_metrics(self, limit=1):
-        """Получает последние метрики сервера"""
-        query = """
-            SELECT * FROM server_metrics 
+        """Получает последние метрики сервера (Metric)"""
+        query = f"""
+            SELECT {Metric.columns(Metric.FIELDS)} 
+            FROM server_metrics 
             ORDER BY timestamp DESC 
             LIMIT ?
         """
-        return await self.db.fetch_all(query, (limit,))
+        return await self.db.fetch_all(query, (limit,), Metric)
     
     async def get_metrics_by_period(self, start_date, end_date, interval='hour'):
-        """Получает метрики за период с группировкой по интервалу"""
-        interval_format = {
-            'hour': '%Y-%m-%d %H:00:00',
-            'day': '%Y-%m-%d 00:00:00',
-            'week': '%Y-%W',  # ISO неделя года
-            'month': '%Y-%m-01'
-        }.get(interval, '%Y-%m-%d %H:00:00')
+        """
+        Получает метрики за период с группировкой по интервалу
         
-        groupby = f"strftime('{interval_format}', timestamp)"
+        Данные читаются из агрегатов: почасовых для interval='hour', суточных для остальных.
         
+        Returns:
+            Список кортежей (period, avg_cpu, avg_memory, avg_disk, total_net_in, total_net_out,
+            avg_connections, max_cpu, p95_cpu, max_memory, p95_memory, max_connections)
+        """
+        if interval == 'hour':
+            table, period_format = METRICS_ROLLUPS[0][:2]
+            groupby = "period"
+        else:
+            table, period_format = METRICS_ROLLUPS[1][:2]
+            groupby = {
+                'day': "period",
+                'week': "strftime('%Y-%W', period)",  # ISO неделя года
+                'month': "strftime('%Y-%m-01', period)"
+            }.get(interval, "period")
+        
+        # p95 недели или месяца приближается максимумом суточных процентилей
         query = f"""
             SELECT 
-                {groupby} as period,
-                AVG(cpu_usage) as avg_cpu,
-                AVG(memory_usage) as avg_memory,
-                AVG(disk_usage) as avg_disk,
+                {groupby} as bucket,
+                SUM(cpu_sum) / SUM(samples) as avg_cpu,
+                SUM(memory_sum) / SUM(samples) as avg_memory,
+                SUM(disk_sum) / SUM(samples) as avg_disk,
                 SUM(network_in) as total_net_in,
                 SUM(network_out) as total_net_out,
-                AVG(active_connections) as avg_connections
-            FROM server_metrics 
-            WHERE timestamp BETWEEN ? AND ?
-            GROUP BY period
-            ORDER BY period
+                CAST(SUM(connections_sum) AS REAL) / SUM(samples) as avg_connections,
+                MAX(cpu_max) as max_cpu,
+                MAX(cpu_p95) as p95_cpu,
+                MAX(memory_max) as max_memory,
+                MAX(memory_p95) as p95_memory,
+                MAX(connections_max) as max_connections
+            FROM {table} 
+            WHERE period BETWEEN strftime('{period_format}', ?) AND ? AND samples > 0
+            GROUP BY bucket
+            ORDER BY bucket
         """
         return await self.db.fetch_all(query, (start_date, end_date))
     
-    async def delete_old_metrics(self, days=30):
-        """Удаляет старые метрики"""
-        query = f"DELETE FROM server_metrics WHERE timestamp < datetime('now', '-{days} days')"
-        await self.db.execute(query)
+    async def delete_old_metrics(self, days=METRICS_RAW_RETENTION_DAYS, hourly_days=METRICS_HOURLY_RETENTION_DAYS):
+        """Удаляет старые исходные замеры и почасовые агрегаты (суточные агрегаты сохраняются)"""
+        # Процентили завершившихся периодов должны быть рассчитаны до удаления замеров
+        await self.finalize_rollups()
+        await self.db.execute(
+            "DELETE FROM server_metrics WHERE timestamp < ?", (int(time.time()) - days * 86400,)
+        )
+        await self.db.execute(
+            "DELETE FROM server_metrics_hourly WHERE period < datetime('now', 'localtime', ?)", (f'-{hourly_days} days',)
+        )
     
     async def get_critical_events(self, cpu_threshold=80, memory_threshold=80, disk_threshold=90):
-        """Получает события с превышением пороговых значений"""
+        """Получает события с превышением пороговых значений (Metric)"""
+        # По индексу idx_server_metrics_timestamp строки читаются от новых к старым до 50 совпадений
         query = f"""
-            SELECT * FROM server_metrics 
+            SELECT {Metric.columns(Metric.FIELDS)} 
+            FROM server_metrics 
             WHERE 
                 cpu_usage > {cpu_threshold} OR 
                 memory_usage > {memory_threshold} OR 
@@ -515,4 +944,177 @@ class ServerMetricsModel:
             ORDER BY timestamp DESC
             LIMIT 50
         """
+        return await self.db.fetch_all(query, row_class=Metric)
+
+class BroadcastModel:
+    def __init__(self, db=None):
+        self.db = db or Database()
+    
+    async def count_recipients(self):
+        """Подсчитывает пользователей с привязанным Telegram ID"""
+        result = await self.db.fetch_one("SELECT COUNT(DISTINCT user_id) FROM clients WHERE user_id IS NOT NULL")
+        return result[0] if result else 0
+    
+    async def create_broadcast(self, text, total, chat_id=None, message_id=None):
+        """Создает задание рассылки"""
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        query = """
+            INSERT INTO broadcasts (text, status, chat_id, message_id, total, created_at, updated_at) 
+            VALUES (?, 'running', ?, ?, ?, ?, ?)
+        """
+        cursor = await self.db.execute(query, (text, chat_id, message_id, total, now, now))
+        
+        return cursor.lastrowid
+    
+    async def get_broadcast(self, broadcast_id):
+        """Получает задание рассылки по ID"""
+        query = """
+            SELECT id, text, status, chat_id, message_id, last_client_id, total, sent, failed 
+            FROM broadcasts WHERE id = ?
+        """
+        return await self.db.fetch_one(query, (broadcast_id,))
+    
+    async def get_running_broadcasts(self):
+        """Получает незавершенные задания рассылки"""
+        query = """
+            SELECT id, text, status, chat_id, message_id, last_client_id, total, sent, failed 
+            FROM broadcasts WHERE status = 'running' ORDER BY id
+        """
         return await self.db.fetch_all(query)
+    
+    async def get_recipients(self, after_client_id, limit):
+        """
+        Получает следующую порцию получателей рассылки
+        
+        Returns:
+            Список (client_id, user_id) по возрастанию client_id
+        """
+        query = """
+            SELECT id, user_id FROM clients 
+            WHERE id > ? AND user_id IS NOT NULL 
+            ORDER BY id 
+            LIMIT ?
+        """
+        return await self.db.fetch_all(query, (after_client_id, limit))
+    
+    async def get_notified_users(self, last_client_id):
+        """Получает Telegram ID, уже обработанные рассылкой до указанного клиента"""
+        query = "SELECT DISTINCT user_id FROM clients WHERE id <= ? AND user_id IS NOT NULL"
+        return [row[0] for row in await self.db.fetch_all(query, (last_client_id,))]
+    
+    async def save_progress(self, broadcast_id, last_client_id, sent, failed):
+        """Сохраняет позицию и счетчики рассылки"""
+        query = """
+            UPDATE broadcasts 
+            SET last_client_id = ?, sent = ?, failed = ?, updated_at = ? 
+            WHERE id = ?
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        await self.db.execute(query, (last_client_id, sent, failed, now, broadcast_id))
+    
+    async def set_status(self, broadcast_id, status):
+        """Изменяет статус задания рассылки (running, completed, cancelled)"""
+        query = "UPDATE broadcasts SET status = ?, updated_at = ? WHERE id = ?"
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        await self.db.execute(query, (status, now, broadcast_id))
+
+class TelegramFileModel:
+    def __init__(self, db=None):
+        self.db = db or Database()
+    
+    async def get_file_id(self, client_id, kind, content_hash):
+        """
+        Получает file_id ранее загруженного файла
+        
+        Returns:
+            file_id или None, если файл не загружался или его содержимое изменилось
+        """
+        query = "SELECT file_id FROM telegram_files WHERE client_id = ? AND kind = ? AND content_hash = ?"
+        result = await self.db.fetch_one(query, (client_id, kind, content_hash))
+        return result[0] if result else None
+    
+    async def save_file_id(self, client_id, kind, content_hash, file_id):
+        """Сохраняет file_id загруженного файла (заменяет file_id старого содержимого)"""
+        query = """
+            INSERT OR REPLACE INTO telegram_files (client_id, kind, content_hash, file_id, created_at) 
+            VALUES (?, ?, ?, ?, ?)
+        """
+        created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        await self.db.execute(query, (client_id, kind, content_hash, file_id, created_at))
+    
+    async def delete_file_ids(self, client_id, kind=None):
+        """Удаляет сохраненные file_id клиента"""
+        if kind:
+            await self.db.execute("DELETE FROM telegram_files WHERE client_id = ? AND kind = ?", (client_id, kind))
+        else:
+            await self.db.execute("DELETE FROM telegram_files WHERE client_id = ?", (client_id,))
+
+class FSMStateModel:
+    def __init__(self, db=None):
+        self.db = db or Database()
+    
+    async def get_record(self, key, min_updated_at=0):
+        """
+        Получает состояние FSM по ключу
+        
+        Returns:
+            Кортеж (state, data_json, updated_at) или None, если записи нет или она устарела
+        """
+        query = "SELECT state, data, updated_at FROM fsm_states WHERE key = ? AND updated_at >= ?"
+        return await self.db.fetch_one(query, (key, min_updated_at))
+    
+    async def save_records(self, upserts=(), deletes=()):
+        """
+        Записывает накопленные изменения состояний FSM в одной транзакции
+        
+        Args:
+            upserts: Новые значения [(key, state, data_json, updated_at)]
+            deletes: Ключи пустых состояний [(key,)]
+        """
+        def write(conn):
+            try:
+                conn.executemany("""
+                    INSERT OR REPLACE INTO fsm_states (key, state, data, updated_at) 
+                    VALUES (?, ?, ?, ?)
+                """, upserts)
+                conn.executemany("DELETE FROM fsm_states WHERE key = ?", deletes)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        
+        await self.db.run(write)
+    
+    async def delete_expired(self, before):
+        """Удаляет состояния, не изменявшиеся с момента before (unix-метка)"""
+        cursor = await self.db.execute("DELETE FROM fsm_states WHERE updated_at < ?", (before,))
+        return cursor.rowcount
+
+class TunnelBenchmarkModel:
+    def __init__(self, db=None):
+        self.db = db or Database()
+    
+    async def save_result(self, result):
+        """
+        Сохраняет результат нагрузочного теста туннеля
+        
+        Args:
+            result: Словарь с полями BenchmarkResult.FIELDS
+        """
+        query = f"""
+            INSERT INTO tunnel_benchmarks ({BenchmarkResult.columns(BenchmarkResult.FIELDS)}) 
+            VALUES ({', '.join('?' * len(BenchmarkResult.FIELDS))})
+        """
+        cursor = await self.db.execute(query, tuple(result.get(name) for name in BenchmarkResult.FIELDS))
+        return cursor.lastrowid
+    
+    async def get_results(self, limit=20, mode=None):
+        """Получает последние результаты тестов туннеля (BenchmarkResult)"""
+        query = f"SELECT id, {BenchmarkResult.columns(BenchmarkResult.FIELDS)} FROM tunnel_benchmarks"
+        params = []
+        if mode:
+            query += " WHERE mode = ?"
+            params.append(mode)
+        query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit)
+        return await self.db.fetch_all(query, tuple(params), BenchmarkResult)
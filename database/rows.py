@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Объекты строк результатов запросов для VPN-бота
+Автор: RUCODER (https://рукодер.рф/vpn)
+"""
+
+from datetime import datetime
+
+class Row:
+    """
+    Строка результата запроса с доступом к полям по имени
+    
+    Поля перечисляются в __slots__ подкласса. Запрос может выбирать только
+    часть полей - остальные равны None.
+    """
+    
+    __slots__ = ()
+    
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+    
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+    
+    @classmethod
+    def columns(cls, fields):
+        """Список столбцов для SELECT (имена проверяются по __slots__)"""
+        unknown = [name for name in fields if name not in cls.__slots__]
+        if unknown:
+            raise ValueError(f"Неизвестные поля {cls.__name__}: {', '.join(unknown)}")
+        return ", ".join(fields)
+    
+    @classmethod
+    def factory(cls, description):
+        """
+        Создает row_factory для курсора с заданным описанием столбцов
+        
+        Соответствие столбцов полям вычисляется один раз на запрос, а не на строку.
+        """
+        names = [column[0] for column in description]
+        unknown = [name for name in names if name not in cls.__slots__]
+        if unknown:
+            raise ValueError(f"Неизвестные поля {cls.__name__}: {', '.join(unknown)}")
+        
+        missing = [name for name in cls.__slots__ if name not in names]
+        new = cls.__new__
+        
+        def build(cursor, values):
+            row = new(cls)
+            for name, value in zip(names, values):
+                setattr(row, name, value)
+            for name in missing:
+                setattr(row, name, None)
+            return row
+        
+        return build
+
+class Client(Row):
+    """Клиент VPN (таблица clients)"""
+    
+    __slots__ = (
+        "id", "name", "user_id", "email", "create_date", "expiry_date", "last_connection",
+        "is_active", "is_blocked", "allowed_ips", "public_key", "private_key", "data_limit", "data_used"
+    )
+    
+    # Наборы полей для типичных запросов (приватный ключ выбирается только явно)
+    LIST_FIELDS = ("id", "name", "user_id", "email", "create_date", "expiry_date", "is_active", "is_blocked")
+    PROFILE_FIELDS = (
+        "id", "name", "user_id", "email", "create_date", "expiry_date", "last_connection",
+        "is_active", "is_blocked", "allowed_ips", "public_key", "data_limit", "data_used"
+    )
+    
+    @property
+    def is_enabled(self):
+        """Клиент активен и не заблокирован"""
+        return bool(self.is_active and not self.is_blocked)
+
+class StatRecord(Row):
+    """Сессия подключения клиента (таблица stats, даты - unix-метки)"""
+    
+    __slots__ = (
+        "id", "client_id", "connection_date", "disconnection_date", "session_duration",
+        "ip_address", "bytes_received", "bytes_sent"
+    )
+
+class Metric(Row):
+    """Замер метрик сервера (таблица server_metrics)"""
+    
+    __slots__ = (
+        "id", "timestamp", "cpu_usage", "memory_usage", "disk_usage",
+        "network_in", "network_out", "active_connections"
+    )
+    
+    FIELDS = (
+        "timestamp", "cpu_usage", "memory_usage", "disk_usage",
+        "network_in", "network_out", "active_connections"
+    )
+    
+    @property
+    def time_text(self):
+        """Время замера в местном времени"""
+        return datetime.fromtimestamp(self.timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+class BenchmarkResult(Row):
+    """Результат нагрузочного теста туннеля (таблица tunnel_benchmarks)"""
+    
+    __slots__ = (
+        "id", "created_at", "mode", "mtu", "peers", "duration", "goodput_mbps", "pps",
+        "loss", "latency_avg_ms", "latency_p95_ms", "cpu_count"
+    )
+    
+    FIELDS = __slots__[1:]
+    
+    @property
+    def time_text(self):
+        """Время теста в местном времени"""
+        return datetime.fromtimestamp(self.created_at).strftime("%Y-%m-%d %H:%M:%S")
@@ -7,23 +7,30 @@
 """
 
 import os
+import io
+import csv
 import logging
 import asyncio
+import zipfile
 from datetime import datetime, timedelta
 from aiogram import Router, F
 from aiogram.filters import Command
-from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.types import Message, CallbackQuery, BufferedInputFile
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from config import ADMIN_IDS, CLIENTS_DIR, BOT_VERSION, COPYRIGHT, WG_CONFIG_PATH
+from config import ADMIN_IDS, CLIENTS_DIR, BOT_VERSION, WG_CONFIG_PATH
 from keyboards.admin_kb import (
     admin_main_kb, client_list_kb, client_manage_kb, admin_stats_kb,
     confirm_action_kb, monitoring_kb, broadcast_kb, back_to_admin_kb,
-    paginate_kb, generate_clients_kb
+    paginate_kb, generate_clients_kb, stats_clients_kb
 )
 from database.models import ClientModel, StatsModel, NotificationModel, ServerMetricsModel
-from utils.vpn_manager import VPNManager
+from utils.vpn_manager import AsyncVPNManager
+from utils.server_monitor import loop_lag_monitor
+from utils.update_workers import update_workers
+from utils.broadcaster import start_broadcast, cancel_broadcast
+from utils.telegram_files import send_client_config, send_client_qr
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -33,11 +40,28 @@ client_model = ClientModel()
 stats_model = StatsModel()
 notification_model = NotificationModel()
 metrics_model = ServerMetricsModel()
-vpn_manager = VPNManager()
+vpn_manager = AsyncVPNManager()
+
+# Количество клиентов на странице списка
+CLIENTS_PAGE_SIZE = 5
+# Количество клиентов на странице статистики
+STATS_CLIENTS_PAGE_SIZE = 15
+# Максимальный размер файла со списком клиентов (байты)
+BULK_ADD_MAX_FILE_SIZE = 1024 * 1024
+
+BULK_ADD_PROMPT = (
+    "📥 Массовое добавление клиентов\n\n"
+    "Отправьте список клиентов сообщением или файлом CSV/TXT, по одному клиенту в строке:\n"
+    "имя[,telegram_id[,email[,срок_дней]]]\n\n"
+    "Пример:\n"
+    "ivan_phone,123456789,ivan@example.com,30\n"
+    "office_router"
+)
 
 # Определение состояний для FSM
 class AdminStates(StatesGroup):
     add_client = State()
+    bulk_add_clients = State()
     edit_client = State()
     delete_client = State()
     block_client = State()
@@ -77,7 +101,7 @@ async def cb_list_clients(callback: CallbackQuery):
     
     await callback.answer()
     
-    clients = await client_model.get_all_clients()
+    clients, total = await client_model.get_clients_page(CLIENTS_PAGE_SIZE)
     
     if not clients:
         await callback.message.edit_text(
@@ -86,33 +110,24 @@ async def cb_list_clients(callback: CallbackQuery):
         )
         return
     
-    page = 1
-    total_pages = (len(clients) + 4) // 5  # 5 клиентов на странице
-    
-    await show_clients_page(callback.message, clients, page, total_pages)
+    await show_clients_page(callback.message, clients, 1, total)
 
-async def show_clients_page(message, clients, page, total_pages):
+async def show_clients_page(message, clients, page, total):
     """Показывает страницу со списком клиентов"""
-    start_idx = (page - 1) * 5
-    end_idx = min(start_idx + 5, len(clients))
-    
-    page_clients = clients[start_idx:end_idx]
+    total_pages = max(1, (total + CLIENTS_PAGE_SIZE - 1) // CLIENTS_PAGE_SIZE)
     
     text = f"📋 Список клиентов (страница {page}/{total_pages}):\n\n"
     
-    for client in page_clients:
-        # Формат: ID, имя, статус, дата создания, дата истечения
-        client_id, name, user_id, email, create_date, expiry_date, is_active, is_blocked, *_ = client
-        
-        status = "✅ Активен" if is_active and not is_blocked else "⛔ Заблокирован" if is_blocked else "❌ Неактивен"
-        expiry_info = f"до {expiry_date}" if expiry_date else "бессрочно"
+    for client in clients:
+        status = "✅ Активен" if client.is_enabled else "⛔ Заблокирован" if client.is_blocked else "❌ Неактивен"
+        expiry_info = f"до {client.expiry_date}" if client.expiry_date else "бессрочно"
         
-        text += f"🆔 {client_id} | 👤 {name} | {status}\n"
-        text += f"📅 Создан: {create_date} | ⏳ Действует: {expiry_info}\n"
-        if user_id:
-            text += f"🔗 Telegram ID: {user_id}\n"
-        if email:
-            text += f"📧 Email: {email}\n"
+        text += f"🆔 {client.id} | 👤 {client.name} | {status}\n"
+        text += f"📅 Создан: {client.create_date} | ⏳ Действует: {expiry_info}\n"
+        if client.user_id:
+            text += f"🔗 Telegram ID: {client.user_id}\n"
+        if client.email:
+            text += f"📧 Email: {client.email}\n"
         text += "\n"
     
     await message.edit_text(
@@ -130,8 +145,22 @@ async def cb_client_page(callback: CallbackQuery):
     
     await callback.answer()
     
-    page = int(callback.data.split("_")[-1])
-    clients = await client_model.get_all_clients()
+    # Формат: client_page_{n|p}_{страница}_{ID крайнего клиента текущей страницы}
+    parts = callback.data.split("_")
+    clients, total = [], 0
+    page = 1
+    
+    if len(parts) == 5:
+        direction, page, anchor_id = parts[2], int(parts[3]), int(parts[4])
+        if direction == "n":
+            clients, total = await client_model.get_clients_page(CLIENTS_PAGE_SIZE, after_id=anchor_id)
+        else:
+            clients, total = await client_model.get_clients_page(CLIENTS_PAGE_SIZE, before_id=anchor_id)
+    
+    # Страница опустела (клиенты удалены) или кнопка старого формата - возвращаемся к началу
+    if not clients:
+        page = 1
+        clients, total = await client_model.get_clients_page(CLIENTS_PAGE_SIZE)
     
     if not clients:
         await callback.message.edit_text(
@@ -140,9 +169,7 @@ async def cb_client_page(callback: CallbackQuery):
         )
         return
     
-    total_pages = (len(clients) + 4) // 5  # 5 клиентов на странице
-    
-    await show_clients_page(callback.message, clients, page, total_pages)
+    await show_clients_page(callback.message, clients, page, total)
 
 @router.callback_query(F.data.startswith("manage_client_"))
 async def cb_manage_client(callback: CallbackQuery):
@@ -164,35 +191,33 @@ async def cb_manage_client(callback: CallbackQuery):
         )
         return
     
-    client_id, name, user_id, email, create_date, expiry_date, last_connection, is_active, is_blocked, allowed_ips, public_key, private_key, data_limit, data_used = client
-    
-    status = "✅ Активен" if is_active and not is_blocked else "⛔ Заблокирован" if is_blocked else "❌ Неактивен"
-    expiry_info = f"до {expiry_date}" if expiry_date else "бессрочно"
-    connection_info = f"{last_connection}" if last_connection else "никогда"
+    status = "✅ Активен" if client.is_enabled else "⛔ Заблокирован" if client.is_blocked else "❌ Неактивен"
+    expiry_info = f"до {client.expiry_date}" if client.expiry_date else "бессрочно"
+    connection_info = f"{client.last_connection}" if client.last_connection else "никогда"
     
-    data_limit_str = f"{data_limit/(1024*1024*1024):.2f} ГБ" if data_limit else "неограничено"
-    data_used_str = f"{data_used/(1024*1024*1024):.2f} ГБ" if data_used else "0 ГБ"
+    data_limit_str = f"{client.data_limit/(1024*1024*1024):.2f} ГБ" if client.data_limit else "неограничено"
+    data_used_str = f"{client.data_used/(1024*1024*1024):.2f} ГБ" if client.data_used else "0 ГБ"
     
     text = f"📝 Управление клиентом:\n\n"
-    text += f"🆔 ID: {client_id}\n"
-    text += f"👤 Имя: {name}\n"
+    text += f"🆔 ID: {client.id}\n"
+    text += f"👤 Имя: {client.name}\n"
     text += f"📱 Статус: {status}\n"
-    text += f"📅 Создан: {create_date}\n"
+    text += f"📅 Создан: {client.create_date}\n"
     text += f"⏳ Действует: {expiry_info}\n"
     text += f"🔄 Последнее подключение: {connection_info}\n"
     text += f"📊 Лимит трафика: {data_limit_str}\n"
     text += f"📈 Использовано: {data_used_str}\n"
     
-    if user_id:
-        text += f"🔗 Telegram ID: {user_id}\n"
-    if email:
-        text += f"📧 Email: {email}\n"
-    if allowed_ips:
-        text += f"🌐 Разрешённые IP: {allowed_ips}\n"
+    if client.user_id:
+        text += f"🔗 Telegram ID: {client.user_id}\n"
+    if client.email:
+        text += f"📧 Email: {client.email}\n"
+    if client.allowed_ips:
+        text += f"🌐 Разрешённые IP: {client.allowed_ips}\n"
     
     await callback.message.edit_text(
         text,
-        reply_markup=client_manage_kb(client_id, is_active, is_blocked)
+        reply_markup=client_manage_kb(client.id, client.is_active, client.is_blocked)
     )
 
 @router.callback_query(F.data.startswith("toggle_client_"))
@@ -210,7 +235,7 @@ async def cb_toggle_client(callback: CallbackQuery):
     action = parts[2]
     client_id = int(parts[3])
     
-    client = await client_model.get_client_by_id(client_id)
+    client = await client_model.get_client_by_id(client_id, fields=("id", "name"))
     
     if not client:
         await callback.message.edit_text(
@@ -222,25 +247,25 @@ async def cb_toggle_client(callback: CallbackQuery):
     if action == "activate":
         await client_model.update_client(client_id, is_active=1)
         await callback.message.edit_text(
-            f"✅ Клиент {client[1]} активирован",
+            f"✅ Клиент {client.name} активирован",
             reply_markup=back_to_admin_kb()
         )
     elif action == "deactivate":
         await client_model.update_client(client_id, is_active=0)
         await callback.message.edit_text(
-            f"❌ Клиент {client[1]} деактивирован",
+            f"❌ Клиент {client.name} деактивирован",
             reply_markup=back_to_admin_kb()
         )
     elif action == "block":
         await client_model.update_client(client_id, is_blocked=1)
         await callback.message.edit_text(
-            f"⛔ Клиент {client[1]} заблокирован",
+            f"⛔ Клиент {client.name} заблокирован",
             reply_markup=back_to_admin_kb()
         )
     elif action == "unblock":
         await client_model.update_client(client_id, is_blocked=0)
         await callback.message.edit_text(
-            f"✅ Блокировка снята с клиента {client[1]}",
+            f"✅ Блокировка снята с клиента {client.name}",
             reply_markup=back_to_admin_kb()
         )
 
@@ -255,7 +280,7 @@ async def cb_delete_client_confirm(callback: CallbackQuery):
     await callback.answer()
     
     client_id = int(callback.data.split("_")[-1])
-    client = await client_model.get_client_by_id(client_id)
+    client = await client_model.get_client_by_id(client_id, fields=("id", "name"))
     
     if not client:
         await callback.message.edit_text(
@@ -265,7 +290,7 @@ async def cb_delete_client_confirm(callback: CallbackQuery):
         return
     
     await callback.message.edit_text(
-        f"⚠️ Вы действительно хотите удалить клиента {client[1]}?\n\n"
+        f"⚠️ Вы действительно хотите удалить клиента {client.name}?\n\n"
         f"Это действие нельзя отменить!",
         reply_markup=confirm_action_kb(f"confirm_delete_{client_id}")
     )
@@ -281,7 +306,7 @@ async def cb_delete_client(callback: CallbackQuery):
     await callback.answer()
     
     client_id = int(callback.data.split("_")[-1])
-    client = await client_model.get_client_by_id(client_id)
+    client = await client_model.get_client_by_id(client_id, fields=("id", "name", "public_key"))
     
     if not client:
         await callback.message.edit_text(
@@ -291,21 +316,172 @@ async def cb_delete_client(callback: CallbackQuery):
         return
     
     # Удаляем клиента из WireGuard
-    success = vpn_manager.delete_client(client[1], client[10])  # name, public_key
+    success = await vpn_manager.delete_client(client.name, client.public_key)
     
     if success:
         # Удаляем клиента из базы данных
         await client_model.delete_client(client_id)
         await callback.message.edit_text(
-            f"✅ Клиент {client[1]} успешно удален",
+            f"✅ Клиент {client.name} успешно удален",
             reply_markup=back_to_admin_kb()
         )
     else:
         await callback.message.edit_text(
-            f"❌ Ошибка при удалении клиента {client[1]} из WireGuard",
+            f"❌ Ошибка при удалении клиента {client.name} из WireGuard",
             reply_markup=back_to_admin_kb()
         )
 
+def parse_bulk_clients(text):
+    """
+    Разбирает список клиентов для массового добавления
+    
+    Формат строки: имя[,telegram_id[,email[,срок_дней]]]
+    (разделитель - запятая или точка с запятой, строка заголовка пропускается)
+    
+    Returns:
+        Кортеж (клиенты, ошибки), где клиент - (name, user_id, email, expiry_days)
+    """
+    clients = []
+    errors = []
+    seen = set()
+    
+    for line_no, row in enumerate(csv.reader(io.StringIO(text.replace(';', ','))), 1):
+        row = [cell.strip() for cell in row]
+        if not row or not row[0]:
+            continue
+        
+        name = row[0]
+        if line_no == 1 and name.lower() in ("name", "имя"):
+            continue
+        
+        if not name.replace("_", "").isalnum():
+            errors.append(f"строка {line_no}: недопустимое имя {name}")
+            continue
+        if name in seen:
+            errors.append(f"строка {line_no}: имя {name} повторяется")
+            continue
+        
+        try:
+            user_id = int(row[1]) if len(row) > 1 and row[1] else None
+            expiry_days = int(row[3]) if len(row) > 3 and row[3] else 30
+        except ValueError:
+            errors.append(f"строка {line_no}: Telegram ID и срок должны быть числами")
+            continue
+        email = row[2] if len(row) > 2 and row[2] else None
+        
+        seen.add(name)
+        clients.append((name, user_id, email, expiry_days))
+    
+    return clients, errors
+
+def build_configs_archive(clients):
+    """Упаковывает конфигурации клиентов в ZIP-архив (в памяти)"""
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for client in clients:
+            zf.write(client["config_path"], f"{client['name']}.conf")
+    return archive.getvalue()
+
+@router.message(Command("bulkadd"))
+async def cmd_bulk_add(message: Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔ Доступ запрещен. Вы не являетесь администратором.")
+        return
+    
+    await state.set_state(AdminStates.bulk_add_clients)
+    await message.answer(BULK_ADD_PROMPT, reply_markup=back_to_admin_kb())
+
+@router.callback_query(F.data == "admin_bulk_add")
+async def cb_bulk_add(callback: CallbackQuery, state: FSMContext):
+    user_id = callback.from_user.id
+    
+    if not is_admin(user_id):
+        await callback.answer("⛔ Доступ запрещен", show_alert=True)
+        return
+    
+    await callback.answer()
+    await state.set_state(AdminStates.bulk_add_clients)
+    
+    await callback.message.edit_text(BULK_ADD_PROMPT, reply_markup=back_to_admin_kb())
+
+@router.message(AdminStates.bulk_add_clients)
+async def process_bulk_add(message: Message, state: FSMContext):
+    user_id = message.from_user.id
+    
+    if not is_admin(user_id):
+        await message.answer("⛔ Доступ запрещен")
+        await state.clear()
+        return
+    
+    # Список принимается текстом или файлом CSV/TXT
+    if message.document:
+        if message.document.file_size and message.document.file_size > BULK_ADD_MAX_FILE_SIZE:
+            await message.answer("⚠️ Файл слишком большой (максимум 1 МБ)", reply_markup=back_to_admin_kb())
+            return
+        data = await message.bot.download(message.document)
+        text = data.read().decode('utf-8-sig', errors='replace')
+    else:
+        text = message.text or ""
+    
+    clients, errors = parse_bulk_clients(text)
+    
+    # Имена, которые уже заняты, пропускаются
+    existing = await client_model.get_existing_names(name for name, *_ in clients)
+    errors.extend(f"имя {name} уже существует" for name, *_ in clients if name in existing)
+    clients = [client for client in clients if client[0] not in existing]
+    
+    if not clients:
+        await message.answer(
+            "⚠️ В списке нет клиентов, которых можно добавить.\n\n" + "\n".join(errors[:10]),
+            reply_markup=back_to_admin_kb()
+        )
+        return
+    
+    status_message = await message.answer(f"⏳ Создание {len(clients)} клиентов... Пожалуйста, подождите")
+    loop = asyncio.get_running_loop()
+    
+    # Ключи, адреса и файлы конфигураций создаются вне цикла событий
+    prepared = await vpn_manager.prepare_clients_bulk([client[0] for client in clients])
+    
+    if not prepared:
+        await status_message.edit_text("❌ Ошибка при создании конфигураций VPN", reply_markup=admin_main_kb())
+        await state.clear()
+        return
+    
+    # Все клиенты сохраняются в базу данных одной транзакцией
+    try:
+        await client_model.create_clients_bulk([
+            (name, client_user_id, email, expiry_days, vpn_client["public_key"], vpn_client["private_key"])
+            for (name, client_user_id, email, expiry_days), vpn_client in zip(clients, prepared)
+        ])
+    except Exception:
+        await loop.run_in_executor(None, vpn_manager.discard_clients_bulk, prepared)
+        await status_message.edit_text("❌ Ошибка при сохранении клиентов в базу данных", reply_markup=admin_main_kb())
+        await state.clear()
+        return
+    
+    # Все пиры добавляются на сервер одним вызовом
+    applied = await vpn_manager.apply_clients_bulk(prepared)
+    
+    text = f"✅ Создано клиентов: {len(prepared)}\n"
+    if not applied:
+        text += "⚠️ Не удалось применить пиров к WireGuard, проверьте статус сервера\n"
+    if errors:
+        text += f"\n⚠️ Пропущено: {len(errors)}\n" + "\n".join(errors[:10])
+        if len(errors) > 10:
+            text += f"\n... и еще {len(errors) - 10}"
+    
+    await status_message.edit_text(text)
+    
+    archive = await loop.run_in_executor(None, build_configs_archive, prepared)
+    await message.answer_document(
+        BufferedInputFile(archive, filename=f"clients_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"),
+        caption="📦 Конфигурации созданных клиентов",
+        reply_markup=admin_main_kb()
+    )
+    
+    await state.clear()
+
 @router.callback_query(F.data == "admin_add_client")
 async def cb_add_client(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
@@ -343,7 +519,7 @@ async def process_client_name(message: Message, state: FSMContext):
         return
     
     # Проверка существования клиента с таким именем
-    existing_client = await client_model.get_client_by_name(client_name)
+    existing_client = await client_model.get_client_by_name(client_name, fields=("id",))
     if existing_client:
         await message.answer(
             f"⚠️ Ошибка: Клиент с именем {client_name} уже существует.\n\n"
@@ -356,7 +532,7 @@ async def process_client_name(message: Message, state: FSMContext):
     await message.answer("⏳ Создание конфигурации VPN... Пожалуйста, подождите")
     
     # Генерируем конфигурацию VPN
-    client_data = vpn_manager.create_client(client_name)
+    client_data = await vpn_manager.create_client(client_name)
     
     if not client_data:
         await message.answer(
@@ -385,24 +561,25 @@ async def process_client_name(message: Message, state: FSMContext):
     config_path = os.path.join(CLIENTS_DIR, client_name, f"{client_name}.conf")
     
     if os.path.exists(config_path):
-        await message.answer_document(
-            FSInputFile(config_path),
+        client_id = client.id
+        
+        await send_client_config(
+            message.bot,
+            message.chat.id,
+            client_id,
+            config_path,
             caption=f"✅ Клиент {client_name} успешно создан!\n\n"
                     f"📱 Используйте этот файл конфигурации для настройки WireGuard на устройстве."
         )
         
         # Генерируем и отправляем QR-код
-        from utils.qr_generator import generate_qr_from_config
-        qr_path = await generate_qr_from_config(config_path)
-        
-        if qr_path:
-            await message.answer_photo(
-                FSInputFile(qr_path),
-                caption="🔄 Отсканируйте этот QR-код в приложении WireGuard для быстрой настройки."
-            )
-            
-            # Удаляем временный файл QR-кода
-            os.remove(qr_path)
+        await send_client_qr(
+            message.bot,
+            message.chat.id,
+            client_id,
+            config_path,
+            caption="🔄 Отсканируйте этот QR-код в приложении WireGuard для быстрой настройки."
+        )
     else:
         await message.answer(
             f"⚠️ Конфигурационный файл создан, но не найден по пути {config_path}",
@@ -431,15 +608,16 @@ async def cb_admin_statistics(callback: CallbackQuery):
     # Получаем последние метрики сервера
     server_metrics = await metrics_model.get_latest_metrics(1)
     
-    # Получаем список активных клиентов
-    active_clients = await client_model.get_active_clients()
+    # Количество клиентов
+    total_clients = await client_model.count_clients()
+    active_clients = await client_model.count_clients(active_only=True)
     
     # Формируем текст сообщения
     text = f"📊 Статистика RuCoder VPN\n\n"
     
     # Статистика клиентов
-    text += f"👥 Всего клиентов: {len(await client_model.get_all_clients())}\n"
-    text += f"✅ Активных клиентов: {len(active_clients)}\n"
+    text += f"👥 Всего клиентов: {total_clients}\n"
+    text += f"✅ Активных клиентов: {active_clients}\n"
     text += f"🔄 Всего подключений: {stats['connections_count']}\n"
     text += f"⚡ Активных сессий: {stats['active_sessions']}\n\n"
     
@@ -454,7 +632,9 @@ async def cb_admin_statistics(callback: CallbackQuery):
     # Статистика сервера
     if server_metrics:
         metrics = server_metrics[0]
-        timestamp, cpu, memory, disk, net_in, net_out, connections = metrics
+        timestamp = metrics.time_text
+        cpu, memory, disk = metrics.cpu_usage, metrics.memory_usage, metrics.disk_usage
+        net_in, net_out, connections = metrics.network_in, metrics.network_out, metrics.active_connections
         
         text += f"💻 Сервер (последнее обновление: {timestamp}):\n"
         text += f"  CPU: {cpu:.1f}%\n"
@@ -486,43 +666,38 @@ async def cb_stats_detail(callback: CallbackQuery):
     stats_type = callback.data.split("_")[1]
     
     if stats_type == "clients":
-        # Список активных клиентов и их использование
-        active_clients = await client_model.get_active_clients()
+        # Формат: stats_clients[_{сортировка}_{страница}]
+        parts = callback.data.split("_")
+        sort = parts[2] if len(parts) > 2 and parts[2] in ("recent", "traffic") else "recent"
+        page = int(parts[3]) if len(parts) > 3 and parts[3].isdigit() else 1
+        
+        # Активные клиенты страницы вместе с суммарным трафиком (один запрос)
+        clients, total = await stats_model.get_clients_usage_page(page, STATS_CLIENTS_PAGE_SIZE, sort)
         
-        if not active_clients:
+        if not clients:
             await callback.message.edit_text(
                 "📋 Нет активных клиентов",
                 reply_markup=back_to_admin_kb()
             )
             return
         
-        text = "👥 Статистика клиентов:\n\n"
+        total_pages = max(1, (total + STATS_CLIENTS_PAGE_SIZE - 1) // STATS_CLIENTS_PAGE_SIZE)
         
-        for client in active_clients[:15]:  # Показываем только первые 15 клиентов
-            # Распаковываем только нужные элементы из client
-            client_parts = list(client)
-            client_id = client_parts[0]
-            name = client_parts[1]
-            last_connection = client_parts[-5]
-            is_active = client_parts[-4]
-            is_blocked = client_parts[-3]
-            data_used = client_parts[-1]
-            
-            # Получаем общее использование трафика
-            client_stats = await stats_model.get_client_usage_total(client_id)
-            total_received, total_sent = client_stats
-            
-            # Переводим байты в мегабайты или гигабайты
-            def format_bytes(bytes_count):
-                if bytes_count is None:
-                    return "0 Б"
-                if bytes_count < 1024 * 1024:
-                    return f"{bytes_count / 1024:.2f} КБ"
-                elif bytes_count < 1024 * 1024 * 1024:
-                    return f"{bytes_count / (1024 * 1024):.2f} МБ"
-                else:
-                    return f"{bytes_count / (1024 * 1024 * 1024):.2f} ГБ"
-            
+        # Переводим байты в мегабайты или гигабайты
+        def format_bytes(bytes_count):
+            if bytes_count is None:
+                return "0 Б"
+            if bytes_count < 1024 * 1024:
+                return f"{bytes_count / 1024:.2f} КБ"
+            elif bytes_count < 1024 * 1024 * 1024:
+                return f"{bytes_count / (1024 * 1024):.2f} МБ"
+            else:
+                return f"{bytes_count / (1024 * 1024 * 1024):.2f} ГБ"
+        
+        sort_title = "по трафику" if sort == "traffic" else "новые первыми"
+        text = f"👥 Статистика клиентов ({sort_title}):\n\n"
+        
+        for client_id, name, last_connection, total_received, total_sent in clients:
             text += f"👤 {name}\n"
             text += f"  📅 Последнее подключение: {last_connection or 'никогда'}\n"
             text += f"  📥 Получено: {format_bytes(total_received)}\n"
@@ -531,7 +706,7 @@ async def cb_stats_detail(callback: CallbackQuery):
         
         await callback.message.edit_text(
             text,
-            reply_markup=back_to_admin_kb()
+            reply_markup=stats_clients_kb(sort, page, total_pages)
         )
     
     elif stats_type == "server":
@@ -555,11 +730,12 @@ async def cb_stats_detail(callback: CallbackQuery):
         text = "💻 Статистика сервера за 24 часа:\n\n"
         
         for i, stat in enumerate(server_stats[-12:]):  # Показываем последние 12 записей
-            period, cpu, memory, disk, net_in, net_out, connections = stat
+            period, cpu, memory, disk, net_in, net_out, connections, cpu_max, cpu_p95, memory_max, *_ = stat
             
             text += f"⏰ {period}:\n"
-            text += f"  CPU: {cpu:.1f}%\n"
-            text += f"  RAM: {memory:.1f}%\n"
+            text += f"  CPU: {cpu:.1f}% (макс. {cpu_max:.1f}%"
+            text += f", p95 {cpu_p95:.1f}%)\n" if cpu_p95 is not None else ")\n"
+            text += f"  RAM: {memory:.1f}% (макс. {memory_max:.1f}%)\n"
             text += f"  Диск: {disk:.1f}%\n"
             
             # Переводим байты в удобные единицы измерения
@@ -614,10 +790,10 @@ async def cb_admin_monitoring(callback: CallbackQuery):
     await callback.answer()
     
     # Получаем статус WireGuard
-    wg_status = vpn_manager.check_wireguard_status()
+    wg_status = await vpn_manager.check_wireguard_status()
     
     # Получаем активные подключения
-    active_connections = vpn_manager.get_active_connections()
+    active_connections = await vpn_manager.get_active_connections()
     
     # Получаем последние метрики сервера
     server_metrics = await metrics_model.get_latest_metrics(1)
@@ -629,12 +805,24 @@ async def cb_admin_monitoring(callback: CallbackQuery):
     text = f"🖥️ Мониторинг сервера\n\n"
     
     # Статус WireGuard
-    text += f"✅ WireGuard: {'активен' if wg_status['is_active'] else '❌ не активен'}\n\n"
+    text += f"✅ WireGuard: {'активен' if wg_status['is_active'] else '❌ не активен'}\n"
+    
+    # Задержка цикла событий бота
+    lag = loop_lag_monitor.get_stats()
+    text += f"⏱ Задержка обработки: {lag['loop_lag_ms']:.0f} мс (макс. {lag['loop_lag_max_ms']:.0f} мс)\n"
+    
+    # Очередь обновлений пула воркеров
+    if update_workers.enabled:
+        queue = update_workers.get_stats()
+        text += f"📥 Очередь обновлений: {queue['queue_depth']} (макс. {queue['queue_depth_max']})\n"
+    text += "\n"
     
     # Информация о сервере
     if server_metrics:
         metrics = server_metrics[0]
-        timestamp, cpu, memory, disk, net_in, net_out, connections = metrics
+        timestamp = metrics.time_text
+        cpu, memory, disk = metrics.cpu_usage, metrics.memory_usage, metrics.disk_usage
+        net_in, net_out, connections = metrics.network_in, metrics.network_out, metrics.active_connections
         
         text += f"💻 Сервер (последнее обновление: {timestamp}):\n"
         text += f"  CPU: {cpu:.1f}%\n"
@@ -668,15 +856,13 @@ async def cb_admin_monitoring(callback: CallbackQuery):
     if critical_events:
         text += f"⚠️ Критические события ({len(critical_events)}):\n\n"
         for i, event in enumerate(critical_events[:3]):  # Показываем только первые 3 события
-            timestamp, cpu, memory, disk, *_ = event
-            
-            text += f"  {i+1}. {timestamp}:\n"
-            if cpu > 80:
-                text += f"     CPU: {cpu:.1f}% ⚠️\n"
-            if memory > 80:
-                text += f"     RAM: {memory:.1f}% ⚠️\n"
-            if disk > 90:
-                text += f"     Диск: {disk:.1f}% ⚠️\n"
+            text += f"  {i+1}. {event.time_text}:\n"
+            if event.cpu_usage > 80:
+                text += f"     CPU: {event.cpu_usage:.1f}% ⚠️\n"
+            if event.memory_usage > 80:
+                text += f"     RAM: {event.memory_usage:.1f}% ⚠️\n"
+            if event.disk_usage > 90:
+                text += f"     Диск: {event.disk_usage:.1f}% ⚠️\n"
             text += "\n"
     
     await callback.message.edit_text(
@@ -694,7 +880,7 @@ async def cb_restart_wireguard(callback: CallbackQuery):
     
     await callback.answer("Перезапуск WireGuard...")
     
-    success = vpn_manager.restart_wireguard()
+    success = await vpn_manager.restart_wireguard()
     
     if success:
         await callback.message.edit_text(
@@ -768,51 +954,36 @@ async def cb_send_broadcast(callback: CallbackQuery, state: FSMContext):
         await state.clear()
         return
     
-    # Получаем всех клиентов с Telegram ID
-    clients = await client_model.get_all_clients()
-    telegram_users = [client for client in clients if client[2]]  # user_id - индекс 2
+    # Рассылка выполняется в фоне, ход отображается в этом сообщении
+    broadcast_id = await start_broadcast(
+        callback.bot,
+        broadcast_text,
+        chat_id=callback.message.chat.id,
+        message_id=callback.message.message_id
+    )
     
-    if not telegram_users:
+    if not broadcast_id:
         await callback.message.edit_text(
             "❌ Нет пользователей с привязанными Telegram аккаунтами",
             reply_markup=back_to_admin_kb()
         )
-        await state.clear()
-        return
     
-    # Отправляем сообщение пользователям
-    sent_count = 0
-    failed_count = 0
-    
-    await callback.message.edit_text(
-        f"⏳ Отправка сообщений {len(telegram_users)} пользователям..."
-    )
-    
-    bot = callback.bot
+    await state.clear()
+
+@router.callback_query(F.data.startswith("cancel_broadcast_"))
+async def cb_cancel_broadcast(callback: CallbackQuery):
+    user_id = callback.from_user.id
     
-    for client in telegram_users:
-        try:
-            await bot.send_message(
-                client[2],  # user_id
-                f"📣 Сообщение от администратора RuCoder VPN:\n\n{broadcast_text}\n\n{COPYRIGHT}"
-            )
-            sent_count += 1
-        except Exception as e:
-            logger.error(f"Ошибка при отправке сообщения пользователю {client[2]}: {e}")
-            failed_count += 1
-        
-        # Небольшая задержка, чтобы избежать ограничений API
-        await asyncio.sleep(0.1)
+    if not is_admin(user_id):
+        await callback.answer("⛔ Доступ запрещен", show_alert=True)
+        return
     
-    await callback.message.edit_text(
-        f"✅ Рассылка завершена\n\n"
-        f"📊 Результаты:\n"
-        f"  ✓ Успешно отправлено: {sent_count}\n"
-        f"  ✗ Ошибок отправки: {failed_count}\n",
-        reply_markup=back_to_admin_kb()
-    )
+    broadcast_id = int(callback.data.split("_")[-1])
     
-    await state.clear()
+    if cancel_broadcast(broadcast_id):
+        await callback.answer("⏹ Рассылка будет остановлена после текущей порции")
+    else:
+        await callback.answer("Рассылка уже завершена", show_alert=True)
 
 @router.callback_query(F.data == "admin_back")
 async def cb_admin_back(callback: CallbackQuery, state: FSMContext):
@@ -846,7 +1017,7 @@ async def cb_system_status(callback: CallbackQuery):
     wg_config_exists = os.path.exists(WG_CONFIG_PATH)
     
     # Проверка статуса службы WireGuard
-    wg_service_status = vpn_manager.check_wireguard_status()
+    wg_service_status = await vpn_manager.check_wireguard_status()
     
     # Формируем текст сообщения
     text = "🖥️ Статус системы\n\n"
@@ -867,8 +1038,8 @@ async def cb_system_status(callback: CallbackQuery):
     total_disk_space = disk_usage.f_blocks * disk_usage.f_frsize / (1024 * 1024 * 1024)
     
     # Клиенты
-    total_clients = len(await client_model.get_all_clients())
-    active_clients = len(await client_model.get_active_clients())
+    total_clients = await client_model.count_clients()
+    active_clients = await client_model.count_clients(active_only=True)
     
     text += "\n📊 Статистика:\n"
     text += f"  • Всего клиентов: {total_clients}\n"
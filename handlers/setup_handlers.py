@@ -7,9 +7,9 @@
 """
 
 import os
+import shutil
 import logging
 import asyncio
-import subprocess
 from datetime import datetime, timedelta
 from aiogram import Router, F
 from aiogram.filters import Command
@@ -19,18 +19,20 @@ from aiogram.fsm.state import State, StatesGroup
 
 from config import (
     ADMIN_IDS, BOT_VERSION, COPYRIGHT, SUPPORT_CONTACT,
-    WG_CONFIG_PATH, WG_SERVER_PRIVKEY_PATH, WG_SERVER_PUBKEY_PATH
+    WG_CONFIG_PATH, WG_SERVER_PRIVKEY_PATH, WG_SERVER_PUBKEY_PATH,
+    WG_INTERFACE, WG_RESTART_TIMEOUT
 )
 from keyboards.setup_kb import setup_main_kb, setup_confirm_kb, back_to_setup_kb
 from database.models import SettingsModel
-from utils.vpn_manager import VPNManager
+from utils.vpn_manager import AsyncVPNManager, run_command, invalidate_status, server_config
+from utils.wg_keys import generate_keypair
 
 logger = logging.getLogger(__name__)
 router = Router()
 
 # Создаем экземпляры моделей
 settings_model = SettingsModel()
-vpn_manager = VPNManager()
+vpn_manager = AsyncVPNManager()
 
 # Определение состояний для FSM
 class SetupStates(StatesGroup):
@@ -72,10 +74,7 @@ async def cb_check_wireguard(callback: CallbackQuery):
     await callback.answer("Проверка WireGuard...")
     
     # Проверяем установлен ли WireGuard
-    try:
-        wg_installed = subprocess.run(['which', 'wg'], stdout=subprocess.PIPE).returncode == 0
-    except Exception:
-        wg_installed = False
+    wg_installed = shutil.which('wg') is not None
     
     # Проверяем существование конфигурационных файлов
     config_exists = os.path.exists(WG_CONFIG_PATH)
@@ -83,7 +82,7 @@ async def cb_check_wireguard(callback: CallbackQuery):
     pubkey_exists = os.path.exists(WG_SERVER_PUBKEY_PATH)
     
     # Проверяем статус службы
-    wg_service_status = vpn_manager.check_wireguard_status()
+    wg_service_status = await vpn_manager.check_wireguard_status()
     
     # Формируем текст сообщения
     text = "🔍 Результаты проверки WireGuard:\n\n"
@@ -138,13 +137,13 @@ async def cb_confirm_restart_wireguard(callback: CallbackQuery):
     await callback.message.edit_text("⏳ Перезапуск WireGuard...")
     
     # Выполняем перезапуск
-    success = vpn_manager.restart_wireguard()
+    success = await vpn_manager.restart_wireguard()
     
     # Ждем немного, чтобы служба успела запуститься
     await asyncio.sleep(3)
     
     # Проверяем статус после перезапуска
-    status = vpn_manager.check_wireguard_status()
+    status = await vpn_manager.check_wireguard_status(fresh=True)
     
     if success and status['is_active']:
         await callback.message.edit_text(
@@ -180,71 +179,87 @@ async def cb_reinstall_wireguard(callback: CallbackQuery, state: FSMContext):
         reply_markup=setup_confirm_kb("confirm_reinstall_wireguard")
     )
 
-@router.callback_query(F.data == "confirm_reinstall_wireguard")
-async def cb_confirm_reinstall_wireguard(callback: CallbackQuery, state: FSMContext):
-    user_id = callback.from_user.id
-    
-    if not is_admin(user_id):
-        await callback.answer("⛔ Доступ запрещен", show_alert=True)
-        return
-    
-    await callback.answer()
-    await state.clear()
-    
-    await callback.message.edit_text("⏳ Переустановка WireGuard... Это может занять некоторое время")
+# Файл настроек ядра для пересылки пакетов клиентов
+SYSCTL_CONFIG_PATH = '/etc/sysctl.d/99-wireguard.conf'
+
+def write_new_server_config():
+    """
+    Создает новые ключи и конфигурацию сервера (синхронно, вызывается в пуле потоков)
     
-    try:
-        # Останавливаем службу WireGuard
-        subprocess.run(['systemctl', 'stop', 'wg-quick@wg0'], check=True)
-        
+    Старая конфигурация сохраняется в резервную копию, адреса старых клиентов освобождаются.
+    """
+    with server_config.lock:
         # Сохраняем копию старой конфигурации
         backup_time = datetime.now().strftime("%Y%m%d%H%M%S")
         if os.path.exists(WG_CONFIG_PATH):
             os.rename(WG_CONFIG_PATH, f"{WG_CONFIG_PATH}.backup-{backup_time}")
         
-        # Генерируем новые ключи
-        subprocess.run(
-            ['wg', 'genkey'], 
-            stdout=open(WG_SERVER_PRIVKEY_PATH, 'w'),
-            check=True
-        )
+        # Генерируем новые ключи (приватный ключ доступен только владельцу)
+        server_private_key, server_public_key = generate_keypair()
         
-        subprocess.run(
-            ['wg', 'pubkey'], 
-            stdin=open(WG_SERVER_PRIVKEY_PATH, 'r'),
-            stdout=open(WG_SERVER_PUBKEY_PATH, 'w'),
-            check=True
-        )
+        with os.fdopen(os.open(WG_SERVER_PRIVKEY_PATH, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+            f.write(f"{server_private_key}\n")
         
-        # Создаем новую конфигурацию
-        with open(WG_SERVER_PRIVKEY_PATH, 'r') as f:
-            server_private_key = f.read().strip()
+        with open(WG_SERVER_PUBKEY_PATH, 'w') as f:
+            f.write(f"{server_public_key}\n")
         
+        # Создаем новую конфигурацию
         with open(WG_CONFIG_PATH, 'w') as f:
             f.write(f'''[Interface]
 PrivateKey = {server_private_key}
-Address = 10.0.0.1/24
+Address = {vpn_manager.ip_allocator.server_interface_address}
 ListenPort = 51820
 SaveConfig = false
-PostUp = iptables -A FORWARD -i wg0 -j ACCEPT; iptables -t nat -A POSTROUTING -o $(ip route | grep default | awk '{{print $5}}') -j MASQUERADE
-PostDown = iptables -D FORWARD -i wg0 -j ACCEPT; iptables -t nat -D POSTROUTING -o $(ip route | grep default | awk '{{print $5}}') -j MASQUERADE
+PostUp = iptables -A FORWARD -i {WG_INTERFACE} -j ACCEPT; iptables -t nat -A POSTROUTING -o $(ip route | grep default | awk '{{print $5}}') -j MASQUERADE
+PostDown = iptables -D FORWARD -i {WG_INTERFACE} -j ACCEPT; iptables -t nat -D POSTROUTING -o $(ip route | grep default | awk '{{print $5}}') -j MASQUERADE
 
 # Клиенты будут добавлены здесь
 ''')
         
-        # Настраиваем IP-форвардинг
-        with open('/etc/sysctl.d/99-wireguard.conf', 'w') as f:
-            f.write('net.ipv4.ip_forward = 1\n')
-        
-        subprocess.run(['sysctl', '-p', '/etc/sysctl.d/99-wireguard.conf'], check=True)
+        # Старые клиенты больше не действительны - освобождаем их адреса
+        vpn_manager.ip_allocator.rebuild()
+    
+    # Настраиваем IP-форвардинг
+    with open(SYSCTL_CONFIG_PATH, 'w') as f:
+        f.write('net.ipv4.ip_forward = 1\n')
+
+@router.callback_query(F.data == "confirm_reinstall_wireguard")
+async def cb_confirm_reinstall_wireguard(callback: CallbackQuery, state: FSMContext):
+    user_id = callback.from_user.id
+    
+    if not is_admin(user_id):
+        await callback.answer("⛔ Доступ запрещен", show_alert=True)
+        return
+    
+    await callback.answer()
+    await state.clear()
+    
+    await callback.message.edit_text("⏳ Переустановка WireGuard... Это может занять некоторое время")
+    
+    try:
+        service = f'wg-quick@{WG_INTERFACE}'
         
-        # Запускаем службу WireGuard
-        subprocess.run(['systemctl', 'enable', 'wg-quick@wg0'], check=True)
-        subprocess.run(['systemctl', 'start', 'wg-quick@wg0'], check=True)
+        # Пока конфигурация пересоздается, пиры не добавляются и не удаляются
+        async with vpn_manager.config_lock:
+            try:
+                # Останавливаем службу WireGuard
+                await run_command('systemctl', 'stop', service, timeout=WG_RESTART_TIMEOUT)
+                
+                # Создаем новые ключи и конфигурацию, освобождаем адреса старых клиентов
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, write_new_server_config)
+                
+                await run_command('sysctl', '-p', SYSCTL_CONFIG_PATH)
+                
+                # Запускаем службу WireGuard
+                await run_command('systemctl', 'enable', service, timeout=WG_RESTART_TIMEOUT)
+                await run_command('systemctl', 'start', service, timeout=WG_RESTART_TIMEOUT)
+            finally:
+                invalidate_status()
         
         # Ждем немного и проверяем статус
         await asyncio.sleep(3)
-        status = vpn_manager.check_wireguard_status()
+        status = await vpn_manager.check_wireguard_status(fresh=True)
         
         if status['is_active']:
             await callback.message.edit_text(
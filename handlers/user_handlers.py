@@ -7,11 +7,12 @@
 """
 
 import os
+import time
 import logging
 from datetime import datetime
 from aiogram import Router, F
 from aiogram.filters import Command
-from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
@@ -24,8 +25,8 @@ from keyboards.user_kb import (
     setup_kb, faq_kb, back_to_main_kb
 )
 from database.models import ClientModel, FeedbackModel
-from utils.qr_generator import generate_qr_from_config
-from utils.speed_test import run_speed_test
+from utils.telegram_files import send_client_config, send_client_qr
+from utils.speed_test import speed_tester, speed_test_scheduler
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -57,7 +58,7 @@ async def cmd_start(message: Message):
     first_name = message.from_user.first_name
     
     # Проверяем, есть ли у пользователя уже профиль
-    client = await client_model.get_client_by_user_id(user_id)
+    client = await client_model.get_client_by_user_id(user_id, fields=("id",))
     
     # Получаем текст приветствия из шаблона
     welcome_text = read_template("welcome.txt")
@@ -132,17 +133,16 @@ async def cmd_profile(message: Message):
 
 async def show_user_profile(message, client):
     """Показывает профиль пользователя"""
-    client_id, name, user_id, email, create_date, expiry_date, last_connection, is_active, is_blocked, *_ = client
-    
     # Определяем статус клиента
-    if is_blocked:
+    if client.is_blocked:
         status = "⛔ Заблокирован"
-    elif not is_active:
+    elif not client.is_active:
         status = "❌ Неактивен"
     else:
         status = "✅ Активен"
     
     # Форматируем информацию о сроке действия
+    expiry_date = client.expiry_date
     if expiry_date:
         expiry_date_obj = datetime.strptime(expiry_date, "%Y-%m-%d %H:%M:%S")
         now = datetime.now()
@@ -158,26 +158,26 @@ async def show_user_profile(message, client):
     # Формируем текст сообщения
     text = (
         f"👤 Ваш профиль RuCoder VPN\n\n"
-        f"🆔 ID: {client_id}\n"
-        f"👤 Имя: {name}\n"
+        f"🆔 ID: {client.id}\n"
+        f"👤 Имя: {client.name}\n"
         f"{status}\n"
-        f"📅 Дата создания: {create_date}\n"
+        f"📅 Дата создания: {client.create_date}\n"
         f"{expiry_info}\n"
     )
     
-    if last_connection:
-        text += f"🔄 Последнее подключение: {last_connection}\n"
+    if client.last_connection:
+        text += f"🔄 Последнее подключение: {client.last_connection}\n"
     
-    if email:
-        text += f"📧 Email: {email}\n"
+    if client.email:
+        text += f"📧 Email: {client.email}\n"
     
     # Добавляем инструкции, если профиль активен
-    if is_active and not is_blocked:
+    if client.is_enabled:
         text += "\n🔧 Для настройки VPN вы можете использовать кнопки ниже."
     
     await message.answer(
         text,
-        reply_markup=profile_kb(is_active and not is_blocked)
+        reply_markup=profile_kb(client.is_enabled)
     )
 
 @router.callback_query(F.data == "download_config")
@@ -187,7 +187,7 @@ async def cb_download_config(callback: CallbackQuery):
     await callback.answer()
     
     # Получаем профиль пользователя
-    client = await client_model.get_client_by_user_id(user_id)
+    client = await client_model.get_client_by_user_id(user_id, fields=("id", "name"))
     
     if not client:
         await callback.message.edit_text(
@@ -197,7 +197,7 @@ async def cb_download_config(callback: CallbackQuery):
         )
         return
     
-    client_id, name, *_ = client
+    client_id, name = client.id, client.name
     
     # Проверяем существование конфигурационного файла
     config_path = os.path.join(CLIENTS_DIR, name, f"{name}.conf")
@@ -210,25 +210,23 @@ async def cb_download_config(callback: CallbackQuery):
         )
         return
     
-    # Отправляем конфигурационный файл
-    await callback.bot.send_document(
+    # Отправляем конфигурационный файл (повторно - по file_id, без загрузки)
+    await send_client_config(
+        callback.bot,
         user_id,
-        FSInputFile(config_path),
+        client_id,
+        config_path,
         caption="📋 Ваш конфигурационный файл WireGuard"
     )
     
     # Генерируем и отправляем QR-код
-    qr_path = await generate_qr_from_config(config_path)
-    
-    if qr_path:
-        await callback.bot.send_photo(
-            user_id,
-            FSInputFile(qr_path),
-            caption="🔄 Отсканируйте этот QR-код в приложении WireGuard для быстрой настройки"
-        )
-        
-        # Удаляем временный файл QR-кода
-        os.remove(qr_path)
+    await send_client_qr(
+        callback.bot,
+        user_id,
+        client_id,
+        config_path,
+        caption="🔄 Отсканируйте этот QR-код в приложении WireGuard для быстрой настройки"
+    )
     
     await callback.message.edit_text(
         "✅ Ваши данные для подключения отправлены.\n\n"
@@ -243,7 +241,7 @@ async def cb_show_qr(callback: CallbackQuery):
     await callback.answer()
     
     # Получаем профиль пользователя
-    client = await client_model.get_client_by_user_id(user_id)
+    client = await client_model.get_client_by_user_id(user_id, fields=("id", "name"))
     
     if not client:
         await callback.message.edit_text(
@@ -253,7 +251,7 @@ async def cb_show_qr(callback: CallbackQuery):
         )
         return
     
-    client_id, name, *_ = client
+    client_id, name = client.id, client.name
     
     # Проверяем существование конфигурационного файла
     config_path = os.path.join(CLIENTS_DIR, name, f"{name}.conf")
@@ -267,17 +265,15 @@ async def cb_show_qr(callback: CallbackQuery):
         return
     
     # Генерируем и отправляем QR-код
-    qr_path = await generate_qr_from_config(config_path)
+    qr_message = await send_client_qr(
+        callback.bot,
+        callback.message.chat.id,
+        client_id,
+        config_path,
+        caption="🔄 Отсканируйте этот QR-код в приложении WireGuard для быстрой настройки"
+    )
     
-    if qr_path:
-        await callback.message.answer_photo(
-            FSInputFile(qr_path),
-            caption="🔄 Отсканируйте этот QR-код в приложении WireGuard для быстрой настройки"
-        )
-        
-        # Удаляем временный файл QR-кода
-        os.remove(qr_path)
-        
+    if qr_message:
         await callback.message.edit_text(
             "Выберите инструкцию для настройки WireGuard на вашем устройстве:",
             reply_markup=setup_kb()
@@ -304,10 +300,10 @@ async def cb_setup_instructions(callback: CallbackQuery):
     instructions = read_template(template_name)
     
     # Получаем профиль пользователя для персонализации инструкций
-    client = await client_model.get_client_by_user_id(user_id)
+    client = await client_model.get_client_by_user_id(user_id, fields=("name",))
     
     if client:
-        client_name = client[1]  # name - индекс 1
+        client_name = client.name
         instructions = instructions.replace("{client_name}", client_name)
     
     # Заменяем общие плейсхолдеры
@@ -377,8 +373,8 @@ async def process_feedback(message: Message, state: FSMContext):
         # Уведомляем администраторов о новой обратной связи
         for admin_id in ADMIN_IDS:
             try:
-                client = await client_model.get_client_by_user_id(user_id)
-                client_name = client[1] if client else f"Пользователь {user_id}"
+                client = await client_model.get_client_by_user_id(user_id, fields=("name",))
+                client_name = client.name if client else f"Пользователь {user_id}"
                 
                 admin_notification = (
                     f"📫 Новое сообщение обратной связи!\n\n"
@@ -406,7 +402,7 @@ async def cb_user_back(callback: CallbackQuery, state: FSMContext):
     
     # Получаем информацию о пользователе
     user_id = callback.from_user.id
-    client = await client_model.get_client_by_user_id(user_id)
+    client = await client_model.get_client_by_user_id(user_id, fields=("id",))
     
     await callback.message.edit_text(
         f"👋 Главное меню RuCoder VPN\n\n"
@@ -509,27 +505,41 @@ async def cb_faq_question_5(callback: CallbackQuery):
 @router.callback_query(F.data == "speed_test")
 async def cb_speed_test(callback: CallbackQuery):
     """Обработчик запроса на тестирование скорости соединения"""
+    user_id = callback.from_user.id
+    
+    # Новый тест пользователь может запускать не чаще SPEED_TEST_USER_INTERVAL
+    retry_after = speed_test_scheduler.retry_after(user_id)
+    if retry_after:
+        await callback.answer(
+            f"⏳ Повторный тест скорости будет доступен через {retry_after} сек.",
+            show_alert=True
+        )
+        return
+    
     await callback.answer("⏳ Запуск теста скорости, пожалуйста, подождите...")
     
-    # Отправляем сообщение о начале тестирования
-    await callback.message.edit_text(
-        "🔄 Выполняется тестирование скорости соединения...\n\n"
-        "⏳ Проверка пинга...\n"
-        "⏳ Проверка скорости загрузки...\n\n"
-        "Это может занять от 15 до 30 секунд. Пожалуйста, подождите.",
-        reply_markup=None
-    )
+    # Отправляем сообщение о начале тестирования (недавний результат показывается сразу)
+    if not speed_test_scheduler.results.is_fresh():
+        await callback.message.edit_text(
+            "🔄 Выполняется тестирование скорости соединения...\n\n"
+            "⏳ Проверка пинга...\n"
+            "⏳ Проверка скорости загрузки...\n\n"
+            "Это может занять от 15 до 30 секунд. Пожалуйста, подождите.",
+            reply_markup=None
+        )
     
     try:
-        # Выполняем тест скорости и получаем результаты
-        results_text = await run_speed_test()
+        # Получаем результаты общего теста скорости
+        results = await speed_test_scheduler.get_results(user_id)
+        results_text = speed_tester.format_results(results)
+        tested_at = time.strftime('%d.%m.%Y %H:%M', time.localtime(results['timestamp']))
         
         # Дополняем сообщение о результатах
         full_text = (
             "✅ Тест скорости завершен!\n\n"
             f"{results_text}\n\n"
             f"🌐 Тестирование выполнено через: RuCoder VPN\n"
-            f"⏱ Дата и время: {time.strftime('%d.%m.%Y %H:%M')}\n\n"
+            f"⏱ Дата и время: {tested_at}\n\n"
             f"ℹ️ Результаты могут отличаться в зависимости от вашего интернет-провайдера "
             f"и текущей нагрузки на сеть."
         )
@@ -11,6 +11,7 @@ import logging
 import sqlite3
 from datetime import datetime
 from config import DB_PATH, CLIENTS_DIR, BASE_DIR, BOT_VERSION, MIGRATIONS_TABLE
+from database.models import configure_connection
 
 # Настройка логирования
 logging.basicConfig(
@@ -21,15 +22,15 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-def init_db():
-    """Инициализация базы данных"""
+def init_db(db_path=DB_PATH):
+    """Инициализация базы данных (по умолчанию - базы бота)"""
     try:
         # Создаем директории, если они не существуют
         os.makedirs(CLIENTS_DIR, exist_ok=True)
         os.makedirs(os.path.join(BASE_DIR, 'templates'), exist_ok=True)
         
         # Подключаемся к базе данных (будет создана, если не существует)
-        conn = sqlite3.connect(DB_PATH)
+        conn = configure_connection(sqlite3.connect(db_path))
         cursor = conn.cursor()
         
         # Создаем таблицу клиентов с улучшенной структурой
@@ -62,8 +63,8 @@ def init_db():
             CREATE TABLE IF NOT EXISTS stats (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 client_id INTEGER NOT NULL,
-                connection_date TEXT NOT NULL,
-                disconnection_date TEXT,
+                connection_date INTEGER NOT NULL,
+                disconnection_date INTEGER,
                 session_duration INTEGER DEFAULT 0,
                 ip_address TEXT,
                 bytes_received INTEGER DEFAULT 0,
@@ -73,8 +74,9 @@ def init_db():
         ''')
         
         # Создаем индекс для ускорения запросов
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stats_client_id ON stats(client_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stats_connection_date ON stats(connection_date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stats_client_connection ON stats(client_id, connection_date, bytes_received, bytes_sent)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stats_connection_traffic ON stats(connection_date, bytes_received, bytes_sent)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stats_open_sessions ON stats(client_id) WHERE disconnection_date IS NULL')
         
         # Создаем таблицу для хранения настроек
         cursor.execute('''
@@ -124,7 +126,7 @@ def init_db():
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS server_metrics (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT NOT NULL,
+                timestamp INTEGER NOT NULL,
                 cpu_usage REAL,
                 memory_usage REAL,
                 disk_usage REAL,
@@ -133,6 +135,108 @@ def init_db():
                 active_connections INTEGER
             )
         ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_server_metrics_timestamp ON server_metrics(timestamp)')
+        
+        # Создаем почасовые и суточные агрегаты метрик сервера
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS server_metrics_hourly (
+                period TEXT PRIMARY KEY,
+                samples INTEGER NOT NULL DEFAULT 0,
+                cpu_sum REAL NOT NULL DEFAULT 0,
+                cpu_max REAL,
+                cpu_p95 REAL,
+                memory_sum REAL NOT NULL DEFAULT 0,
+                memory_max REAL,
+                memory_p95 REAL,
+                disk_sum REAL NOT NULL DEFAULT 0,
+                disk_max REAL,
+                network_in REAL NOT NULL DEFAULT 0,
+                network_out REAL NOT NULL DEFAULT 0,
+                connections_sum INTEGER NOT NULL DEFAULT 0,
+                connections_max INTEGER,
+                connections_p95 INTEGER,
+                finalized INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS server_metrics_daily (
+                period TEXT PRIMARY KEY,
+                samples INTEGER NOT NULL DEFAULT 0,
+                cpu_sum REAL NOT NULL DEFAULT 0,
+                cpu_max REAL,
+                cpu_p95 REAL,
+                memory_sum REAL NOT NULL DEFAULT 0,
+                memory_max REAL,
+                memory_p95 REAL,
+                disk_sum REAL NOT NULL DEFAULT 0,
+                disk_max REAL,
+                network_in REAL NOT NULL DEFAULT 0,
+                network_out REAL NOT NULL DEFAULT 0,
+                connections_sum INTEGER NOT NULL DEFAULT 0,
+                connections_max INTEGER,
+                connections_p95 INTEGER,
+                finalized INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        
+        # Создаем таблицу для заданий рассылки
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                text TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'running',
+                chat_id INTEGER,
+                message_id INTEGER,
+                last_client_id INTEGER NOT NULL DEFAULT 0,
+                total INTEGER NOT NULL DEFAULT 0,
+                sent INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        ''')
+        
+        # Создаем таблицу file_id файлов, загруженных в Telegram
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS telegram_files (
+                client_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                file_id TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                PRIMARY KEY (client_id, kind)
+            )
+        ''')
+        
+        # Создаем таблицу состояний FSM
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fsm_states (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL DEFAULT '{}',
+                updated_at INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states(updated_at)')
+        
+        # Создаем таблицу результатов нагрузочного теста туннеля
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tunnel_benchmarks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at INTEGER NOT NULL,
+                mode TEXT NOT NULL,
+                mtu INTEGER NOT NULL,
+                peers INTEGER NOT NULL,
+                duration REAL NOT NULL,
+                goodput_mbps REAL,
+                pps REAL,
+                loss REAL,
+                latency_avg_ms REAL,
+                latency_p95_ms REAL,
+                cpu_count INTEGER
+            )
+        ''')
         
         # Фиксируем изменения
         conn.commit()
@@ -145,7 +249,8 @@ def init_db():
             ("max_clients", "50", "Максимальное количество клиентов", datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
             ("default_client_expiry", "30", "Срок действия клиента по умолчанию (дни)", datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
             ("metrics_retention", "30", "Срок хранения метрик (дни)", datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-            ("monitoring_interval", "5", "Интервал мониторинга (минуты)", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            ("monitoring_interval", "5", "Интервал мониторинга (минуты)", datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+            ("db_checkpoint_interval", "5", "Интервал контрольных точек WAL базы данных (минуты, 0 - отключено)", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
         ]
         
         cursor.execute('SELECT name FROM settings')
@@ -46,9 +46,8 @@ def client_list_kb(clients):
     
     # Добавляем кнопки для каждого клиента
     for client in clients[:10]:  # Показываем максимум 10 клиентов на странице
-        client_id, name, *_ = client
         keyboard.append([
-            InlineKeyboardButton(text=f"{name}", callback_data=f"manage_client_{client_id}")
+            InlineKeyboardButton(text=f"{client.name}", callback_data=f"manage_client_{client.id}")
         ])
     
     # Добавляем кнопку возврата
@@ -118,6 +117,48 @@ def admin_stats_kb():
     
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
+def stats_clients_kb(sort, page, total_pages):
+    """Клавиатура статистики клиентов с сортировкой и пагинацией"""
+    keyboard = []
+    
+    # Переключение сортировки (текущая отмечена)
+    keyboard.append([
+        InlineKeyboardButton(
+            text=f"{'• ' if sort == 'recent' else ''}🆕 Новые",
+            callback_data="stats_clients_recent_1"
+        ),
+        InlineKeyboardButton(
+            text=f"{'• ' if sort == 'traffic' else ''}📊 По трафику",
+            callback_data="stats_clients_traffic_1"
+        )
+    ])
+    
+    # Добавляем навигационные кнопки
+    navigation = []
+    
+    if page > 1:
+        navigation.append(
+            InlineKeyboardButton(text="« Пред", callback_data=f"stats_clients_{sort}_{page - 1}")
+        )
+    
+    navigation.append(
+        InlineKeyboardButton(text=f"{page}/{total_pages}", callback_data="do_nothing")
+    )
+    
+    if page < total_pages:
+        navigation.append(
+            InlineKeyboardButton(text="След »", callback_data=f"stats_clients_{sort}_{page + 1}")
+        )
+    
+    keyboard.append(navigation)
+    
+    # Кнопка возврата
+    keyboard.append([
+        InlineKeyboardButton(text="« Назад", callback_data="admin_statistics")
+    ])
+    
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
 def monitoring_kb():
     """Клавиатура страницы мониторинга"""
     keyboard = [
@@ -143,6 +184,16 @@ def broadcast_kb():
     
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
+def broadcast_progress_kb(broadcast_id):
+    """Клавиатура сообщения о ходе рассылки"""
+    keyboard = [
+        [
+            InlineKeyboardButton(text="⏹ Остановить рассылку", callback_data=f"cancel_broadcast_{broadcast_id}")
+        ]
+    ]
+    
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
 def confirm_action_kb(callback_data):
     """Клавиатура подтверждения действия"""
     keyboard = [
@@ -185,43 +236,38 @@ def paginate_kb(callback_prefix, current_page, total_pages, back_callback="admin
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 def generate_clients_kb(clients, page, total_pages):
-    """Генерирует клавиатуру со списком клиентов и пагинацией"""
+    """Генерирует клавиатуру со списком клиентов страницы и пагинацией"""
     keyboard = []
     
-    # Определяем клиентов для текущей страницы
-    start_idx = (page - 1) * 5
-    end_idx = min(start_idx + 5, len(clients))
-    page_clients = clients[start_idx:end_idx]
-    
     # Добавляем кнопки для каждого клиента
-    for client in page_clients:
-        client_id, name, *_ = client
+    for client in clients:
         keyboard.append([
-            InlineKeyboardButton(text=f"{name}", callback_data=f"manage_client_{client_id}")
+            InlineKeyboardButton(text=f"{client.name}", callback_data=f"manage_client_{client.id}")
         ])
     
-    # Добавляем навигационные кнопки
+    # Добавляем навигационные кнопки (страницы отсчитываются от ID крайних клиентов)
     navigation = []
     
-    if page > 1:
+    if page > 1 and clients:
         navigation.append(
-            InlineKeyboardButton(text="« Пред", callback_data=f"client_page_{page - 1}")
+            InlineKeyboardButton(text="« Пред", callback_data=f"client_page_p_{page - 1}_{clients[0].id}")
         )
     
     navigation.append(
         InlineKeyboardButton(text=f"Стр {page}/{total_pages}", callback_data="do_nothing")
     )
     
-    if page < total_pages:
+    if page < total_pages and clients:
         navigation.append(
-            InlineKeyboardButton(text="След »", callback_data=f"client_page_{page + 1}")
+            InlineKeyboardButton(text="След »", callback_data=f"client_page_n_{page + 1}_{clients[-1].id}")
         )
     
     keyboard.append(navigation)
     
-    # Кнопка добавления нового клиента
+    # Кнопки добавления новых клиентов
     keyboard.append([
-        InlineKeyboardButton(text="➕ Добавить клиента", callback_data="admin_add_client")
+        InlineKeyboardButton(text="➕ Добавить клиента", callback_data="admin_add_client"),
+        InlineKeyboardButton(text="📥 Добавить списком", callback_data="admin_bulk_add")
     ])
     
     # Кнопка возврата
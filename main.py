@@ -10,18 +10,32 @@ import asyncio
 import logging
 import os
 import sys
-from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+import signal
+import secrets
+from aiohttp import web
+from aiogram import Bot
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
 # Добавление родительского каталога в путь для импорта модулей
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from config import BOT_TOKEN, logger, ADMIN_IDS
+from config import (
+    BOT_TOKEN, logger, ADMIN_IDS, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST,
+    WEBHOOK_PORT, WEBHOOK_MAX_CONNECTIONS, WEBHOOK_KEEPALIVE_TIMEOUT
+)
 from handlers.admin_handlers import register_admin_handlers
 from handlers.user_handlers import register_user_handlers
 from handlers.setup_handlers import register_setup_handlers
 from database.migrations import run_migrations
+from database.models import Database
+from utils.fsm_storage import SQLiteStorage
+from utils.update_workers import WorkerPoolDispatcher, update_workers
 from utils.server_monitor import start_monitoring
+from utils.db_maintenance import start_checkpoint_scheduler
+from utils.traffic_collector import start_traffic_collector
+from utils.broadcaster import resume_broadcasts
+from utils.qr_generator import shutdown_qr_renderer
+from utils.speed_test import speed_tester
 from init_db import init_db
 
 async def on_startup(bot):
@@ -49,6 +63,15 @@ async def on_startup(bot):
     # Запуск мониторинга сервера в отдельном потоке
     asyncio.create_task(start_monitoring(bot))
     
+    # Запуск планировщика контрольных точек журнала WAL
+    asyncio.create_task(start_checkpoint_scheduler())
+    
+    # Запуск сбора статистики трафика клиентов
+    asyncio.create_task(start_traffic_collector())
+    
+    # Продолжение рассылок, прерванных перезапуском
+    await resume_broadcasts(bot)
+    
     logger.info("Бот успешно запущен и готов к работе!")
 
 async def on_shutdown(bot):
@@ -61,6 +84,67 @@ async def on_shutdown(bot):
             await bot.send_message(admin_id, "⚠️ Бот RuCoder VPN остановлен!")
         except Exception as e:
             logger.error(f"Не удалось отправить уведомление администратору {admin_id}: {e}")
+    
+    # Останавливаем процессы отрисовки QR-кодов и закрываем сессию теста скорости
+    shutdown_qr_renderer()
+    await speed_tester.close()
+    
+    # Закрываем соединения пула базы данных
+    Database.close_all()
+
+async def run_polling(bot, dp):
+    """Получение обновлений через long polling"""
+    # Пропуск необработанных обновлений
+    await bot.delete_webhook(drop_pending_updates=True)
+    
+    # Запуск опроса обновлений (при пуле воркеров новые обновления запрашиваются
+    # только после постановки полученных в очередь)
+    await dp.start_polling(bot, handle_as_tasks=not update_workers.enabled)
+
+async def run_webhook(bot, dp):
+    """
+    Получение обновлений через webhook
+    
+    Telegram отправляет обновления на WEBHOOK_URL + WEBHOOK_PATH (обычно через
+    обратный прокси с HTTPS), а локальный веб-сервер aiohttp сразу отвечает
+    и обрабатывает обновление в фоне.
+    """
+    secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    
+    app = web.Application()
+    # Хуки диспетчера регистрируются раньше обработчика запросов, чтобы при
+    # остановке уведомления администраторам отправлялись до закрытия сессии бота
+    setup_application(app, dp, bot=bot)
+    # При пуле воркеров ответ Telegram отправляется после постановки обновления
+    # в очередь, поэтому при заполненной очереди Telegram придерживает обновления
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot, secret_token=secret, handle_in_background=not update_workers.enabled
+    ).register(app, path=WEBHOOK_PATH)
+    
+    runner = web.AppRunner(app, keepalive_timeout=WEBHOOK_KEEPALIVE_TIMEOUT, access_log=None)
+    await runner.setup()
+    
+    try:
+        site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+        await site.start()
+        
+        await bot.set_webhook(
+            url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+            secret_token=secret,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=True
+        )
+        logger.info(f"Webhook установлен, сервер слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+        
+        # Работа до сигнала остановки
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+        await stop_event.wait()
+    finally:
+        await runner.cleanup()
 
 async def main():
     """Основная функция запуска бота"""
@@ -71,8 +155,10 @@ async def main():
     
     # Инициализация бота и диспетчера
     bot = Bot(token=BOT_TOKEN)
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
+    # Состояния диалогов хранятся в базе данных и переживают перезапуск бота
+    storage = SQLiteStorage()
+    # Обновления обрабатываются пулом воркеров, если задан UPDATE_WORKERS
+    dp = WorkerPoolDispatcher(storage=storage)
     
     # Регистрация обработчиков
     register_user_handlers(dp)
@@ -87,11 +173,10 @@ async def main():
     try:
         logger.info("Запуск VPN бота")
         
-        # Пропуск необработанных обновлений
-        await bot.delete_webhook(drop_pending_updates=True)
-        
-        # Запуск опроса обновлений
-        await dp.start_polling(bot)
+        if WEBHOOK_URL:
+            await run_webhook(bot, dp)
+        else:
+            await run_polling(bot, dp)
     except Exception as e:
         logger.error(f"Ошибка при запуске бота: {e}")
     finally:
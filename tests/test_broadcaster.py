@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Тесты фоновой рассылки сообщений
+Автор: RUCODER (https://рукодер.рф/vpn)
+
+Запуск: python -m pytest tests или python -m unittest discover tests
+"""
+
+import os
+import time
+import asyncio
+import sqlite3
+import tempfile
+import unittest
+from collections import Counter
+from datetime import datetime
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError
+from aiogram.methods import SendMessage
+
+from database.migrations import run_migrations
+from database.models import Database, BroadcastModel
+from init_db import init_db
+from utils.broadcaster import Broadcaster, TokenBucket
+
+# Пауза, которую запрашивает ответ 429 (секунды)
+RETRY_AFTER = 1
+# Допуск на точность таймеров цикла событий (секунды)
+TIMER_SLACK = 0.05
+FIRST_USER_ID = 1000
+
+class FakeBot:
+    """Замена бота: запоминает отправленные сообщения и отвечает заданными ошибками"""
+    
+    def __init__(self, retry_after_at=(), blocked=(), on_send=None):
+        self.retry_after_at = set(retry_after_at)
+        self.blocked = set(blocked)
+        self.on_send = on_send
+        # Все запросы sendMessage (monotonic, chat_id)
+        self.requests = []
+        self.delivered = Counter()
+    
+    async def send_message(self, chat_id, text):
+        self.requests.append((time.monotonic(), chat_id))
+        method = SendMessage(chat_id=chat_id, text=text)
+        
+        if len(self.requests) in self.retry_after_at:
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=RETRY_AFTER)
+        if chat_id in self.blocked:
+            raise TelegramForbiddenError(method=method, message="Forbidden: bot was blocked by the user")
+        
+        self.delivered[chat_id] += 1
+        if self.on_send:
+            await self.on_send(len(self.requests))
+    
+    async def edit_message_text(self, *args, **kwargs):
+        pass
+
+class TokenBucketTests(unittest.IsolatedAsyncioTestCase):
+    async def acquire_time(self, bucket, count):
+        start = time.monotonic()
+        for _ in range(count):
+            await bucket.acquire()
+        return time.monotonic() - start
+    
+    async def test_rate_limit(self):
+        bucket = TokenBucket(20, capacity=1)
+        # Первый токен доступен сразу, остальные - через 1/20 с
+        self.assertGreaterEqual(await self.acquire_time(bucket, 5), 4 / 20 - TIMER_SLACK)
+    
+    async def test_no_rate_limit(self):
+        self.assertLess(await self.acquire_time(TokenBucket(0), 1000), 0.5)
+    
+    async def test_pause(self):
+        for rate in (100, 0):
+            with self.subTest(rate=rate):
+                bucket = TokenBucket(rate)
+                bucket.pause(0.3)
+                self.assertGreaterEqual(await self.acquire_time(bucket, 1), 0.3 - TIMER_SLACK)
+
+class BroadcasterTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'vpn_bot.db')
+        init_db(self.db_path)
+        await run_migrations(self.db_path)
+        self.model = BroadcastModel(Database(self.db_path))
+    
+    async def asyncTearDown(self):
+        Database.close_all()
+        self.tmp_dir.cleanup()
+    
+    def add_clients(self, user_ids):
+        """Создает по клиенту на каждый элемент user_ids (ID может повторяться)"""
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.executemany(
+                "INSERT INTO clients (name, user_id, create_date, expiry_date, is_active, public_key) "
+                "VALUES (?, ?, ?, ?, 1, ?)",
+                ((f"client{i}", user_id, now, now, f"{i:043d}=") for i, user_id in enumerate(user_ids))
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    
+    async def create_broadcast(self):
+        return await self.model.create_broadcast("Тест", await self.model.count_recipients())
+    
+    def broadcaster(self, bot, rate=0, batch_size=4):
+        return Broadcaster(bot, self.model, rate=rate, concurrency=4, batch_size=batch_size, progress_interval=60)
+    
+    async def test_delivers_once_per_user(self):
+        users = [FIRST_USER_ID + i for i in range(10)]
+        # Пользователь с несколькими клиентами получает одно сообщение
+        self.add_clients(users + users[:3])
+        blocked = users[-1]
+        bot = FakeBot(blocked={blocked})
+        broadcast_id = await self.create_broadcast()
+        
+        broadcaster = self.broadcaster(bot)
+        await broadcaster.run(broadcast_id)
+        
+        self.assertEqual(bot.delivered, Counter(users[:-1]))
+        self.assertEqual((broadcaster.sent, broadcaster.failed), (9, 1))
+        job = await self.model.get_broadcast(broadcast_id)
+        self.assertEqual((job[2], job[7], job[8]), ("completed", 9, 1))
+    
+    async def test_retry_after_pauses_sending(self):
+        users = [FIRST_USER_ID + i for i in range(6)]
+        self.add_clients(users)
+        bot = FakeBot(retry_after_at={1})
+        broadcast_id = await self.create_broadcast()
+        
+        # Без ограничения частоты пауза после 429 тоже соблюдается
+        broadcaster = self.broadcaster(bot, rate=0)
+        await broadcaster.run(broadcast_id)
+        
+        self.assertEqual(bot.delivered, Counter(users))
+        self.assertEqual(broadcaster.sent, len(users))
+        
+        # Сообщение повторяется не раньше чем через RETRY_AFTER, и остальные запросы,
+        # кроме начатых одновременно с ответом 429, тоже ожидают окончания паузы
+        limited_at, limited_chat = bot.requests[0]
+        retried_at = next(t for t, chat_id in bot.requests[1:] if chat_id == limited_chat)
+        self.assertGreaterEqual(retried_at - limited_at, RETRY_AFTER - TIMER_SLACK)
+        for requested_at, _ in bot.requests[1:]:
+            if requested_at > limited_at + TIMER_SLACK:
+                self.assertGreaterEqual(requested_at - limited_at, RETRY_AFTER - TIMER_SLACK)
+    
+    async def test_resume_after_cancel(self):
+        users = [FIRST_USER_ID + i for i in range(10)]
+        self.add_clients(users)
+        broadcast_id = await self.create_broadcast()
+        
+        async def cancel_after_three(count):
+            if count == 3:
+                first.cancel()
+        
+        bot = FakeBot(on_send=cancel_after_three)
+        first = self.broadcaster(bot)
+        await first.run(broadcast_id)
+        
+        # Отмена останавливает рассылку после текущей порции, позиция сохранена
+        job = await self.model.get_broadcast(broadcast_id)
+        self.assertEqual(job[2], "cancelled")
+        self.assertEqual(job[7], 4)
+        
+        bot.on_send = None
+        second = self.broadcaster(bot)
+        await second.run(broadcast_id)
+        
+        self.assertEqual(bot.delivered, Counter(users))
+        self.assertEqual(second.sent, len(users))
+        job = await self.model.get_broadcast(broadcast_id)
+        self.assertEqual((job[2], job[7]), ("completed", len(users)))
+    
+    async def test_resume_after_restart(self):
+        users = [FIRST_USER_ID + i for i in range(12)]
+        self.add_clients(users)
+        broadcast_id = await self.create_broadcast()
+        
+        stop = asyncio.Event()
+        
+        async def stop_after_six(count):
+            if count == 6:
+                stop.set()
+                # Остановка бота во время отправки порции
+                await asyncio.sleep(3600)
+        
+        bot = FakeBot(on_send=stop_after_six)
+        task = asyncio.create_task(self.broadcaster(bot).run(broadcast_id))
+        await stop.wait()
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        
+        job = await self.model.get_broadcast(broadcast_id)
+        self.assertEqual(job[2], "running")
+        
+        bot.on_send = None
+        await self.broadcaster(bot).run(broadcast_id)
+        
+        # Повторно отправляется не больше одной прерванной порции
+        self.assertEqual(set(bot.delivered), set(users))
+        self.assertLessEqual(sum(bot.delivered.values()) - len(users), 4)
+
+if __name__ == "__main__":
+    unittest.main()
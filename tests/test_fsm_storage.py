@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Тесты хранилища состояний FSM в SQLite
+Автор: RUCODER (https://рукодер.рф/vpn)
+
+Запуск: python -m pytest tests или python -m unittest discover tests
+"""
+
+import os
+import time
+import tempfile
+import unittest
+
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+
+from database.migrations import run_migrations
+from database.models import Database, FSMStateModel
+from init_db import init_db
+from utils.fsm_storage import SQLiteStorage
+
+# Запись в базу в тестах выполняется только явным вызовом flush
+FLUSH_INTERVAL = 3600
+TTL = 600
+
+class Form(StatesGroup):
+    name = State()
+
+class FailingOnceModel(FSMStateModel):
+    """Модель, первая запись которой завершается ошибкой"""
+    
+    def __init__(self, db):
+        super().__init__(db)
+        self.failures = 1
+    
+    async def save_records(self, upserts=(), deletes=()):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("database is locked")
+        await super().save_records(upserts, deletes)
+
+class SQLiteStorageTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.tmp_dir.name, 'vpn_bot.db')
+        init_db(db_path)
+        await run_migrations(db_path)
+        
+        self.db = Database(db_path)
+        self.model = FSMStateModel(self.db)
+        self.storage = self.make_storage()
+        self.key = StorageKey(bot_id=1, chat_id=100, user_id=100)
+        self.db_key = SQLiteStorage._key(self.key)
+    
+    async def asyncTearDown(self):
+        await self.storage.close()
+        Database.close_all()
+        self.tmp_dir.cleanup()
+    
+    def make_storage(self, model=None):
+        return SQLiteStorage(model or self.model, cache_size=16, flush_interval=FLUSH_INTERVAL, ttl=TTL)
+    
+    async def test_changes_written_on_flush(self):
+        await self.storage.set_state(self.key, Form.name)
+        await self.storage.set_data(self.key, {"name": "client1"})
+        
+        self.assertIsNone(await self.model.get_record(self.db_key))
+        
+        await self.storage.flush()
+        state, data, _ = await self.model.get_record(self.db_key)
+        self.assertEqual(state, Form.name.state)
+        self.assertEqual(data, '{"name": "client1"}')
+        
+        # Новое хранилище (после перезапуска бота) читает состояние из базы
+        storage = self.make_storage()
+        self.assertEqual(await storage.get_state(self.key), Form.name.state)
+        self.assertEqual(await storage.get_data(self.key), {"name": "client1"})
+        await storage.close()
+    
+    async def test_returned_data_is_a_copy(self):
+        await self.storage.set_data(self.key, {"name": "client1"})
+        data = await self.storage.get_data(self.key)
+        data["name"] = "changed"
+        self.assertEqual(await self.storage.get_data(self.key), {"name": "client1"})
+    
+    async def test_cleared_state_deleted_on_flush(self):
+        await self.storage.set_state(self.key, Form.name)
+        await self.storage.flush()
+        
+        await self.storage.set_state(self.key, None)
+        await self.storage.set_data(self.key, {})
+        await self.storage.flush()
+        
+        self.assertIsNone(await self.model.get_record(self.db_key))
+    
+    async def test_close_flushes_changes(self):
+        await self.storage.set_state(self.key, Form.name)
+        await self.storage.close()
+        
+        state, _, _ = await self.model.get_record(self.db_key)
+        self.assertEqual(state, Form.name.state)
+    
+    async def test_failed_flush_is_retried(self):
+        storage = self.make_storage(FailingOnceModel(self.db))
+        await storage.set_state(self.key, Form.name)
+        
+        await storage.flush()
+        self.assertIsNone(await self.model.get_record(self.db_key))
+        
+        await storage.flush()
+        state, _, _ = await self.model.get_record(self.db_key)
+        self.assertEqual(state, Form.name.state)
+        await storage.close()
+    
+    async def test_expired_state_is_empty(self):
+        expired = int(time.time()) - TTL - 10
+        await self.model.save_records([(self.db_key, Form.name.state, '{"name": "client1"}', expired)])
+        
+        self.assertIsNone(await self.storage.get_state(self.key))
+        self.assertEqual(await self.storage.get_data(self.key), {})
+    
+    async def test_expired_cached_state_is_reset(self):
+        await self.storage.set_state(self.key, Form.name)
+        # Запись в кеше не изменялась дольше TTL
+        self.storage._cache[self.db_key][2] -= TTL + 10
+        
+        self.assertIsNone(await self.storage.get_state(self.key))
+    
+    async def test_cleanup_deletes_expired_states(self):
+        now = int(time.time())
+        other_key = SQLiteStorage._key(StorageKey(bot_id=1, chat_id=200, user_id=200))
+        await self.model.save_records([
+            (self.db_key, Form.name.state, '{}', now - TTL - 10),
+            (other_key, Form.name.state, '{}', now)
+        ])
+        
+        await self.storage.cleanup()
+        
+        self.assertIsNone(await self.model.get_record(self.db_key))
+        self.assertIsNotNone(await self.model.get_record(other_key))
+
+if __name__ == "__main__":
+    unittest.main()
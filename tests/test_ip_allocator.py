@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Тесты выделения IP-адресов клиентам WireGuard
+Автор: RUCODER (https://рукодер.рф/vpn)
+
+Запуск: python -m pytest tests или python -m unittest discover tests
+"""
+
+import os
+import tempfile
+import unittest
+
+from utils.ip_allocator import IPAllocator
+
+# В подсети /29 клиентам доступны адреса .2 - .6 (.0 - сеть, .1 - сервер, .7 - широковещательный)
+SUBNET = "10.8.0.0/29"
+CLIENT_IPS = [f"10.8.0.{i}/32" for i in range(2, 7)]
+
+class IPAllocatorTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.pool_path = os.path.join(self.tmp_dir.name, 'ip_pool.bin')
+        self.used = []
+    
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+    
+    def allocator(self, subnet=SUBNET):
+        return IPAllocator(subnet, self.pool_path, used_ips=lambda: self.used)
+    
+    def test_allocate_until_full(self):
+        allocator = self.allocator()
+        self.assertEqual([allocator.allocate() for _ in CLIENT_IPS], CLIENT_IPS)
+        self.assertIsNone(allocator.allocate())
+    
+    def test_used_ips_are_skipped(self):
+        self.used = ["10.8.0.2/32", "10.8.0.4"]
+        allocator = self.allocator()
+        self.assertEqual(allocator.allocate(), "10.8.0.3/32")
+        self.assertEqual(allocator.allocate(), "10.8.0.5/32")
+    
+    def test_release_reuses_address(self):
+        allocator = self.allocator()
+        first, second = allocator.allocate(), allocator.allocate()
+        allocator.release(first)
+        self.assertEqual(allocator.allocate(), first)
+        self.assertNotIn(allocator.allocate(), (first, second))
+    
+    def test_repeated_release_frees_address_once(self):
+        allocator = self.allocator()
+        ip = allocator.allocate()
+        allocator.release(ip)
+        allocator.release(ip)
+        
+        # Повторное освобождение не должно выдать адрес двум клиентам
+        allocated = [allocator.allocate() for _ in CLIENT_IPS]
+        self.assertEqual(sorted(allocated), CLIENT_IPS)
+        self.assertIsNone(allocator.allocate())
+    
+    def test_release_ignores_reserved_and_foreign_addresses(self):
+        allocator = self.allocator()
+        for ip in ("10.8.0.0", "10.8.0.1", "10.8.0.7", "192.168.1.2/32"):
+            allocator.release(ip)
+        self.assertEqual([allocator.allocate() for _ in CLIENT_IPS], CLIENT_IPS)
+        self.assertIsNone(allocator.allocate())
+    
+    def test_reserve(self):
+        allocator = self.allocator()
+        allocator.reserve("10.8.0.2/32")
+        allocator.reserve("192.168.1.2/32")
+        self.assertEqual(allocator.allocate(), "10.8.0.3/32")
+    
+    def test_state_persists_between_instances(self):
+        allocator = self.allocator()
+        first = allocator.allocate()
+        allocator.allocate()
+        allocator.release(first)
+        
+        # Сохраненная карта используется без обращения к used_ips
+        self.used = CLIENT_IPS
+        allocator = self.allocator()
+        self.assertEqual(allocator.allocate(), first)
+        self.assertEqual(allocator.allocate(), "10.8.0.4/32")
+    
+    def test_rebuild_uses_current_addresses(self):
+        allocator = self.allocator()
+        for _ in CLIENT_IPS:
+            allocator.allocate()
+        
+        self.used = ["10.8.0.2/32"]
+        allocator.rebuild()
+        self.assertEqual([allocator.allocate() for _ in range(4)], CLIENT_IPS[1:])
+        self.assertIsNone(allocator.allocate())
+    
+    def test_pool_for_other_subnet_is_rebuilt(self):
+        allocator = self.allocator()
+        allocator.allocate()
+        
+        allocator = self.allocator("10.9.0.0/29")
+        self.assertEqual(allocator.allocate(), "10.9.0.2/32")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Тесты модуля тестирования скорости соединения
+Автор: RUCODER (https://рукодер.рф/vpn)
+
+Запуск: python -m pytest tests или python -m unittest discover tests
+"""
+
+import asyncio
+import unittest
+
+from aiohttp import web
+
+from utils.speed_test import SpeedTester, _percentile, _window_speeds
+
+# Задержка первого ответа тестового сервера (секунды)
+SLOW_RESPONSE_DELAY = 0.5
+# Порции, которые тестовый сервер отдает при загрузке (байты, секунды между порциями)
+CHUNK_SIZE = 64 * 1024
+CHUNK_COUNT = 16
+CHUNK_INTERVAL = 0.1
+
+class PercentileTests(unittest.TestCase):
+    def test_empty(self):
+        self.assertIsNone(_percentile([], 50))
+    
+    def test_nearest_rank(self):
+        values = list(range(10, 0, -1))
+        self.assertEqual(_percentile(values, 10), 1)
+        self.assertEqual(_percentile(values, 50), 5)
+        self.assertEqual(_percentile(values, 90), 9)
+        self.assertEqual(_percentile(values, 100), 10)
+        self.assertEqual(_percentile([7], 10), 7)
+
+class WindowSpeedsTests(unittest.TestCase):
+    def test_empty(self):
+        self.assertEqual(_window_speeds([]), [])
+    
+    def test_shorter_than_window(self):
+        samples = [(i * 0.1 + 0.05, 125_000) for i in range(10)]
+        self.assertEqual(_window_speeds(samples), [])
+    
+    def test_constant_rate(self):
+        # 125 000 байт каждые 0.1 с - 10 Мбит/с, последний интервал не учитывается
+        samples = [(i * 0.1 + 0.05, 125_000) for i in range(20)]
+        speeds = _window_speeds(samples)
+        self.assertEqual(len(speeds), 10)
+        for speed in speeds:
+            self.assertAlmostEqual(speed, 10.0)
+    
+    def test_stall_lowers_window(self):
+        samples = [(i * 0.1 + 0.05, 125_000) for i in range(30) if not 10 <= i < 15]
+        speeds = _window_speeds(samples)
+        self.assertAlmostEqual(max(speeds), 10.0)
+        self.assertAlmostEqual(min(speeds), 5.0)
+
+class SpeedTesterTests(unittest.IsolatedAsyncioTestCase):
+    """Измерения на локальном сервере aiohttp.web с заданными задержками"""
+    
+    async def asyncSetUp(self):
+        self.head_requests = 0
+        
+        app = web.Application()
+        app.router.add_route('HEAD', '/ping', self.handle_ping)
+        app.router.add_get('/download', self.handle_download)
+        
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        
+        self.tester = SpeedTester()
+    
+    async def asyncTearDown(self):
+        await self.tester.close()
+        await self.runner.cleanup()
+    
+    async def handle_ping(self, request):
+        self.head_requests += 1
+        # Первый запрос медленный, как установка соединения
+        if self.head_requests == 1:
+            await asyncio.sleep(SLOW_RESPONSE_DELAY)
+        return web.Response()
+    
+    async def handle_download(self, request):
+        # Задержка до первого байта не должна попасть в скорость передачи
+        await asyncio.sleep(SLOW_RESPONSE_DELAY)
+        
+        response = web.StreamResponse()
+        response.content_length = CHUNK_SIZE * CHUNK_COUNT
+        await response.prepare(request)
+        for i in range(CHUNK_COUNT):
+            if i:
+                await asyncio.sleep(CHUNK_INTERVAL)
+            await response.write(b'\0' * CHUNK_SIZE)
+        await response.write_eof()
+        return response
+    
+    async def test_ping_excludes_warmup_request(self):
+        avg_ping, min_ping = await self.tester.measure_ping(f"{self.base_url}/ping", count=3)
+        
+        self.assertEqual(self.head_requests, 4)
+        self.assertLess(avg_ping, SLOW_RESPONSE_DELAY * 1000 / 2)
+        self.assertLessEqual(min_ping, avg_ping)
+    
+    async def test_ping_unreachable(self):
+        await self.runner.cleanup()
+        avg_ping, min_ping = await self.tester.measure_ping(f"{self.base_url}/ping", count=1)
+        self.assertEqual((avg_ping, min_ping), (0, 0))
+    
+    async def test_download_separates_ttfb(self):
+        result = await self.tester.measure_download_speed(f"{self.base_url}/download")
+        
+        self.assertIsNotNone(result)
+        self.assertEqual(result["bytes"], CHUNK_SIZE * CHUNK_COUNT)
+        self.assertGreaterEqual(result["ttfb"], SLOW_RESPONSE_DELAY * 1000)
+        
+        # Скорость считается по времени передачи, без ожидания первого байта
+        expected = CHUNK_SIZE * 8 / (CHUNK_INTERVAL * 1_000_000)
+        self.assertGreater(result["mbps"], expected * 0.6)
+        self.assertLess(result["mbps"], expected * 1.4)
+        self.assertLessEqual(result["p10"], result["p50"])
+        self.assertLessEqual(result["p50"], result["p90"])
+    
+    async def test_download_error(self):
+        result = await self.tester.measure_download_speed(f"{self.base_url}/missing")
+        self.assertIsNone(result)
+
+class SpeedTesterLoopTests(unittest.TestCase):
+    """Общий экземпляр SpeedTester используется в нескольких циклах событий (перезапуск бота)"""
+    
+    async def download_twice(self, tester):
+        async def handle(request):
+            response = web.StreamResponse()
+            response.content_length = CHUNK_SIZE * 3
+            await response.prepare(request)
+            for i in range(3):
+                if i:
+                    await asyncio.sleep(CHUNK_INTERVAL)
+                await response.write(b'\0' * CHUNK_SIZE)
+            await response.write_eof()
+            return response
+        
+        app = web.Application()
+        app.router.add_get('/download', handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        
+        try:
+            # Одновременные загрузки ожидают друг друга на ограничении загрузок
+            return await asyncio.gather(*(
+                tester.measure_download_speed(f"http://127.0.0.1:{port}/download") for _ in range(2)
+            ))
+        finally:
+            await tester.close()
+            await runner.cleanup()
+    
+    def test_download_in_new_loop(self):
+        tester = SpeedTester()
+        for _ in range(2):
+            results = asyncio.run(self.download_twice(tester))
+            for result in results:
+                self.assertIsNotNone(result)
+                self.assertEqual(result["bytes"], CHUNK_SIZE * 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Нагрузочный тест рассылки сообщений для VPN-бота
+Автор: RUCODER (https://рукодер.рф/vpn)
+
+Рассылка выполняется Broadcaster по отдельной временной базе с заданным числом
+получателей через локальную замену Bot API (utils.fake_bot_api) с задержкой
+ответа, заблокированными пользователями и ответом 429. С --kill-after задание
+прерывается через заданное время и продолжается новым Broadcaster с сохраненной
+позиции, как после перезапуска бота. С --legacy для сравнения измеряется прежний
+цикл рассылки (отправка по одному сообщению с паузой 0.1 с).
+
+Запуск из каталога бота:
+    python -m utils.broadcast_benchmark --recipients 100000 --rate 0 --concurrency 100 --kill-after 4
+    python -m utils.broadcast_benchmark --recipients 2000 --rate 25 --legacy 100
+"""
+
+import os
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+
+from config import BROADCAST_RATE, BROADCAST_CONCURRENCY
+from database.migrations import run_migrations
+from database.models import Database, BroadcastModel
+from init_db import init_db
+from utils.broadcaster import Broadcaster
+from utils.db_benchmark import populate, FIRST_USER_ID
+from utils.fake_bot_api import FakeBotAPI
+
+BROADCAST_TEXT = "Тестовая рассылка"
+
+async def run_legacy(bot, recipients):
+    """Прежний цикл рассылки: по одному сообщению с паузой 0.1 с"""
+    start = time.perf_counter()
+    for i in range(recipients):
+        try:
+            await bot.send_message(FIRST_USER_ID + i, BROADCAST_TEXT)
+        except Exception:
+            pass
+        await asyncio.sleep(0.1)
+    return recipients / (time.perf_counter() - start)
+
+async def run_broadcast(bot, broadcast_model, broadcast_id, rate, concurrency, kill_after=None):
+    """
+    Выполняет задание рассылки, при kill_after - с прерыванием и продолжением
+    
+    Returns:
+        Последний экземпляр Broadcaster
+    """
+    broadcaster = Broadcaster(bot, broadcast_model, rate=rate, concurrency=concurrency)
+    
+    if kill_after:
+        task = asyncio.create_task(broadcaster.run(broadcast_id))
+        await asyncio.sleep(kill_after)
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            broadcaster = Broadcaster(bot, broadcast_model, rate=rate, concurrency=concurrency)
+            await broadcaster.run(broadcast_id)
+        else:
+            await task
+    else:
+        await broadcaster.run(broadcast_id)
+    
+    return broadcaster
+
+async def run_benchmark(recipients, latency, rate, concurrency, blocked_percent, kill_after, legacy):
+    # Ответ 429 на сотый запрос sendMessage
+    api = FakeBotAPI(
+        latency=latency,
+        blocked=lambda chat_id: blocked_percent and (chat_id - FIRST_USER_ID) % round(100 / blocked_percent) == 0,
+        retry_after_at=(100,)
+    )
+    
+    with tempfile.TemporaryDirectory(prefix='broadcastbench-') as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'vpn_bot.db')
+        init_db(db_path)
+        await run_migrations(db_path)
+        populate(db_path, recipients)
+        
+        await api.start()
+        bot = api.bot()
+        try:
+            result = {'recipients': recipients, 'legacy_per_s': None}
+            if legacy:
+                result['legacy_per_s'] = await run_legacy(bot, min(legacy, recipients))
+                api.delivered.clear()
+                api.requests = api.rate_limited = 0
+            
+            broadcast_model = BroadcastModel(Database(db_path))
+            total = await broadcast_model.count_recipients()
+            broadcast_id = await broadcast_model.create_broadcast(BROADCAST_TEXT, total)
+            
+            start = time.perf_counter()
+            broadcaster = await run_broadcast(bot, broadcast_model, broadcast_id, rate, concurrency, kill_after)
+            elapsed = time.perf_counter() - start
+            
+            result.update({
+                'elapsed_s': elapsed,
+                'per_s': total / elapsed,
+                'sent': broadcaster.sent,
+                'failed': broadcaster.failed,
+                'delivered': len(api.delivered),
+                'duplicates': api.duplicates,
+                'rate_limited': api.rate_limited
+            })
+            return result
+        finally:
+            await bot.session.close()
+            await api.stop()
+            Database.close_all()
+
+def format_result(result):
+    lines = []
+    if result['legacy_per_s'] is not None:
+        hours = result['recipients'] / result['legacy_per_s'] / 3600
+        lines.append(f"Прежний цикл:  {result['legacy_per_s']:.1f} сообщений/с (~{hours:.1f} ч на всех получателей)")
+    lines.append(
+        f"Broadcaster:   {result['recipients']} получателей за {result['elapsed_s']:.1f} с "
+        f"({result['per_s']:.0f} сообщений/с)"
+    )
+    lines.append(
+        f"  отправлено {result['sent']}, ошибок {result['failed']}, ответов 429 {result['rate_limited']}, "
+        f"доставлено пользователям {result['delivered']}, повторных доставок {result['duplicates']}"
+    )
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест рассылки сообщений")
+    parser.add_argument('--recipients', type=int, default=100000)
+    parser.add_argument('--latency', type=float, default=0.02, help="Задержка ответа Bot API (секунды)")
+    parser.add_argument('--rate', type=float, default=BROADCAST_RATE, help="Сообщений в секунду (0 - без ограничения)")
+    parser.add_argument('--concurrency', type=int, default=BROADCAST_CONCURRENCY)
+    parser.add_argument('--blocked', type=float, default=1, help="Процент пользователей, заблокировавших бота")
+    parser.add_argument('--kill-after', type=float, help="Прервать рассылку через заданное время и продолжить")
+    parser.add_argument('--legacy', type=int, default=0, help="Сообщений для замера прежнего цикла")
+    args = parser.parse_args()
+    
+    if args.recipients < 1 or args.concurrency < 1:
+        parser.error("Число получателей и одновременных запросов должно быть положительным")
+    if not 0 <= args.blocked <= 100:
+        parser.error("Процент заблокировавших бота должен быть от 0 до 100")
+    
+    # Предупреждения о каждом заблокировавшем бота пользователе не выводятся
+    logging.getLogger('utils.broadcaster').setLevel(logging.ERROR)
+    
+    result = asyncio.run(run_benchmark(
+        args.recipients, args.latency, args.rate, args.concurrency,
+        args.blocked, args.kill_after, args.legacy
+    ))
+    print(format_result(result))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Модуль фоновой рассылки сообщений пользователям VPN-бота
+Автор: RUCODER (https://рукодер.рф/vpn)
+"""
+
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+
+from config import (
+    COPYRIGHT, BROADCAST_RATE, BROADCAST_CONCURRENCY, BROADCAST_BATCH_SIZE,
+    BROADCAST_PROGRESS_INTERVAL, BROADCAST_MAX_RETRIES
+)
+from database.models import BroadcastModel
+from keyboards.admin_kb import broadcast_progress_kb, back_to_admin_kb
+
+logger = logging.getLogger(__name__)
+
+# Выполняющиеся рассылки {broadcast_id: Broadcaster}
+_running = {}
+
+class TokenBucket:
+    """
+    Ограничитель частоты запросов ("корзина токенов")
+    
+    Токены пополняются со скоростью rate в секунду, но не больше capacity.
+    При ответе 429 корзина приостанавливается на retry_after для всех отправителей.
+    """
+    
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+    
+    def pause(self, seconds):
+        """Приостанавливает выдачу токенов (ограничение Telegram действует на весь бот)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+        self.updated = self.paused_until
+    
+    async def acquire(self):
+        """Ожидает и забирает один токен (при rate <= 0 - только окончания паузы после 429)"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                
+                if self.rate <= 0:
+                    return
+                
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class Broadcaster:
+    def __init__(self, bot, broadcast_model=None, rate=BROADCAST_RATE,
+                 concurrency=BROADCAST_CONCURRENCY, batch_size=BROADCAST_BATCH_SIZE,
+                 progress_interval=BROADCAST_PROGRESS_INTERVAL):
+        self.bot = bot
+        self.broadcast_model = broadcast_model or BroadcastModel()
+        self.bucket = TokenBucket(rate)
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.progress_interval = progress_interval
+        self.cancelled = False
+        self.broadcast_id = None
+        self.chat_id = None
+        self.message_id = None
+        self.total = 0
+        self.sent = 0
+        self.failed = 0
+        # Фоновая задача рассылки (задается при запуске через _start_task)
+        self.task = None
+    
+    def cancel(self):
+        """Останавливает рассылку после текущей порции"""
+        self.cancelled = True
+    
+    async def send(self, user_id, text, semaphore):
+        """
+        Отправляет сообщение одному пользователю с повтором при 429 и сетевых ошибках
+        
+        Returns:
+            True, если сообщение доставлено
+        """
+        async with semaphore:
+            for attempt in range(BROADCAST_MAX_RETRIES + 1):
+                await self.bucket.acquire()
+                try:
+                    await self.bot.send_message(user_id, text)
+                    self.sent += 1
+                    return True
+                except TelegramRetryAfter as e:
+                    logger.warning(f"Превышен лимит Telegram при рассылке, пауза {e.retry_after} с")
+                    self.bucket.pause(e.retry_after)
+                except (TelegramForbiddenError, TelegramBadRequest) as e:
+                    # Пользователь заблокировал бота или чат не существует - повтор не поможет
+                    logger.warning(f"Не удалось отправить сообщение пользователю {user_id}: {e}")
+                    self.failed += 1
+                    return False
+                except Exception as e:
+                    logger.error(f"Ошибка при отправке сообщения пользователю {user_id}: {e}")
+                    await asyncio.sleep(2 ** attempt)
+            
+            self.failed += 1
+            return False
+    
+    def progress_text(self, status):
+        """Формирует текст сообщения о ходе рассылки"""
+        if status == "running":
+            done = self.sent + self.failed
+            percent = done * 100 // self.total if self.total else 100
+            return (
+                f"⏳ Рассылка #{self.broadcast_id}: {done}/{self.total} ({percent}%)\n\n"
+                f"  ✓ Успешно отправлено: {self.sent}\n"
+                f"  ✗ Ошибок отправки: {self.failed}\n"
+            )
+        
+        title = "✅ Рассылка завершена" if status == "completed" else "⏹ Рассылка остановлена"
+        return (
+            f"{title}\n\n"
+            f"📊 Результаты:\n"
+            f"  ✓ Успешно отправлено: {self.sent}\n"
+            f"  ✗ Ошибок отправки: {self.failed}\n"
+        )
+    
+    async def report(self, status="running"):
+        """Обновляет сообщение администратора о ходе рассылки"""
+        if not self.chat_id or not self.message_id:
+            return
+        
+        reply_markup = broadcast_progress_kb(self.broadcast_id) if status == "running" else back_to_admin_kb()
+        
+        try:
+            await self.bot.edit_message_text(
+                self.progress_text(status),
+                chat_id=self.chat_id,
+                message_id=self.message_id,
+                reply_markup=reply_markup
+            )
+        except Exception as e:
+            logger.debug(f"Не удалось обновить сообщение о ходе рассылки: {e}")
+    
+    async def progress_loop(self):
+        """Периодически обновляет сообщение о ходе рассылки"""
+        reported = None
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            # Одинаковый текст Telegram отклоняет, поэтому без изменений сообщение не редактируется
+            if reported != (self.sent, self.failed):
+                reported = (self.sent, self.failed)
+                await self.report()
+    
+    async def run(self, broadcast_id):
+        """Выполняет (или продолжает после перезапуска) задание рассылки"""
+        job = await self.broadcast_model.get_broadcast(broadcast_id)
+        if not job:
+            return
+        
+        _, raw_text, _, self.chat_id, self.message_id, last_client_id, self.total, self.sent, self.failed = job
+        self.broadcast_id = broadcast_id
+        text = f"📣 Сообщение от администратора RuCoder VPN:\n\n{raw_text}\n\n{COPYRIGHT}"
+        
+        # Пользователи с несколькими клиентами получают сообщение один раз
+        notified = set(await self.broadcast_model.get_notified_users(last_client_id)) if last_client_id else set()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        
+        logger.info(f"Рассылка #{broadcast_id}: начало с клиента {last_client_id}, получателей {self.total}")
+        
+        progress_task = asyncio.create_task(self.progress_loop())
+        try:
+            while not self.cancelled:
+                batch = await self.broadcast_model.get_recipients(last_client_id, self.batch_size)
+                if not batch:
+                    break
+                
+                recipients = []
+                for _, user_id in batch:
+                    if user_id not in notified:
+                        notified.add(user_id)
+                        recipients.append(user_id)
+                
+                await asyncio.gather(*(self.send(user_id, text, semaphore) for user_id in recipients))
+                last_client_id = batch[-1][0]
+                
+                # Позиция сохраняется после порции: при сбое повторно отправится не больше одной порции
+                await self.broadcast_model.save_progress(broadcast_id, last_client_id, self.sent, self.failed)
+        finally:
+            progress_task.cancel()
+        
+        status = "cancelled" if self.cancelled else "completed"
+        await self.broadcast_model.set_status(broadcast_id, status)
+        await self.report(status)
+        
+        logger.info(f"Рассылка #{broadcast_id} {status}: отправлено {self.sent}, ошибок {self.failed}")
+
+async def _run_broadcast(broadcaster, broadcast_id):
+    try:
+        await broadcaster.run(broadcast_id)
+    except asyncio.CancelledError:
+        # Задание остается в статусе running и будет продолжено при следующем запуске
+        logger.info(f"Рассылка #{broadcast_id} прервана остановкой бота")
+    except Exception as e:
+        logger.error(f"Ошибка при выполнении рассылки #{broadcast_id}: {e}")
+    finally:
+        _running.pop(broadcast_id, None)
+
+def _start_task(broadcaster, broadcast_id):
+    _running[broadcast_id] = broadcaster
+    broadcaster.task = asyncio.create_task(_run_broadcast(broadcaster, broadcast_id))
+
+async def start_broadcast(bot, text, chat_id=None, message_id=None):
+    """
+    Создает задание рассылки и запускает его в фоне
+    
+    Args:
+        bot: Экземпляр бота
+        text: Текст рассылки
+        chat_id, message_id: Сообщение, в котором отображается ход рассылки
+    
+    Returns:
+        ID задания или None, если получателей нет
+    """
+    broadcast_model = BroadcastModel()
+    total = await broadcast_model.count_recipients()
+    if not total:
+        return None
+    
+    broadcast_id = await broadcast_model.create_broadcast(text, total, chat_id, message_id)
+    
+    broadcaster = Broadcaster(bot, broadcast_model)
+    broadcaster.broadcast_id, broadcaster.total = broadcast_id, total
+    broadcaster.chat_id, broadcaster.message_id = chat_id, message_id
+    await broadcaster.report()
+    
+    _start_task(broadcaster, broadcast_id)
+    
+    return broadcast_id
+
+def cancel_broadcast(broadcast_id):
+    """Останавливает выполняющуюся рассылку"""
+    broadcaster = _running.get(broadcast_id)
+    if broadcaster is None:
+        return False
+    broadcaster.cancel()
+    return True
+
+async def resume_broadcasts(bot):
+    """Продолжает рассылки, прерванные перезапуском бота"""
+    try:
+        for job in await BroadcastModel().get_running_broadcasts():
+            if job[0] not in _running:
+                logger.info(f"Продолжение рассылки #{job[0]} после перезапуска")
+                _start_task(Broadcaster(bot), job[0])
+    except Exception as e:
+        logger.error(f"Ошибка при возобновлении рассылок: {e}")
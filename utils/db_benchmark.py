@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Нагрузочный тест доступа к базе данных для VPN-бота
+Автор: RUCODER (https://рукодер.рф/vpn)
+
+Имитирует одновременные обращения пользователей (несколько запросов клиента
+на одно обновление) на фоне выгрузки полного списка клиентов администраторами
+и измеряет число обработанных обновлений в секунду и максимальную задержку
+цикла событий. Сравниваются пул соединений Database и прежняя схема - новое
+соединение на каждый запрос прямо в цикле событий. Тест работает с отдельной
+временной базой.
+
+Запуск из каталога бота:
+    python -m utils.db_benchmark --users 1000 --lookups 5 --clients 50000 --listings 20
+"""
+
+import os
+import time
+import sqlite3
+import asyncio
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+from config import DB_TIMEOUT
+from database.migrations import run_migrations
+from database.models import Database, ClientModel
+from init_db import init_db
+
+# Интервал проверки задержки цикла событий (секунды)
+STALL_PROBE_INTERVAL = 0.005
+# Первый ID пользователя Telegram у тестовых клиентов
+FIRST_USER_ID = 1_000_000
+
+class ConnectPerCallDatabase(Database):
+    """Прежняя схема: новое соединение на каждый запрос в потоке цикла событий"""
+    
+    async def run(self, func, *args):
+        conn = sqlite3.connect(self.db_path, timeout=DB_TIMEOUT)
+        try:
+            return func(conn, *args)
+        finally:
+            conn.close()
+
+def populate(db_path, clients):
+    """Заполняет таблицу clients тестовыми клиентами"""
+    now = datetime.now()
+    create_date = now.strftime("%Y-%m-%d %H:%M:%S")
+    expiry_date = (now + timedelta(days=30)).strftime("%Y-%m-%d %H:%M:%S")
+    
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.executemany(
+            "INSERT INTO clients (name, user_id, create_date, expiry_date, is_active, public_key) "
+            "VALUES (?, ?, ?, ?, 1, ?)",
+            (
+                (f"bench{i}", FIRST_USER_ID + i, create_date, expiry_date, f"{i:043d}=")
+                for i in range(clients)
+            )
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+async def _watch_loop(stalls, stop):
+    """Записывает задержки пробуждения цикла событий сверх STALL_PROBE_INTERVAL"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(STALL_PROBE_INTERVAL)
+        stalls.append(time.perf_counter() - start - STALL_PROBE_INTERVAL)
+
+async def run_benchmark(db, users, lookups, clients, listings):
+    """
+    Выполняет нагрузку на базу через модель клиентов
+    
+    Returns:
+        Словарь с числом обновлений в секунду, временем до окончания всех выгрузок
+        списка (секунды) и максимальной задержкой цикла событий (мс)
+    """
+    model = ClientModel(db)
+    
+    async def handle_update(i):
+        user_id = FIRST_USER_ID + (i * 7919) % clients
+        for _ in range(lookups):
+            await model.get_client_by_user_id(user_id)
+    
+    stalls = []
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(_watch_loop(stalls, stop))
+    
+    start = time.perf_counter()
+    listing_tasks = [asyncio.create_task(model.get_all_clients()) for _ in range(listings)]
+    await asyncio.gather(*(handle_update(i) for i in range(users)))
+    updates_elapsed = time.perf_counter() - start
+    await asyncio.gather(*listing_tasks)
+    listings_elapsed = time.perf_counter() - start
+    
+    stop.set()
+    await watcher
+    
+    return {
+        'updates_per_s': users / updates_elapsed,
+        'listings_s': listings_elapsed,
+        'stall_max_ms': max(stalls, default=0) * 1000
+    }
+
+async def run_all(users, lookups, clients, listings, modes):
+    with tempfile.TemporaryDirectory(prefix='dbbench-') as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'vpn_bot.db')
+        init_db(db_path)
+        await run_migrations(db_path)
+        populate(db_path, clients)
+        
+        results = {}
+        try:
+            for mode in modes:
+                db = ConnectPerCallDatabase(db_path) if mode == 'connect' else Database(db_path)
+                results[mode] = await run_benchmark(db, users, lookups, clients, listings)
+        finally:
+            Database.close_all()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест доступа к базе данных")
+    parser.add_argument('--users', type=int, default=1000, help="Одновременных обновлений пользователей")
+    parser.add_argument('--lookups', type=int, default=5, help="Запросов к базе на одно обновление")
+    parser.add_argument('--clients', type=int, default=50000, help="Клиентов в базе")
+    parser.add_argument('--listings', type=int, default=20, help="Одновременных выгрузок списка клиентов")
+    parser.add_argument('--mode', choices=('connect', 'pool'), nargs='+', default=['connect', 'pool'])
+    args = parser.parse_args()
+    
+    if min(args.users, args.lookups, args.clients) < 1 or args.listings < 0:
+        parser.error("Параметры нагрузки должны быть положительными")
+    
+    results = asyncio.run(run_all(args.users, args.lookups, args.clients, args.listings, args.mode))
+    for mode, result in results.items():
+        print(
+            f"{mode:<8} {result['updates_per_s']:8.0f} обновлений/с, "
+            f"выгрузки списка за {result['listings_s']:.1f} с, "
+            f"задержка цикла событий до {result['stall_max_ms']:.0f} мс"
+        )
+
+if __name__ == "__main__":
+    main()
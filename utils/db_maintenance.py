@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Модуль обслуживания базы данных для VPN-бота
+Автор: RUCODER (https://рукодер.рф/vpn)
+"""
+
+import asyncio
+import logging
+
+from config import DB_CHECKPOINT_INTERVAL
+from database.models import Database, SettingsModel
+
+logger = logging.getLogger(__name__)
+
+class CheckpointScheduler:
+    def __init__(self, db=None):
+        self.db = db or Database()
+        self.settings_model = SettingsModel(self.db)
+    
+    async def get_interval(self):
+        """Получает интервал контрольных точек из настроек (минуты)"""
+        try:
+            value = await self.settings_model.get_setting('db_checkpoint_interval')
+            return int(value) if value is not None else DB_CHECKPOINT_INTERVAL
+        except Exception as e:
+            logger.error(f"Ошибка при чтении настройки db_checkpoint_interval: {e}")
+            return DB_CHECKPOINT_INTERVAL
+    
+    async def checkpoint_once(self):
+        """Выполняет одну контрольную точку журнала WAL"""
+        try:
+            busy, wal_pages, checkpointed = await self.db.checkpoint()
+            logger.debug(f"Контрольная точка WAL: страниц в журнале {wal_pages}, перенесено {checkpointed}")
+            if busy:
+                logger.warning("Контрольная точка WAL выполнена не полностью: база данных занята")
+        except Exception as e:
+            logger.error(f"Ошибка при выполнении контрольной точки WAL: {e}")
+    
+    async def start_checkpoint_loop(self):
+        """Запускает цикл контрольных точек"""
+        logger.info("Запуск планировщика контрольных точек базы данных")
+        
+        try:
+            while True:
+                # Настройка перечитывается каждый цикл, чтобы её можно было менять без перезапуска
+                interval = await self.get_interval()
+                
+                if interval <= 0:
+                    await asyncio.sleep(60)
+                    continue
+                
+                await asyncio.sleep(interval * 60)
+                await self.checkpoint_once()
+        except asyncio.CancelledError:
+            logger.info("Планировщик контрольных точек базы данных остановлен")
+
+async def start_checkpoint_scheduler():
+    """Запускает планировщик контрольных точек WAL"""
+    scheduler = CheckpointScheduler()
+    await scheduler.start_checkpoint_loop()
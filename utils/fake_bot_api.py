@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Локальная замена Bot API Telegram для нагрузочных тестов VPN-бота
+Автор: RUCODER (https://рукодер.рф/vpn)
+
+Сервер aiohttp отвечает на запросы бота с заданной задержкой, как api.telegram.org:
+sendMessage возвращает сообщение, для заблокированных пользователей - ошибку 403,
+на выбранные по номеру запросы - ошибку 429 с retry_after. Обновления, добавленные
+push_update, выдаются через getUpdates (long polling) или, после setWebhook,
+отправляются на адрес бота не более чем max_connections запросами одновременно.
+Остальные методы отвечают true.
+"""
+
+import time
+import asyncio
+import logging
+from collections import Counter, deque
+
+import aiohttp
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+logger = logging.getLogger(__name__)
+
+# Токен тестового бота (сервер его не проверяет)
+BENCH_TOKEN = "123456789:AAbenchmarkbenchmarkbenchmarkbench"
+# Максимум обновлений в ответе getUpdates (как у Telegram)
+GET_UPDATES_LIMIT = 100
+
+class FakeBotAPI:
+    def __init__(self, latency=0.02, blocked=None, retry_after_at=(), retry_after=1):
+        """
+        Args:
+            latency: Задержка ответа на каждый запрос (секунды); для getUpdates и
+                webhook - задержка сети в одну сторону
+            blocked: Функция chat_id -> True для пользователей, заблокировавших бота
+            retry_after_at: Номера запросов sendMessage (с 1), на которые отвечать 429
+            retry_after: Значение retry_after в ответе 429 (секунды)
+        """
+        self.latency = latency
+        self.blocked = blocked or (lambda chat_id: False)
+        self.retry_after_at = set(retry_after_at)
+        self.retry_after = retry_after
+        self.requests = 0
+        self.rate_limited = 0
+        # Доставленные сообщения {chat_id: количество}
+        self.delivered = Counter()
+        self.base_url = None
+        self._runner = None
+        # Обновления, еще не подтвержденные ботом через offset getUpdates
+        self._updates = deque()
+        self._updates_ready = asyncio.Event()
+        self._next_update_id = 1
+        self.get_updates_calls = 0
+        # Отправка обновлений на webhook
+        self._webhook_queue = None
+        self._webhook_tasks = []
+        self._webhook_session = None
+        self.webhook_errors = 0
+    
+    @property
+    def duplicates(self):
+        """Число повторно доставленных сообщений"""
+        return sum(count - 1 for count in self.delivered.values() if count > 1)
+    
+    async def start(self, host='127.0.0.1', port=0):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+    
+    async def stop(self):
+        await self._stop_webhook()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+    
+    def bot(self, token=BENCH_TOKEN):
+        """Создает бота, отправляющего запросы на этот сервер"""
+        session = AiohttpSession(api=TelegramAPIServer.from_base(self.base_url))
+        return Bot(token, session=session)
+    
+    @staticmethod
+    def _error(status, description, **parameters):
+        body = {"ok": False, "error_code": status, "description": description}
+        if parameters:
+            body["parameters"] = parameters
+        return web.json_response(body, status=status)
+    
+    async def handle(self, request):
+        method = request.match_info['method']
+        data = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        
+        handler = getattr(self, f"on_{method}", None)
+        if handler is None:
+            return web.json_response({"ok": True, "result": True})
+        return await handler(data)
+    
+    def push_update(self, update):
+        """Добавляет обновление (update_id назначается сервером)"""
+        update['update_id'] = self._next_update_id
+        self._next_update_id += 1
+        
+        if self._webhook_queue is not None:
+            self._webhook_queue.put_nowait(update)
+        else:
+            self._updates.append(update)
+            self._updates_ready.set()
+    
+    async def on_getMe(self, data):
+        return web.json_response({
+            "ok": True,
+            "result": {"id": int(BENCH_TOKEN.split(':')[0]), "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        })
+    
+    async def on_getUpdates(self, data):
+        self.get_updates_calls += 1
+        offset = int(data.get('offset', 0))
+        limit = min(int(data.get('limit', GET_UPDATES_LIMIT)), GET_UPDATES_LIMIT)
+        timeout = float(data.get('timeout', 0))
+        
+        # Обновления до offset подтверждены ботом
+        while self._updates and self._updates[0]['update_id'] < offset:
+            self._updates.popleft()
+        
+        if not self._updates and timeout:
+            self._updates_ready.clear()
+            try:
+                await asyncio.wait_for(self._updates_ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        
+        updates = [self._updates[i] for i in range(min(limit, len(self._updates)))]
+        # Ответ идет до бота
+        await asyncio.sleep(self.latency)
+        return web.json_response({"ok": True, "result": updates})
+    
+    async def on_setWebhook(self, data):
+        await self._stop_webhook()
+        
+        url = data['url']
+        max_connections = int(data.get('max_connections', 40))
+        headers = {}
+        if data.get('secret_token'):
+            headers['X-Telegram-Bot-Api-Secret-Token'] = data['secret_token']
+        
+        self._webhook_queue = asyncio.Queue()
+        for update in self._updates:
+            self._webhook_queue.put_nowait(update)
+        self._updates.clear()
+        
+        self._webhook_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=max_connections))
+        self._webhook_tasks = [
+            asyncio.create_task(self._deliver_webhook(url, headers)) for _ in range(max_connections)
+        ]
+        return web.json_response({"ok": True, "result": True})
+    
+    async def on_deleteWebhook(self, data):
+        await self._stop_webhook()
+        if data.get('drop_pending_updates') == 'true':
+            self._updates.clear()
+        return web.json_response({"ok": True, "result": True})
+    
+    async def _deliver_webhook(self, url, headers):
+        """Отправляет обновления по одному соединению (запрос и ответ идут с задержкой latency)"""
+        while True:
+            update = await self._webhook_queue.get()
+            await asyncio.sleep(self.latency)
+            try:
+                async with self._webhook_session.post(url, json=update, headers=headers) as response:
+                    await response.read()
+                    if response.status != 200:
+                        self.webhook_errors += 1
+            except aiohttp.ClientError as e:
+                self.webhook_errors += 1
+                logger.warning(f"Не удалось отправить обновление на webhook: {e}")
+            await asyncio.sleep(self.latency)
+    
+    async def _stop_webhook(self):
+        for task in self._webhook_tasks:
+            task.cancel()
+        await asyncio.gather(*self._webhook_tasks, return_exceptions=True)
+        self._webhook_tasks = []
+        
+        if self._webhook_queue is not None:
+            # Неотправленные обновления снова доступны через getUpdates
+            while not self._webhook_queue.empty():
+                self._updates.append(self._webhook_queue.get_nowait())
+            self._webhook_queue = None
+        
+        if self._webhook_session is not None:
+            await self._webhook_session.close()
+            self._webhook_session = None
+    
+    async def on_sendMessage(self, data):
+        self.requests += 1
+        chat_id = int(data['chat_id'])
+        
+        if self.requests in self.retry_after_at:
+            self.rate_limited += 1
+            return self._error(
+                429, f"Too Many Requests: retry after {self.retry_after}", retry_after=self.retry_after
+            )
+        if self.blocked(chat_id):
+            return self._error(403, "Forbidden: bot was blocked by the user")
+        
+        self.delivered[chat_id] += 1
+        return web.json_response({
+            "ok": True,
+            "result": {
+                "message_id": self.requests,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": data.get('text', '')
+            }
+        })
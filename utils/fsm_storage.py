@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Хранилище состояний FSM в базе данных для VPN-бота
+Автор: RUCODER (https://рукодер.рф/vpn)
+"""
+
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+
+from config import FSM_CACHE_SIZE, FSM_FLUSH_INTERVAL, FSM_STATE_TTL
+from database.models import FSMStateModel
+
+logger = logging.getLogger(__name__)
+
+# Период удаления устаревших состояний из базы данных (секунды)
+CLEANUP_INTERVAL = 60 * 60
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище состояний FSM в таблице fsm_states
+    
+    Состояния читаются из кеша в памяти (LRU, не более cache_size записей),
+    изменения накапливаются и записываются в базу одной транзакцией раз в
+    flush_interval секунд. Состояния, не изменявшиеся дольше ttl секунд,
+    считаются пустыми и удаляются.
+    """
+    
+    def __init__(self, model=None, cache_size=FSM_CACHE_SIZE, flush_interval=FSM_FLUSH_INTERVAL, ttl=FSM_STATE_TTL):
+        self.model = model or FSMStateModel()
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        # Записи [state, data, updated_at] по ключу (порядок - давность использования)
+        self._cache = OrderedDict()
+        # Измененные, но еще не записанные в базу записи
+        self._dirty = {}
+        self._task = None
+        self._last_cleanup = 0
+    
+    @staticmethod
+    def _key(key):
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+    
+    def _remember(self, key, record):
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        # Вытесняемые записи с незаписанными изменениями остаются в _dirty до записи
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+    
+    def _ensure_task(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+    
+    async def _get_record(self, key):
+        self._ensure_task()
+        now = int(time.time())
+        
+        record = self._cache.get(key) or self._dirty.get(key)
+        if record is None:
+            row = await self.model.get_record(key, now - self.ttl)
+            # Пока шла загрузка, запись могла появиться в кеше
+            record = self._cache.get(key) or self._dirty.get(key)
+            if record is None:
+                record = [row[0], json.loads(row[1]), row[2]] if row else [None, {}, now]
+        elif record[2] < now - self.ttl:
+            record[:] = [None, {}, now]
+            self._dirty[key] = record
+        
+        self._remember(key, record)
+        return record
+    
+    async def set_state(self, key, state=None):
+        key = self._key(key)
+        record = await self._get_record(key)
+        record[0] = state.state if isinstance(state, State) else state
+        record[2] = int(time.time())
+        self._dirty[key] = record
+    
+    async def get_state(self, key):
+        record = await self._get_record(self._key(key))
+        return record[0]
+    
+    async def set_data(self, key, data):
+        key = self._key(key)
+        record = await self._get_record(key)
+        record[1] = data.copy()
+        record[2] = int(time.time())
+        self._dirty[key] = record
+    
+    async def get_data(self, key):
+        record = await self._get_record(self._key(key))
+        return record[1].copy()
+    
+    async def flush(self):
+        """Записывает накопленные изменения в базу данных"""
+        if not self._dirty:
+            return
+        
+        batch, self._dirty = self._dirty, {}
+        upserts, deletes = [], []
+        for key, (state, data, updated_at) in batch.items():
+            if state is None and not data:
+                deletes.append((key,))
+            else:
+                upserts.append((key, state, json.dumps(data, ensure_ascii=False), updated_at))
+        
+        try:
+            await self.model.save_records(upserts, deletes)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении состояний FSM: {e}")
+            # Записи, не измененные за время записи, повторяются в следующем цикле
+            for key, record in batch.items():
+                self._dirty.setdefault(key, record)
+    
+    async def cleanup(self):
+        """Удаляет устаревшие состояния из памяти и базы данных"""
+        before = int(time.time()) - self.ttl
+        for key in [key for key, record in self._cache.items() if record[2] < before and key not in self._dirty]:
+            del self._cache[key]
+        
+        try:
+            deleted = await self.model.delete_expired(before)
+            if deleted:
+                logger.info(f"Удалено устаревших состояний FSM: {deleted}")
+        except Exception as e:
+            logger.error(f"Ошибка при удалении устаревших состояний FSM: {e}")
+    
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            
+            if time.monotonic() - self._last_cleanup >= CLEANUP_INTERVAL:
+                self._last_cleanup = time.monotonic()
+                await self.cleanup()
+    
+    async def close(self):
+        """Останавливает фоновую запись и сохраняет оставшиеся изменения"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        
+        await self.flush()
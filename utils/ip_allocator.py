@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Модуль выделения IP-адресов клиентам WireGuard
+Автор: RUCODER (https://рукодер.рф/vpn)
+"""
+
+import os
+import logging
+import threading
+import ipaddress
+
+from config import WG_SUBNET, WG_IP_POOL_PATH
+
+logger = logging.getLogger(__name__)
+
+# Максимальный размер битовой карты (для больших подсетей IPv6 используется её начало)
+MAX_POOL_SIZE = 1 << 20
+
+class IPAllocator:
+    """
+    Выделяет адреса из подсети по битовой карте, сохранённой на диске.
+    
+    Бит N карты соответствует адресу network_address + N. Выделение и освобождение
+    адреса меняют один байт карты и один байт файла.
+    """
+    
+    def __init__(self, subnet=WG_SUBNET, pool_path=WG_IP_POOL_PATH, used_ips=None):
+        """
+        Args:
+            subnet: Подсеть клиентов
+            pool_path: Путь к файлу битовой карты
+            used_ips: Функция, возвращающая уже занятые адреса (вызывается, только
+                если сохранённой карты нет или она создана для другой подсети)
+        """
+        self.network = ipaddress.ip_network(subnet, strict=False)
+        self.pool_path = pool_path
+        self.used_ips = used_ips
+        self.size = min(self.network.num_addresses, MAX_POOL_SIZE)
+        self.host_prefix = self.network.max_prefixlen
+        self._header = f"{self.network}\n".encode('ascii')
+        self._bitmap = None
+        self._free = []
+        self._hint = 0
+        self._lock = threading.Lock()
+    
+    @property
+    def server_address(self):
+        """Адрес сервера в подсети (первый адрес после адреса сети)"""
+        return self.network.network_address + 1
+    
+    @property
+    def server_interface_address(self):
+        """Адрес интерфейса сервера с маской подсети (для секции [Interface])"""
+        return f"{self.server_address}/{self.network.prefixlen}"
+    
+    def _reserved_offsets(self):
+        """Адреса, которые никогда не выдаются клиентам"""
+        reserved = {0, 1}  # Адрес сети и адрес сервера
+        if self.network.version == 4 and self.size == self.network.num_addresses:
+            reserved.add(self.size - 1)  # Широковещательный адрес
+        return reserved
+    
+    def _offset(self, ip):
+        """Возвращает номер бита для адреса или None, если адрес вне пула"""
+        address = ipaddress.ip_address(str(ip).split('/')[0])
+        if address.version != self.network.version or address not in self.network:
+            return None
+        offset = int(address) - int(self.network.network_address)
+        return offset if offset < self.size else None
+    
+    def _is_set(self, offset):
+        return self._bitmap[offset >> 3] & (1 << (offset & 7))
+    
+    def _write_byte(self, index):
+        """Сохраняет на диск один изменённый байт карты"""
+        with open(self.pool_path, 'r+b') as f:
+            f.seek(len(self._header) + index)
+            f.write(self._bitmap[index:index + 1])
+    
+    def _set(self, offset, used):
+        index = offset >> 3
+        if used:
+            self._bitmap[index] |= 1 << (offset & 7)
+        else:
+            self._bitmap[index] &= ~(1 << (offset & 7)) & 0xFF
+        self._write_byte(index)
+    
+    def _save(self):
+        """Полностью перезаписывает файл карты (атомарно)"""
+        tmp_path = f"{self.pool_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(self._header)
+            f.write(self._bitmap)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.pool_path)
+    
+    def load(self):
+        """Загружает карту с диска или строит её заново"""
+        with self._lock:
+            self._load_locked()
+    
+    def _load_locked(self):
+        bitmap_len = (self.size + 7) // 8
+        
+        try:
+            with open(self.pool_path, 'rb') as f:
+                data = f.read()
+            if data.startswith(self._header) and len(data) == len(self._header) + bitmap_len:
+                self._bitmap = bytearray(data[len(self._header):])
+                self._free = []
+                self._hint = 0
+                return
+            logger.warning(f"Карта адресов {self.pool_path} создана для другой подсети, перестраиваем")
+        except FileNotFoundError:
+            pass
+        
+        self._bitmap = bytearray(bitmap_len)
+        self._free = []
+        self._hint = 0
+        
+        for offset in self._reserved_offsets():
+            self._bitmap[offset >> 3] |= 1 << (offset & 7)
+        
+        for ip in (self.used_ips() if self.used_ips else []):
+            offset = self._offset(ip)
+            if offset is not None:
+                self._bitmap[offset >> 3] |= 1 << (offset & 7)
+        
+        self._save()
+    
+    def rebuild(self):
+        """Строит карту заново по текущему списку занятых адресов"""
+        with self._lock:
+            try:
+                os.remove(self.pool_path)
+            except FileNotFoundError:
+                pass
+            self._load_locked()
+    
+    def _ensure_loaded(self):
+        if self._bitmap is None:
+            self._load_locked()
+    
+    def _find_free(self):
+        """Ищет свободный бит, начиная с подсказки (амортизированно O(1))"""
+        while self._free:
+            offset = self._free.pop()
+            if not self._is_set(offset):
+                return offset
+        
+        index = self._hint >> 3
+        bitmap_len = len(self._bitmap)
+        while index < bitmap_len and self._bitmap[index] == 0xFF:
+            index += 1
+        
+        while index < bitmap_len:
+            byte = self._bitmap[index]
+            if byte != 0xFF:
+                bit = (~byte & (byte + 1)).bit_length() - 1
+                offset = (index << 3) + bit
+                if offset >= self.size:
+                    break
+                self._hint = offset + 1
+                return offset
+            index += 1
+        
+        self._hint = self.size
+        return None
+    
+    def allocate(self):
+        """
+        Выделяет свободный адрес
+        
+        Returns:
+            Адрес с маской хоста (например, 10.0.0.2/32) или None, если подсеть заполнена
+        """
+        with self._lock:
+            self._ensure_loaded()
+            offset = self._find_free()
+            if offset is None:
+                return None
+            self._set(offset, True)
+            return f"{self.network.network_address + offset}/{self.host_prefix}"
+    
+    def reserve(self, ip):
+        """Отмечает адрес как занятый (например, при ручном изменении IP клиента)"""
+        with self._lock:
+            self._ensure_loaded()
+            offset = self._offset(ip)
+            if offset is not None and not self._is_set(offset):
+                self._set(offset, True)
+    
+    def release(self, ip):
+        """Освобождает адрес для повторного использования"""
+        with self._lock:
+            self._ensure_loaded()
+            offset = self._offset(ip)
+            if offset is None or offset in self._reserved_offsets() or not self._is_set(offset):
+                return
+            self._set(offset, False)
+            self._free.append(offset)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Нагрузочный тест выделения IP-адресов клиентам WireGuard
+Автор: RUCODER (https://рукодер.рф/vpn)
+
+Сравнивает IPAllocator с прежним способом - поиском свободного адреса
+регулярным выражением по всем строкам AllowedIPs файла wg0.conf при каждом
+выделении. Конфигурация сервера с заданным числом пиров и карта адресов
+создаются во временном каталоге, рабочие файлы бота не затрагиваются.
+
+Запуск из каталога бота:
+    python -m utils.ip_allocator_benchmark --peers 60000 --subnet 10.8.0.0/16
+"""
+
+import os
+import re
+import time
+import socket
+import argparse
+import tempfile
+import ipaddress
+from statistics import mean
+
+from utils.ip_allocator import IPAllocator
+from utils.wg_config import WireGuardConfig
+
+# Адреса IPv4 из строк AllowedIPs конфигурации сервера
+ALLOWED_IPS_RE = re.compile(r'AllowedIPs\s*=\s*(\d+\.\d+\.\d+\.\d+)/32')
+
+def write_server_config(path, network, peers):
+    """Создает конфигурацию сервера с peers клиентами, занимающими первые адреса подсети"""
+    with open(path, 'w') as f:
+        f.write(f"[Interface]\nAddress = {network.network_address + 1}/{network.prefixlen}\nListenPort = 51820\n\n")
+        for i in range(peers):
+            address = network.network_address + 2 + i
+            f.write(
+                f"# Клиент: bench{i}\n[Peer]\n"
+                f"PublicKey = {i:043d}=\n"
+                f"AllowedIPs = {address}/{network.max_prefixlen}\n\n"
+            )
+
+def legacy_next_ip(path, network):
+    """
+    Прежний способ: чтение файла, разбор всех AllowedIPs и поиск первого свободного адреса
+    
+    Прежний код знал только подсеть 10.0.0.0/24, здесь поиск идет по всей подсети IPv4.
+    """
+    with open(path, 'r') as f:
+        config = f.read()
+    
+    used_ips = set(
+        int.from_bytes(socket.inet_aton(match.group(1)), 'big')
+        for match in ALLOWED_IPS_RE.finditer(config)
+    )
+    first = int(network.network_address)
+    for address in range(first + 2, first + network.num_addresses - 1):
+        if address not in used_ips:
+            return f"{ipaddress.ip_address(address)}/32"
+    return None
+
+def run_benchmark(peers, subnet, rounds):
+    network = ipaddress.ip_network(subnet, strict=False)
+    if peers + 3 > network.num_addresses:
+        raise ValueError(f"В подсети {network} нет места для {peers} пиров")
+    
+    with tempfile.TemporaryDirectory(prefix='ipbench-') as tmp_dir:
+        config_path = os.path.join(tmp_dir, 'wg0.conf')
+        write_server_config(config_path, network, peers)
+        
+        # Прежний способ при peers занятых адресах (только IPv4)
+        legacy_ms = None
+        if network.version == 4:
+            timings = []
+            for _ in range(rounds):
+                start = time.perf_counter()
+                legacy_next_ip(config_path, network)
+                timings.append(time.perf_counter() - start)
+            legacy_ms = mean(timings) * 1000
+        
+        # Построение карты по конфигурации сервера (первый запуск или смена подсети)
+        config = WireGuardConfig(config_path)
+        allocator = IPAllocator(subnet, os.path.join(tmp_dir, 'ip_pool.bin'), used_ips=config.all_ips)
+        start = time.perf_counter()
+        allocator.load()
+        build_s = time.perf_counter() - start
+        
+        # Освобождение и повторное выделение при peers занятых адресах
+        used = [f"{network.network_address + 2 + i}/{network.max_prefixlen}" for i in range(0, peers, max(1, peers // rounds))]
+        start = time.perf_counter()
+        for ip in used:
+            allocator.release(ip)
+            allocator.allocate()
+        reuse_us = (time.perf_counter() - start) / len(used) * 1_000_000
+        
+        # Выделение peers адресов в пустой карте
+        empty = IPAllocator(subnet, os.path.join(tmp_dir, 'ip_pool_empty.bin'))
+        empty.load()
+        start = time.perf_counter()
+        for _ in range(peers):
+            empty.allocate()
+        fill_s = time.perf_counter() - start
+    
+    return {
+        'peers': peers,
+        'subnet': str(network),
+        'legacy_ms': legacy_ms,
+        'build_s': build_s,
+        'fill_s': fill_s,
+        'fill_us': fill_s / peers * 1_000_000,
+        'reuse_us': reuse_us
+    }
+
+def format_result(result):
+    legacy = f"{result['legacy_ms']:.2f} мс на адрес" if result['legacy_ms'] is not None else "-"
+    return (
+        f"Подсеть {result['subnet']}, пиров {result['peers']}\n"
+        f"  поиск по wg0.conf:            {legacy}\n"
+        f"  построение карты по wg0.conf: {result['build_s']:.2f} с\n"
+        f"  выделение в пустой карте:     {result['fill_s']:.2f} с ({result['fill_us']:.1f} мкс на адрес)\n"
+        f"  освобождение и выделение:     {result['reuse_us']:.1f} мкс"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест выделения IP-адресов")
+    parser.add_argument('--peers', type=int, default=60000, help="Число занятых адресов")
+    parser.add_argument('--subnet', default='10.8.0.0/16')
+    parser.add_argument('--rounds', type=int, default=20, help="Число замеров прежнего способа")
+    args = parser.parse_args()
+    
+    if args.peers < 1 or args.rounds < 1:
+        parser.error("Число пиров и замеров должно быть положительным")
+    
+    try:
+        print(format_result(run_benchmark(args.peers, args.subnet, args.rounds)))
+    except ValueError as e:
+        parser.error(str(e))
+
+if __name__ == "__main__":
+    main()
@@ -7,49 +7,125 @@
 """
 
 import os
+import asyncio
+import hashlib
 import logging
 import qrcode
-import tempfile
 from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from config import QR_CACHE_SIZE, QR_RENDER_PROCESSES
 
 logger = logging.getLogger(__name__)
 
+# Готовые PNG по хешу содержимого {sha256: bytes} (порядок - давность использования)
+_png_cache = OrderedDict()
+# Выполняющиеся отрисовки {ключ: Future}, чтобы одинаковые запросы не рисовали QR-код дважды
+_pending = {}
+# Хеши прочитанных конфигураций {путь: (mtime_ns, size, sha256)}
+_config_digests = {}
+# Пул процессов отрисовки (None - пул потоков цикла событий)
+_render_executor = None
+# Цикл событий, в потоке которого изменяются кеши (OrderedDict не потокобезопасен)
+_cache_loop = None
+
+def render_qr_png(text, error_correction=qrcode.constants.ERROR_CORRECT_M):
+    """
+    Отрисовывает QR-код в PNG (синхронно, вызывается в пуле потоков)
+    
+    Returns:
+        Байты PNG-изображения
+    """
+    # Создаем объект QR-кода
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=error_correction,
+        box_size=10,
+        border=4,
+    )
+    
+    # Добавляем данные
+    qr.add_data(text)
+    qr.make(fit=True)
+    
+    # Создаем изображение и сохраняем его в память
+    img = qr.make_image(fill_color="black", back_color="white")
+    img_io = BytesIO()
+    img.save(img_io, format='PNG')
+    
+    return img_io.getvalue()
+
+def _get_render_executor():
+    """
+    Возвращает пул отрисовки QR-кодов
+    
+    Отрисовка выполняется на Python и держит GIL, поэтому при QR_RENDER_PROCESSES > 0
+    она выносится в отдельные процессы и не замедляет обработку остальных обновлений.
+    """
+    global _render_executor
+    if _render_executor is None and QR_RENDER_PROCESSES > 0:
+        _render_executor = ProcessPoolExecutor(max_workers=QR_RENDER_PROCESSES)
+    return _render_executor
+
+def shutdown_qr_renderer():
+    """Останавливает пул процессов отрисовки (вызывается при остановке бота)"""
+    global _render_executor
+    if _render_executor is not None:
+        _render_executor.shutdown(wait=False, cancel_futures=True)
+        _render_executor = None
+
+def _cache_key(text, error_correction):
+    return hashlib.sha256(f"{error_correction}:{text}".encode('utf-8')).hexdigest()
+
+def _cache_put(key, png):
+    _png_cache[key] = png
+    _png_cache.move_to_end(key)
+    while len(_png_cache) > QR_CACHE_SIZE:
+        _png_cache.popitem(last=False)
+
 async def generate_qr_from_text(text, error_correction=qrcode.constants.ERROR_CORRECT_M):
     """
     Генерирует QR-код из текста
     
+    Одинаковый текст отрисовывается один раз: результат хранится в LRU-кеше
+    по хешу содержимого, а отрисовка выполняется вне цикла событий.
+    
     Args:
         text: Текст для кодирования
         error_correction: Уровень коррекции ошибок
-        
+    
     Returns:
-        Путь к временному файлу с QR-кодом или None в случае ошибки
+        Байты PNG-изображения или None в случае ошибки
     """
+    global _cache_loop
+    _cache_loop = asyncio.get_running_loop()
+    key = _cache_key(text, error_correction)
+    
+    png = _png_cache.get(key)
+    if png is not None:
+        _png_cache.move_to_end(key)
+        return png
+    
+    future = _pending.get(key)
+    if future is None:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(_get_render_executor(), render_qr_png, text, error_correction)
+        _pending[key] = future
+    
     try:
-        # Создаем объект QR-кода
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=error_correction,
-            box_size=10,
-            border=4,
-        )
-        
-        # Добавляем данные
-        qr.add_data(text)
-        qr.make(fit=True)
-        
-        # Создаем изображение
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Сохраняем изображение во временный файл
-        temp_file = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
-        img.save(temp_file.name)
-        temp_file.close()
-        
-        return temp_file.name
+        png = await asyncio.shield(future)
+        _cache_put(key, png)
+        return png
     except Exception as e:
         logger.error(f"Ошибка при генерации QR-кода: {e}")
         return None
+    finally:
+        _pending.pop(key, None)
+
+def _read_config(config_path):
+    with open(config_path, 'r') as f:
+        return f.read()
 
 async def generate_qr_from_config(config_path):
     """
@@ -57,19 +133,36 @@ async def generate_qr_from_config(config_path):
     
     Args:
         config_path: Путь к конфигурационному файлу
-        
+    
     Returns:
-        Путь к временному файлу с QR-кодом или None в случае ошибки
+        Байты PNG-изображения или None в случае ошибки
     """
+    global _cache_loop
+    _cache_loop = asyncio.get_running_loop()
+    
     try:
         # Проверяем существование файла
-        if not os.path.exists(config_path):
+        try:
+            stat = os.stat(config_path)
+        except FileNotFoundError:
             logger.error(f"Файл конфигурации не найден: {config_path}")
             return None
         
+        # Если файл не менялся, QR-код берется из кеша без чтения файла
+        cached = _config_digests.get(config_path)
+        if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            png = _png_cache.get(cached[2])
+            if png is not None:
+                _png_cache.move_to_end(cached[2])
+                return png
+        
         # Читаем конфигурацию
-        with open(config_path, 'r') as f:
-            config_text = f.read()
+        loop = asyncio.get_running_loop()
+        config_text = await loop.run_in_executor(None, _read_config, config_path)
+        
+        _config_digests[config_path] = (
+            stat.st_mtime_ns, stat.st_size, _cache_key(config_text, qrcode.constants.ERROR_CORRECT_M)
+        )
         
         # Генерируем QR-код
         return await generate_qr_from_text(config_text)
@@ -77,45 +170,43 @@ async def generate_qr_from_config(config_path):
         logger.error(f"Ошибка при генерации QR-кода из конфигурации: {e}")
         return None
 
+def _invalidate_config_qr(config_path):
+    cached = _config_digests.pop(config_path, None)
+    if cached:
+        _png_cache.pop(cached[2], None)
+
+def invalidate_config_qr(config_path):
+    """
+    Удаляет из кеша QR-код конфигурации (вызывается после перезаписи файла)
+    
+    При вызове из пула потоков (AsyncVPNManager._run_sync) удаление передается
+    в поток цикла событий и выполняется раньше, чем продолжится ожидающий
+    результата обработчик.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    
+    if _cache_loop is None or _cache_loop is loop or _cache_loop.is_closed():
+        _invalidate_config_qr(config_path)
+    else:
+        _cache_loop.call_soon_threadsafe(_invalidate_config_qr, config_path)
+
 async def get_qr_as_bytes(text_or_config):
     """
     Получает QR-код в виде байтов для отправки в Telegram
     
     Args:
         text_or_config: Текст или путь к конфигурационному файлу
-        
+    
     Returns:
         BytesIO объект с QR-кодом или None в случае ошибки
     """
-    try:
-        # Определяем, является ли input файлом или текстом
-        if os.path.exists(text_or_config):
-            with open(text_or_config, 'r') as f:
-                text = f.read()
-        else:
-            text = text_or_config
-        
-        # Создаем объект QR-кода
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_M,
-            box_size=10,
-            border=4,
-        )
-        
-        # Добавляем данные
-        qr.add_data(text)
-        qr.make(fit=True)
-        
-        # Создаем изображение
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Сохраняем изображение в память
-        img_io = BytesIO()
-        img.save(img_io, format='PNG')
-        img_io.seek(0)
-        
-        return img_io
-    except Exception as e:
-        logger.error(f"Ошибка при получении QR-кода в виде байтов: {e}")
-        return None
+    # Определяем, является ли input файлом или текстом
+    if os.path.exists(text_or_config):
+        png = await generate_qr_from_config(text_or_config)
+    else:
+        png = await generate_qr_from_text(text_or_config)
+    
+    return BytesIO(png) if png is not None else None
@@ -9,7 +9,6 @@
 import asyncio
 import logging
 import psutil
-import subprocess
 import os
 import time
 from datetime import datetime
@@ -19,12 +18,64 @@ from config import (
     CPU_THRESHOLD,
     MEMORY_THRESHOLD,
     DISK_THRESHOLD,
-    ADMIN_IDS
+    ADMIN_IDS,
+    LOOP_LAG_INTERVAL,
+    LOOP_LAG_THRESHOLD,
+    UPDATE_QUEUE_SIZE
 )
 from database.models import ServerMetricsModel, NotificationModel
+from utils.vpn_manager import active_connections
+from utils.update_workers import update_workers
 
 logger = logging.getLogger(__name__)
 
+class LoopLagMonitor:
+    """Измеряет задержку цикла событий asyncio (насколько позже планового просыпается задача)"""
+    
+    def __init__(self, interval=LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._task = None
+    
+    def get_stats(self, reset=False):
+        """
+        Возвращает последнюю и максимальную задержку цикла событий (мс)
+        
+        Args:
+            reset: Начать новое окно для максимального значения
+        """
+        stats = {
+            'loop_lag_ms': round(self.last_lag * 1000, 1),
+            'loop_lag_max_ms': round(self.max_lag * 1000, 1)
+        }
+        if reset:
+            self.max_lag = self.last_lag
+        return stats
+    
+    async def run(self):
+        """Цикл измерения задержки"""
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                started = loop.time()
+                await asyncio.sleep(self.interval)
+                self.last_lag = max(0.0, loop.time() - started - self.interval)
+                self.max_lag = max(self.max_lag, self.last_lag)
+                
+                if self.last_lag > LOOP_LAG_THRESHOLD:
+                    logger.warning(f"Цикл событий заблокирован на {self.last_lag * 1000:.0f} мс")
+        except asyncio.CancelledError:
+            pass
+    
+    def start(self):
+        """Запускает измерение в фоне (повторный вызов ничего не делает)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+# Общий экземпляр, показания которого выводятся в панели мониторинга
+loop_lag_monitor = LoopLagMonitor()
+
 class ServerMonitor:
     def __init__(self, bot=None):
         self.bot = bot
@@ -33,23 +84,37 @@ class ServerMonitor:
         self.previous_network_io = psutil.net_io_counters()
         self.previous_time = time.time()
         self.monitoring_interval = 300  # 5 минут по умолчанию
+        # Первый вызов без интервала только запоминает счётчики CPU
+        psutil.cpu_percent(interval=None)
+    
+    async def count_wireguard_peers(self):
+        """Получает количество подключений WireGuard из общего снимка wg show"""
+        try:
+            return len(await active_connections.get())
+        except Exception as e:
+            logger.error(f"Ошибка при получении активных подключений: {e}")
+            return 0
+    
+    def _collect_psutil_metrics(self):
+        """Собирает метрики psutil (выполняется в пуле потоков)"""
+        # Загрузка CPU с момента предыдущего вызова, без ожидания
+        cpu_usage = psutil.cpu_percent(interval=None)
+        memory_usage = psutil.virtual_memory().percent
+        disk_usage = psutil.disk_usage('/').percent
+        network_io = psutil.net_io_counters()
+        return cpu_usage, memory_usage, disk_usage, network_io
     
     async def get_system_metrics(self):
         """Получает текущие метрики системы"""
         try:
-            # CPU использование
-            cpu_usage = psutil.cpu_percent(interval=1)
-            
-            # Использование памяти
-            memory = psutil.virtual_memory()
-            memory_usage = memory.percent
+            loop = asyncio.get_running_loop()
             
-            # Использование диска
-            disk = psutil.disk_usage('/')
-            disk_usage = disk.percent
+            # CPU, память, диск и сеть собираются вне цикла событий
+            cpu_usage, memory_usage, disk_usage, current_network_io = await loop.run_in_executor(
+                None, self._collect_psutil_metrics
+            )
             
             # Сетевой трафик (разница с предыдущим измерением)
-            current_network_io = psutil.net_io_counters()
             current_time = time.time()
             
             time_diff = current_time - self.previous_time
@@ -61,23 +126,9 @@ class ServerMonitor:
             self.previous_time = current_time
             
             # Активные подключения WireGuard
-            active_connections = 0
-            try:
-                wg_show = subprocess.run(
-                    ['wg', 'show'],
-                    capture_output=True,
-                    text=True,
-                    check=True
-                )
-                
-                # Считаем количество строк "peer:"
-                active_connections = wg_show.stdout.count('peer:')
-            except subprocess.CalledProcessError:
-                logger.warning("Не удалось получить информацию о подключениях WireGuard")
-            except Exception as e:
-                logger.error(f"Ошибка при получении активных подключений: {e}")
+            active_connections = await self.count_wireguard_peers()
             
-            return {
+            metrics = {
                 'cpu_usage': cpu_usage,
                 'memory_usage': memory_usage,
                 'disk_usage': disk_usage,
@@ -85,6 +136,9 @@ class ServerMonitor:
                 'network_out': network_out,
                 'active_connections': active_connections
             }
+            metrics.update(loop_lag_monitor.get_stats(reset=True))
+            metrics.update(update_workers.get_stats(reset=True))
+            return metrics
         except Exception as e:
             logger.error(f"Ошибка при получении метрик системы: {e}")
             return None
@@ -102,6 +156,9 @@ class ServerMonitor:
         if metrics['disk_usage'] > DISK_THRESHOLD:
             warnings.append(f"⚠️ Высокое использование диска: {metrics['disk_usage']}% (порог: {DISK_THRESHOLD}%)")
         
+        if metrics.get('queue_depth_max', 0) >= UPDATE_QUEUE_SIZE:
+            warnings.append(f"⚠️ Очередь обновлений переполнялась: {metrics['queue_depth_max']} (прием обновлений приостанавливался)")
+        
         return warnings
     
     async def send_alerts(self, warnings):
@@ -168,6 +225,9 @@ class ServerMonitor:
             
             # Логируем метрики в базу данных
             await self.log_metrics_to_db(metrics)
+            
+            # Рассчитываем процентили завершившихся часов и суток
+            await self.metrics_model.finalize_rollups()
         except Exception as e:
             logger.error(f"Ошибка при выполнении мониторинга: {e}")
     
@@ -179,6 +239,9 @@ class ServerMonitor:
         self.previous_network_io = psutil.net_io_counters()
         self.previous_time = time.time()
         
+        # Измеряем задержку цикла событий, чтобы видеть блокирующие операции
+        loop_lag_monitor.start()
+        
         try:
             while True:
                 await self.monitor_once()
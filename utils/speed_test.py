@@ -7,11 +7,15 @@
 """
 
 import asyncio
+import math
 import time
 import aiohttp
 import logging
 from statistics import mean
-from typing import Dict, List, Tuple
+from typing import Dict, Tuple
+
+from config import SPEED_TEST_CACHE_TTL, SPEED_TEST_USER_INTERVAL, SPEED_TEST_DOWNLOAD_CONCURRENCY
+from utils.status_cache import StatusCache
 
 logger = logging.getLogger(__name__)
 
@@ -30,17 +34,103 @@ PING_SERVERS = [
     "https://vk.com"
 ]
 
+# Размер буфера чтения ответа (байты)
+READ_BUFFER_SIZE = 256 * 1024
+# Максимальная длительность загрузки одного файла (секунды)
+DOWNLOAD_MAX_DURATION = 10
+# Интервал учета принятых байтов и окно скользящего измерения скорости (секунды)
+SAMPLE_INTERVAL = 0.1
+SAMPLE_WINDOW = 1.0
+
+def _percentile(values, percent):
+    """Процентиль по методу ближайшего ранга"""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * percent // 100))
+    return values[int(rank) - 1]
+
+def _window_speeds(samples):
+    """
+    Скорость (Мбит/с) в скользящих окнах SAMPLE_WINDOW с шагом SAMPLE_INTERVAL
+    
+    Args:
+        samples: Список (секунд после первого байта, принято байт)
+    """
+    if not samples:
+        return []
+    
+    buckets = [0] * (int(samples[-1][0] / SAMPLE_INTERVAL) + 1)
+    for offset, size in samples:
+        buckets[int(offset / SAMPLE_INTERVAL)] += size
+    
+    window = max(1, round(SAMPLE_WINDOW / SAMPLE_INTERVAL))
+    if len(buckets) <= window:
+        return []
+    
+    # Последний интервал не закончен, поэтому в окна не входит
+    speeds = []
+    total = sum(buckets[:window])
+    for i in range(window, len(buckets)):
+        speeds.append(total * 8 / (window * SAMPLE_INTERVAL * 1_000_000))
+        total += buckets[i] - buckets[i - window]
+    return speeds
+
 class SpeedTester:
     """Класс для тестирования скорости соединения"""
     
-    def __init__(self):
+    def __init__(self, ping_servers=None, download_servers=None):
         """Инициализация тестера скорости"""
+        self.ping_servers = ping_servers or PING_SERVERS
+        self.download_servers = download_servers or SPEED_TEST_SERVERS
         self.last_results = {}
+        self._session = None
+        # Ограничение одновременных загрузок и цикл событий, к которому оно привязано
+        self._download_slots = None
+        self._download_loop = None
+    
+    def _get_download_slots(self):
+        """
+        Ограничение одновременных загрузок, чтобы тест не занимал весь канал сервера
+        
+        Семафор привязывается к циклу событий, поэтому в новом цикле (после
+        перезапуска бота или в тестах) создается заново.
+        """
+        loop = asyncio.get_running_loop()
+        if self._download_slots is None or self._download_loop is not loop:
+            self._download_slots = asyncio.Semaphore(SPEED_TEST_DOWNLOAD_CONCURRENCY)
+            self._download_loop = loop
+        return self._download_slots
+    
+    def _get_session(self):
+        """
+        Общая сессия HTTP для всех измерений
+        
+        Соединения с серверами сохраняются между запросами, поэтому установка
+        TCP и TLS не попадает в измерения пинга и повторных загрузок.
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=16, ttl_dns_cache=300, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                read_bufsize=READ_BUFFER_SIZE,
+                auto_decompress=False
+            )
+        return self._session
+    
+    async def close(self):
+        """Закрывает сессию HTTP (вызывается при остановке бота)"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
     
     async def measure_ping(self, url: str, count: int = 3) -> Tuple[float, float]:
         """
         Измеряет пинг до указанного сервера
         
+        Первый запрос устанавливает соединение и не учитывается, остальные
+        измеряют время до получения заголовков ответа по готовому соединению.
+        
         Args:
             url: URL сервера для проверки пинга
             count: Количество запросов для усреднения
@@ -49,69 +139,104 @@ class SpeedTester:
             Кортеж (средний_пинг, минимальный_пинг)
         """
         ping_results = []
+        session = self._get_session()
+        timeout = aiohttp.ClientTimeout(total=5)
         
         try:
-            async with aiohttp.ClientSession() as session:
-                for _ in range(count):
-                    start_time = time.time()
-                    
-                    try:
-                        async with session.get(url, timeout=5) as response:
-                            await response.text()
-                            end_time = time.time()
-                            ping_time = (end_time - start_time) * 1000  # Перевод в мс
-                            ping_results.append(ping_time)
-                    except Exception as e:
-                        logger.error(f"Ошибка при измерении пинга до {url}: {e}")
-                        continue
-                    
-                    # Небольшая пауза между запросами
-                    await asyncio.sleep(0.2)
+            for attempt in range(count + 1):
+                start_time = time.perf_counter()
+                
+                try:
+                    async with session.head(url, allow_redirects=False, timeout=timeout):
+                        end_time = time.perf_counter()
+                except Exception as e:
+                    logger.error(f"Ошибка при измерении пинга до {url}: {e}")
+                    continue
+                
+                if attempt > 0:
+                    ping_results.append((end_time - start_time) * 1000)  # Перевод в мс
+                
+                # Небольшая пауза между запросами
+                await asyncio.sleep(0.2)
+            
+            if ping_results:
+                return mean(ping_results), min(ping_results)
+            else:
+                return 0, 0
                 
-                if ping_results:
-                    return mean(ping_results), min(ping_results)
-                else:
-                    return 0, 0
-                    
         except Exception as e:
             logger.error(f"Ошибка при измерении пинга до {url}: {e}")
             return 0, 0
     
-    async def measure_download_speed(self, url: str) -> float:
+    async def measure_download_speed(self, url: str) -> Dict:
         """
         Измеряет скорость загрузки с указанного сервера
         
+        Время до первого байта (DNS, соединение, ответ сервера) учитывается
+        отдельно от скорости передачи данных. Загрузка прерывается через
+        DOWNLOAD_MAX_DURATION секунд.
+        
         Args:
             url: URL для скачивания тестового файла
             
         Returns:
-            Скорость загрузки в Мбит/с
+            Словарь с ключами mbps (средняя скорость после первого байта),
+            p10, p50, p90 (процентили скорости в скользящем окне, Мбит/с),
+            ttfb (время до первого байта, мс) и bytes; None в случае ошибки
         """
+        session = self._get_session()
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=5, sock_read=5)
+        
         try:
-            start_time = time.time()
-            total_bytes = 0
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=10) as response:
+            async with self._get_download_slots():
+                start_time = time.perf_counter()
+                first_byte_time = None
+                total_bytes = 0
+                # Принятые порции (секунд после первого байта, байт)
+                samples = []
+                
+                async with session.get(url, timeout=timeout) as response:
+                    response.raise_for_status()
+                    
                     while True:
-                        chunk = await response.content.read(1024)
+                        chunk = await response.content.read(READ_BUFFER_SIZE)
                         if not chunk:
                             break
+                        
+                        now = time.perf_counter()
+                        if first_byte_time is None:
+                            first_byte_time = now
+                        
+                        samples.append((now - first_byte_time, len(chunk)))
                         total_bytes += len(chunk)
+                        
+                        if now - first_byte_time >= DOWNLOAD_MAX_DURATION:
+                            break
+                
+                end_time = time.perf_counter()
             
-            end_time = time.time()
-            duration = end_time - start_time
+            # Первая порция пришла вместе с первым байтом и в скорость передачи не входит
+            duration = end_time - first_byte_time if first_byte_time is not None else 0
+            transfer_bytes = total_bytes - samples[0][1] if samples else 0
+            if duration <= 0 or transfer_bytes <= 0:
+                return None
             
-            if duration > 0:
-                # Перевод байт в биты (умножаем на 8) и затем из бит/c в Мбит/с (делим на 1_000_000)
-                mbps = (total_bytes * 8) / (duration * 1_000_000)
-                return mbps
-            else:
-                return 0
+            # Перевод байт в биты (умножаем на 8) и затем из бит/c в Мбит/с (делим на 1_000_000)
+            mbps = (transfer_bytes * 8) / (duration * 1_000_000)
+            speeds = _window_speeds(samples) or [mbps]
+            
+            return {
+                "mbps": mbps,
+                "p10": _percentile(speeds, 10),
+                "p50": _percentile(speeds, 50),
+                "p90": _percentile(speeds, 90),
+                "ttfb": (first_byte_time - start_time) * 1000,
+                "bytes": total_bytes
+            }
                 
         except Exception as e:
             logger.error(f"Ошибка при измерении скорости загрузки с {url}: {e}")
-            return 0
+            return None
     
     async def run_full_test(self) -> Dict:
         """
@@ -131,17 +256,12 @@ class SpeedTester:
         }
         
         # Тестирование пинга
-        ping_tasks = []
-        for server_url in PING_SERVERS:
-            server_name = server_url.split("//")[1].split("/")[0]
-            ping_tasks.append(self.measure_ping(server_url))
-        
-        ping_results = await asyncio.gather(*ping_tasks)
+        ping_results = await asyncio.gather(*(self.measure_ping(url) for url in self.ping_servers))
         
         valid_pings = []
-        for i, (avg_ping, min_ping) in enumerate(ping_results):
+        for url, (avg_ping, min_ping) in zip(self.ping_servers, ping_results):
             if avg_ping > 0:
-                server_name = PING_SERVERS[i].split("//")[1].split("/")[0]
+                server_name = url.split("//")[1].split("/")[0]
                 results["ping"][server_name] = {
                     "avg": round(avg_ping, 1),
                     "min": round(min_ping, 1)
@@ -151,19 +271,20 @@ class SpeedTester:
         if valid_pings:
             results["average"]["ping"] = round(mean(valid_pings), 1)
         
-        # Тестирование скорости загрузки
-        download_tasks = []
-        for server_url in SPEED_TEST_SERVERS:
-            download_tasks.append(self.measure_download_speed(server_url))
-        
-        download_results = await asyncio.gather(*download_tasks)
+        # Тестирование скорости загрузки (одновременность ограничена _get_download_slots)
+        download_results = await asyncio.gather(
+            *(self.measure_download_speed(url) for url in self.download_servers)
+        )
         
         valid_speeds = []
-        for i, speed in enumerate(download_results):
-            if speed > 0:
-                server_name = SPEED_TEST_SERVERS[i].split("//")[1].split("/")[0]
-                results["download"][server_name] = round(speed, 2)
-                valid_speeds.append(speed)
+        for url, speed in zip(self.download_servers, download_results):
+            if speed:
+                server_name = url.split("//")[1].split("/")[0]
+                results["download"][server_name] = {
+                    key: round(value, 2) if key != "bytes" else value
+                    for key, value in speed.items()
+                }
+                valid_speeds.append(speed["mbps"])
         
         if valid_speeds:
             results["average"]["download"] = round(mean(valid_speeds), 2)
@@ -204,20 +325,70 @@ class SpeedTester:
         # Детали скорости загрузки
         text += "\nДетали скорости загрузки:\n"
         for server, speed in results["download"].items():
-            text += f"  • {server}: {speed} Мбит/с\n"
+            text += (
+                f"  • {server}: {speed['mbps']} Мбит/с "
+                f"(разброс {speed['p10']}–{speed['p90']}, отклик {speed['ttfb']:.0f} мс)\n"
+            )
         
         return text
 
 
+class SpeedTestScheduler:
+    """
+    Общий планировщик тестов скорости
+    
+    Тест измеряет канал сервера, поэтому результат одинаков для всех пользователей:
+    одновременные запросы ожидают один общий запуск, а результат показывается
+    в течение cache_ttl секунд без повторного теста. Запустить новый тест
+    пользователь может не чаще раза в user_interval секунд.
+    """
+    
+    def __init__(self, tester, cache_ttl=SPEED_TEST_CACHE_TTL, user_interval=SPEED_TEST_USER_INTERVAL):
+        self.results = StatusCache(tester.run_full_test, cache_ttl)
+        self.user_interval = user_interval
+        # Время последнего запуска теста пользователем {user_id: monotonic}
+        self._last_runs = {}
+    
+    def retry_after(self, user_id):
+        """Сколько секунд пользователь должен подождать до нового теста (0 - тест доступен)"""
+        if self.results.is_fresh():
+            return 0
+        
+        last_run = self._last_runs.get(user_id)
+        if last_run is None:
+            return 0
+        return max(0, math.ceil(last_run + self.user_interval - time.monotonic()))
+    
+    async def get_results(self, user_id):
+        """
+        Возвращает свежие результаты теста, при необходимости запуская тест
+        
+        Args:
+            user_id: ID пользователя, запросившего тест
+        
+        Returns:
+            Словарь с результатами тестирования
+        """
+        if not self.results.is_fresh():
+            now = time.monotonic()
+            self._last_runs = {
+                uid: last_run for uid, last_run in self._last_runs.items()
+                if now - last_run < self.user_interval
+            }
+            self._last_runs[user_id] = now
+        
+        return await self.results.get()
+
 # Создаем глобальный экземпляр для использования в разных частях бота
 speed_tester = SpeedTester()
+speed_test_scheduler = SpeedTestScheduler(speed_tester)
 
-async def run_speed_test():
+async def run_speed_test(user_id=None):
     """
-    Запускает полное тестирование скорости и возвращает форматированные результаты
+    Получает результаты тестирования скорости (общие для всех пользователей)
     
     Returns:
         Строка с результатами тестирования
     """
-    results = await speed_tester.run_full_test()
+    results = await speed_test_scheduler.get_results(user_id)
     return speed_tester.format_results(results)
\ No newline at end of file
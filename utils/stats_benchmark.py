@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Нагрузочный тест запросов статистики подключений для VPN-бота
+Автор: RUCODER (https://рукодер.рф/vpn)
+
+Заполняет таблицу stats отдельной временной базы в прежнем формате (даты -
+текст "%Y-%m-%d %H:%M:%S" местного времени, прежние индексы) и измеряет
+прежние запросы статистики. Затем применяет миграцию epoch_timestamps
+(время миграции тоже измеряется) и измеряет те же отчеты через StatsModel.
+Для 10 млн строк нужно около 2 ГБ во временном каталоге (TMPDIR).
+
+Запуск из каталога бота:
+    python -m utils.stats_benchmark --rows 10000000 --clients 5000 --days 365
+"""
+
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import importlib.util
+from statistics import median
+from datetime import datetime, timedelta
+
+from config import MIGRATIONS_DIRECTORY
+from database.migrations import run_migrations
+from database.models import Database, StatsModel
+from init_db import init_db
+
+# Миграция, переводящая даты в unix-метки
+EPOCH_MIGRATION = 'm20251016170000_epoch_timestamps.py'
+
+# Прежние запросы StatsModel.get_overall_stats
+LEGACY_OVERALL_QUERIES = (
+    "SELECT COUNT(*) FROM stats",
+    "SELECT SUM(bytes_received), SUM(bytes_sent) FROM stats",
+    "SELECT COUNT(*) FROM stats WHERE disconnection_date IS NULL",
+    """
+        SELECT
+            date(connection_date) as day,
+            COUNT(*) as connections,
+            SUM(bytes_received) as received,
+            SUM(bytes_sent) as sent
+        FROM stats
+        WHERE connection_date >= date('now', '-30 days')
+        GROUP BY day
+        ORDER BY day
+    """
+)
+
+# Суточная статистика за 30 дней: прежний запрос и запрос StatsModel.get_overall_stats
+LEGACY_DAILY_QUERY = LEGACY_OVERALL_QUERIES[-1]
+EPOCH_DAILY_QUERY = """
+    SELECT
+        date(connection_date, 'unixepoch', 'localtime') as day,
+        COUNT(*) as connections,
+        SUM(bytes_received) as received,
+        SUM(bytes_sent) as sent
+    FROM stats
+    WHERE connection_date >= ?
+    GROUP BY day
+    ORDER BY day
+"""
+
+LEGACY_CLIENT_USAGE_QUERY = """
+    SELECT SUM(bytes_received) as total_received, SUM(bytes_sent) as total_sent
+    FROM stats
+    WHERE client_id = ? AND connection_date BETWEEN ? AND ?
+"""
+
+LEGACY_OPEN_SESSIONS_QUERY = "SELECT client_id, id FROM stats WHERE disconnection_date IS NULL ORDER BY id"
+
+def legacy_overall_stats(conn):
+    return [conn.execute(query).fetchall() for query in LEGACY_OVERALL_QUERIES]
+
+def legacy_client_usage(conn, client_id, start_date, end_date):
+    return conn.execute(LEGACY_CLIENT_USAGE_QUERY, (
+        client_id, start_date.strftime("%Y-%m-%d %H:%M:%S"), end_date.strftime("%Y-%m-%d %H:%M:%S")
+    )).fetchone()
+
+def legacy_open_sessions(conn):
+    return dict(conn.execute(LEGACY_OPEN_SESSIONS_QUERY).fetchall())
+
+def fill_legacy_stats(conn, rows, clients, days, open_sessions):
+    """
+    Пересоздает stats в прежнем формате и заполняет ее rows сессиями за последние days дней
+    
+    Сессии идут по времени подключения, последние open_sessions из них не завершены.
+    """
+    conn.execute("DROP TABLE IF EXISTS stats")
+    conn.execute('''
+        CREATE TABLE stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            client_id INTEGER NOT NULL,
+            connection_date TEXT NOT NULL,
+            disconnection_date TEXT,
+            session_duration INTEGER DEFAULT 0,
+            ip_address TEXT,
+            bytes_received INTEGER DEFAULT 0,
+            bytes_sent INTEGER DEFAULT 0,
+            FOREIGN KEY (client_id) REFERENCES clients (id)
+        )
+    ''')
+    
+    start = int(time.time()) - days * 86400
+    conn.execute('''
+        WITH RECURSIVE seq(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM seq WHERE i < :rows - 1)
+        INSERT INTO stats
+        (client_id, connection_date, disconnection_date, session_duration, ip_address, bytes_received, bytes_sent)
+        SELECT
+            i * 7919 % :clients + 1,
+            datetime(:start + CAST(i * :step AS INTEGER), 'unixepoch', 'localtime'),
+            CASE WHEN i >= :rows - :open_sessions THEN NULL
+                 ELSE datetime(:start + CAST(i * :step AS INTEGER) + i * 31 % 7200, 'unixepoch', 'localtime') END,
+            i * 31 % 7200,
+            '198.51.100.' || (i % 250 + 1),
+            i * 104729 % 50000000,
+            i * 7907 % 5000000
+        FROM seq
+    ''', {
+        'rows': rows,
+        'clients': clients,
+        'start': start,
+        'step': days * 86400 / rows,
+        'open_sessions': open_sessions
+    })
+    
+    conn.execute('CREATE INDEX idx_stats_client_id ON stats(client_id)')
+    conn.execute('CREATE INDEX idx_stats_connection_date ON stats(connection_date)')
+    conn.execute('CREATE INDEX idx_stats_client_traffic ON stats(client_id, bytes_received, bytes_sent)')
+    conn.execute("ANALYZE")
+    conn.commit()
+
+async def _measure(call, repeat):
+    """Медиана времени выполнения call() в миллисекундах"""
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        await call(i)
+        timings.append((time.perf_counter() - start) * 1000)
+    return median(timings)
+
+async def measure_reports(db, clients, repeat, legacy):
+    """Измеряет отчеты статистики (прежние запросы или StatsModel)"""
+    stats_model = StatsModel(db)
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=30)
+    
+    month_ago = datetime.combine(end_date.date() - timedelta(days=30), datetime.min.time())
+    
+    def client_id(i):
+        return i * 7919 % clients + 1
+    
+    if legacy:
+        calls = {
+            'overall': lambda i: db.run(legacy_overall_stats),
+            'daily': lambda i: db.fetch_all(LEGACY_DAILY_QUERY),
+            'client_usage': lambda i: db.run(legacy_client_usage, client_id(i), start_date, end_date),
+            'open_sessions': lambda i: db.run(legacy_open_sessions)
+        }
+    else:
+        calls = {
+            'overall': lambda i: stats_model.get_overall_stats(),
+            'daily': lambda i: db.fetch_all(EPOCH_DAILY_QUERY, (int(month_ago.timestamp()),)),
+            'client_usage': lambda i: stats_model.get_client_usage_by_period(client_id(i), start_date, end_date),
+            'open_sessions': lambda i: stats_model.get_open_sessions()
+        }
+    
+    results = {}
+    for name, call in calls.items():
+        # Первый вызов прогревает кеш страниц и не учитывается
+        await call(0)
+        results[name] = await _measure(call, repeat)
+    return results
+
+def apply_epoch_migration(db):
+    """Применяет миграцию epoch_timestamps и возвращает ее длительность (секунды)"""
+    path = os.path.join(MIGRATIONS_DIRECTORY, EPOCH_MIGRATION)
+    spec = importlib.util.spec_from_file_location("epoch_timestamps", path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    
+    conn = db.get_connection()
+    try:
+        start = time.perf_counter()
+        asyncio.run(migration.migrate(conn, conn.cursor()))
+        conn.execute("ANALYZE")
+        conn.commit()
+        return time.perf_counter() - start
+    finally:
+        conn.close()
+
+def run_benchmark(rows, clients, days, repeat):
+    with tempfile.TemporaryDirectory(prefix='statsbench-') as tmp_dir:
+        db = Database(os.path.join(tmp_dir, 'vpn_bot.db'))
+        init_db(db.db_path)
+        asyncio.run(run_migrations(db.db_path))
+        
+        conn = db.get_connection()
+        try:
+            start = time.perf_counter()
+            fill_legacy_stats(conn, rows, clients, days, max(1, clients // 10))
+            fill_s = time.perf_counter() - start
+        finally:
+            conn.close()
+        
+        try:
+            legacy = asyncio.run(measure_reports(db, clients, repeat, legacy=True))
+        finally:
+            Database.close_all()
+        
+        migration_s = apply_epoch_migration(db)
+        
+        try:
+            epoch = asyncio.run(measure_reports(db, clients, repeat, legacy=False))
+        finally:
+            Database.close_all()
+    
+    return {
+        'rows': rows,
+        'fill_s': fill_s,
+        'migration_s': migration_s,
+        'legacy': legacy,
+        'epoch': epoch
+    }
+
+def format_result(result):
+    titles = {
+        'overall': "общая статистика (get_overall_stats)",
+        'daily': "суточная статистика за 30 дней",
+        'client_usage': "трафик клиента за период",
+        'open_sessions': "открытые сессии"
+    }
+    lines = [
+        f"Строк stats: {result['rows']} (заполнение {result['fill_s']:.0f} с, "
+        f"миграция epoch_timestamps {result['migration_s']:.0f} с)"
+    ]
+    for name, title in titles.items():
+        lines.append(
+            f"  {title:<40} {result['legacy'][name]:10.1f} мс -> {result['epoch'][name]:8.1f} мс"
+        )
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест запросов статистики")
+    parser.add_argument('--rows', type=int, default=10_000_000, help="Строк в таблице stats")
+    parser.add_argument('--clients', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=365, help="Период, за который создаются сессии")
+    parser.add_argument('--repeat', type=int, default=5, help="Повторов каждого запроса")
+    args = parser.parse_args()
+    
+    if min(args.rows, args.clients, args.days, args.repeat) < 1:
+        parser.error("Параметры должны быть положительными")
+    
+    print(format_result(run_benchmark(args.rows, args.clients, args.days, args.repeat)))
+
+if __name__ == "__main__":
+    main()
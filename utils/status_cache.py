@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Кеш результатов служебных команд для VPN-бота
+Автор: RUCODER (https://рукодер.рф/vpn)
+"""
+
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class StatusCache:
+    """
+    Снимок результата асинхронной функции с коротким временем жизни
+    
+    Пока снимок свежий, он возвращается без вызова функции. Одновременные
+    запросы устаревшего снимка ожидают один общий вызов, поэтому команда
+    (wg show, systemctl status) не запускается несколько раз параллельно.
+    """
+    
+    def __init__(self, fetch, ttl):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.value = None
+        self.updated_at = None
+        self._pending = None
+        # Номер поколения: снимок, полученный до invalidate(), не сохраняется
+        self._generation = 0
+    
+    def is_fresh(self):
+        return self.updated_at is not None and time.monotonic() - self.updated_at < self.ttl
+    
+    def invalidate(self):
+        """Сбрасывает снимок (после изменения состояния сервера)"""
+        self.value = None
+        self.updated_at = None
+        self._generation += 1
+        self._pending = None
+    
+    async def _refresh(self, generation):
+        value = await self.fetch()
+        if generation == self._generation:
+            self.value = value
+            self.updated_at = time.monotonic()
+        return value
+    
+    async def get(self, fresh=False):
+        """
+        Возвращает снимок, при необходимости обновляя его
+        
+        Args:
+            fresh: Не использовать сохраненный снимок (например, сразу после перезапуска службы)
+        """
+        if not fresh and self.is_fresh():
+            return self.value
+        
+        task = self._pending
+        if task is None or task.done():
+            task = asyncio.ensure_future(self._refresh(self._generation))
+            self._pending = task
+        
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if self._pending is task and task.done():
+                self._pending = None
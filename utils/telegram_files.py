@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Модуль повторного использования файлов, загруженных в Telegram
+Автор: RUCODER (https://рукодер.рф/vpn)
+"""
+
+import os
+import asyncio
+import hashlib
+import logging
+
+from aiogram.types import BufferedInputFile
+from aiogram.exceptions import TelegramBadRequest
+
+from database.models import TelegramFileModel
+from utils.qr_generator import generate_qr_from_config
+
+logger = logging.getLogger(__name__)
+
+# Виды файлов клиента
+KIND_CONFIG = "config"
+KIND_QR = "qr"
+
+telegram_file_model = TelegramFileModel()
+
+def _read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+async def _send_cached(client_id, kind, content_hash, send, make_file, get_file_id):
+    """
+    Отправляет файл по сохраненному file_id или загружает его и сохраняет file_id
+    
+    Args:
+        client_id: ID клиента
+        kind: Вид файла (KIND_CONFIG, KIND_QR)
+        content_hash: Хеш конфигурации, из которой получен файл
+        send: Корутина-функция отправки, принимающая file_id или InputFile
+        make_file: Корутина-функция, возвращающая InputFile для загрузки (или None)
+        get_file_id: Функция получения file_id из отправленного сообщения
+    
+    Returns:
+        Отправленное сообщение или None
+    """
+    file_id = await telegram_file_model.get_file_id(client_id, kind, content_hash)
+    
+    if file_id:
+        try:
+            return await send(file_id)
+        except TelegramBadRequest as e:
+            # file_id может стать недействительным (например, при смене токена бота)
+            logger.warning(f"Сохраненный file_id клиента {client_id} ({kind}) недействителен: {e}")
+            await telegram_file_model.delete_file_ids(client_id, kind)
+    
+    input_file = await make_file()
+    if input_file is None:
+        return None
+    
+    message = await send(input_file)
+    
+    try:
+        await telegram_file_model.save_file_id(client_id, kind, content_hash, get_file_id(message))
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении file_id клиента {client_id} ({kind}): {e}")
+    
+    return message
+
+async def _config_hash(config_path):
+    loop = asyncio.get_running_loop()
+    content = await loop.run_in_executor(None, _read_bytes, config_path)
+    return content, hashlib.sha256(content).hexdigest()
+
+async def send_client_config(bot, chat_id, client_id, config_path, caption=None):
+    """
+    Отправляет конфигурационный файл клиента, загружая его в Telegram только один раз
+    
+    Returns:
+        Отправленное сообщение или None
+    """
+    content, content_hash = await _config_hash(config_path)
+    
+    async def make_file():
+        return BufferedInputFile(content, filename=os.path.basename(config_path))
+    
+    return await _send_cached(
+        client_id, KIND_CONFIG, content_hash,
+        lambda document: bot.send_document(chat_id, document, caption=caption),
+        make_file,
+        lambda message: message.document.file_id
+    )
+
+async def send_client_qr(bot, chat_id, client_id, config_path, caption=None):
+    """
+    Отправляет QR-код конфигурации клиента, загружая его в Telegram только один раз
+    
+    Returns:
+        Отправленное сообщение или None, если QR-код не удалось сгенерировать
+    """
+    _, content_hash = await _config_hash(config_path)
+    
+    async def make_file():
+        qr_png = await generate_qr_from_config(config_path)
+        return BufferedInputFile(qr_png, filename="qr.png") if qr_png else None
+    
+    return await _send_cached(
+        client_id, KIND_QR, content_hash,
+        lambda photo: bot.send_photo(chat_id, photo, caption=caption),
+        make_file,
+        lambda message: message.photo[-1].file_id
+    )
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Модуль учёта трафика клиентов WireGuard для VPN-бота
+Автор: RUCODER (https://рукодер.рф/vpn)
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from config import WG_INTERFACE, TRAFFIC_COLLECT_INTERVAL, WG_SESSION_TIMEOUT
+from database.models import ClientModel, StatsModel
+
+logger = logging.getLogger(__name__)
+
+def parse_wg_dump(output):
+    """
+    Разбирает вывод `wg show <интерфейс> dump`
+    
+    Первая строка описывает интерфейс, остальные - пиров:
+    public-key, preshared-key, endpoint, allowed-ips, latest-handshake,
+    transfer-rx, transfer-tx, persistent-keepalive (через табуляцию)
+    
+    Returns:
+        Словарь {public_key: (endpoint, latest_handshake, rx, tx)}
+    """
+    peers = {}
+    for line in output.splitlines()[1:]:
+        fields = line.split('\t')
+        if len(fields) < 8:
+            continue
+        try:
+            peers[fields[0]] = (fields[2], int(fields[4]), int(fields[5]), int(fields[6]))
+        except ValueError:
+            continue
+    return peers
+
+def _format_timestamp(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+def _endpoint_host(endpoint):
+    """Выделяет адрес из endpoint вида 1.2.3.4:51820 или [::1]:51820"""
+    if endpoint == '(none)':
+        return None
+    host = endpoint.rsplit(':', 1)[0]
+    return host.strip('[]')
+
+class TrafficCollector:
+    def __init__(self, client_model=None, stats_model=None):
+        self.client_model = client_model or ClientModel()
+        self.stats_model = stats_model or StatsModel(self.client_model.db)
+        # Последние значения счётчиков {public_key: (rx, tx)}
+        self.counters = {}
+        # Открытые сессии {client_id: stats_id}
+        self.sessions = None
+        self.key_map = {}
+        # Ключи пиров, для которых нет клиента в базе (например, добавленных вручную)
+        self.unknown_keys = set()
+    
+    async def read_dump(self):
+        """Получает машиночитаемый вывод wg show dump"""
+        process = await asyncio.create_subprocess_exec(
+            'wg', 'show', WG_INTERFACE, 'dump',
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=30)
+        except asyncio.TimeoutError:
+            process.kill()
+            raise
+        
+        if process.returncode != 0:
+            raise RuntimeError(stderr.decode().strip())
+        
+        return stdout.decode()
+    
+    def compute_tick(self, peers, now):
+        """
+        Вычисляет изменения по сравнению с предыдущим циклом
+        
+        Args:
+            peers: Результат parse_wg_dump
+            now: Текущее время (unix)
+        
+        Returns:
+            Кортеж (opened, updated, closed, usage) для StatsModel.record_traffic,
+            список client_id новых сессий и новые значения счётчиков, которые
+            запоминаются только после успешной записи
+        """
+        opened, opened_clients, updated, closed, usage = [], [], [], [], []
+        seen_clients = set()
+        counters = {}
+        
+        for public_key, (endpoint, handshake, rx, tx) in peers.items():
+            client_id = self.key_map.get(public_key)
+            previous = self.counters.get(public_key)
+            counters[public_key] = (rx, tx)
+            
+            if client_id is None:
+                continue
+            seen_clients.add(client_id)
+            
+            if previous is None:
+                # Первое наблюдение пира - только запоминаем счётчики
+                delta_rx = delta_tx = 0
+            else:
+                # Счётчики обнуляются при перезапуске интерфейса
+                delta_rx = rx - previous[0] if rx >= previous[0] else rx
+                delta_tx = tx - previous[1] if tx >= previous[1] else tx
+            
+            online = handshake > 0 and now - handshake < WG_SESSION_TIMEOUT
+            stats_id = self.sessions.get(client_id)
+            
+            if online and stats_id is None:
+                opened.append((client_id, handshake, _endpoint_host(endpoint), delta_rx, delta_tx))
+                opened_clients.append(client_id)
+            elif online:
+                if delta_rx or delta_tx:
+                    updated.append((delta_rx, delta_tx, stats_id))
+            elif stats_id is not None:
+                end = handshake if handshake > 0 else now
+                closed.append((end, delta_rx, delta_tx, stats_id))
+                del self.sessions[client_id]
+            
+            if delta_rx or delta_tx:
+                usage.append((delta_rx + delta_tx, _format_timestamp(handshake or now), client_id))
+        
+        # Пиры, удалённые из интерфейса, завершают свои сессии
+        for client_id in [c for c in self.sessions if c not in seen_clients]:
+            closed.append((now, 0, 0, self.sessions.pop(client_id)))
+        
+        return (opened, updated, closed, usage), opened_clients, counters
+    
+    async def collect_once(self):
+        """Выполняет один цикл сбора трафика"""
+        try:
+            peers = parse_wg_dump(await self.read_dump())
+        except Exception as e:
+            logger.warning(f"Не удалось получить статистику WireGuard: {e}")
+            return
+        
+        try:
+            if self.sessions is None:
+                self.sessions = await self.stats_model.get_open_sessions()
+            
+            # Ключи клиентов перечитываются только при появлении новых пиров
+            if any(
+                public_key not in self.key_map and public_key not in self.unknown_keys
+                for public_key in peers
+            ):
+                self.key_map = await self.client_model.get_public_key_map()
+                self.unknown_keys = {public_key for public_key in peers if public_key not in self.key_map}
+            
+            (opened, updated, closed, usage), opened_clients, counters = self.compute_tick(peers, int(time.time()))
+            
+            if opened or updated or closed or usage:
+                opened_ids = await self.stats_model.record_traffic(opened, updated, closed, usage)
+                self.sessions.update(zip(opened_clients, opened_ids))
+            
+            self.counters = counters
+        except Exception as e:
+            logger.error(f"Ошибка при сборе статистики трафика: {e}")
+            # Состояние сессий будет перечитано из базы в следующем цикле, а трафик
+            # этого цикла будет учтён от прежних значений счётчиков
+            self.sessions = None
+    
+    async def start_collecting_loop(self):
+        """Запускает цикл сбора трафика"""
+        logger.info("Запуск сбора статистики трафика WireGuard")
+        
+        try:
+            while True:
+                await self.collect_once()
+                await asyncio.sleep(TRAFFIC_COLLECT_INTERVAL)
+        except asyncio.CancelledError:
+            logger.info("Сбор статистики трафика остановлен")
+
+async def start_traffic_collector():
+    """Запускает сбор статистики трафика"""
+    collector = TrafficCollector()
+    await collector.start_collecting_loop()
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Нагрузочный тест туннеля WireGuard для VPN-бота
+Автор: RUCODER (https://рукодер.рф/vpn)
+
+Измеряет полезную скорость, пакеты в секунду, потери и задержку под нагрузкой
+так, как их видит клиент VPN. В режиме wireguard отправитель и получатель
+работают в паре сетевых пространств имен, соединенных veth и интерфейсами wg
+(нужны root, iproute2 и wireguard-tools; рабочий интерфейс wg0 не затрагивается).
+Режим loopback - замена без туннеля через UDP на 127.0.0.1 для сравнения.
+
+Запуск из каталога бота:
+    python -m utils.tunnel_benchmark run --mode wireguard --mtu 1420 1280 --peers 1 4 16
+    python -m utils.tunnel_benchmark run --mode loopback --duration 5
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import asyncio
+import logging
+import argparse
+import tempfile
+from statistics import mean
+
+from config import BASE_DIR
+from database.migrations import run_migrations
+from database.models import Database, TunnelBenchmarkModel
+from utils.vpn_manager import run_command
+from utils.wg_keys import generate_keypair
+
+logger = logging.getLogger(__name__)
+
+# Порт получателя и служебные адреса тестовой сети
+BENCH_PORT = 5201
+NS_CLIENT = 'vpnbench-client'
+NS_SERVER = 'vpnbench-server'
+VETH_CLIENT = 'vpnbench-c'
+VETH_SERVER = 'vpnbench-s'
+VETH_CLIENT_ADDR = '192.168.241.1/30'
+VETH_SERVER_ADDR = '192.168.241.2/30'
+WG_SERVER_INTERFACE = 'wgbench'
+WG_SERVER_PORT = 51820
+# Подсеть туннеля пира i - 10.241.i.0/24 (сервер .1, клиент .2)
+TUNNEL_SUBNET_PREFIX = '10.241'
+MAX_PEERS = 250
+
+# Заголовки IPv4 и UDP внутри туннеля (байты)
+IP_UDP_OVERHEAD = 28
+# Период отправки пакетов для измерения задержки (секунды)
+PROBE_INTERVAL = 0.01
+# Пакетов данных, отправляемых между проверками входящих ответов
+SEND_BATCH = 64
+# Запас времени на запуск процессов и получение последних пакетов (секунды)
+START_DELAY = 2
+RECEIVE_GRACE = 3
+
+# Типы пакетов (первый байт): данные, замер задержки, окончание передачи
+PACKET_DATA = b'D'
+PACKET_PROBE = b'P'
+PACKET_END = b'E'
+
+def _percentile(values, percent):
+    """Процентиль по методу ближайшего ранга"""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * percent // 100))
+    return values[int(rank) - 1]
+
+def run_sender(host, port, size, duration, start_at, bind=None):
+    """
+    Отправляет UDP-пакеты размера size с максимальной скоростью в течение duration секунд
+    
+    Каждые PROBE_INTERVAL секунд отправляется пакет с временем отправки, который
+    получатель возвращает обратно - так измеряется задержка под нагрузкой.
+    
+    Returns:
+        Словарь с числом отправленных пакетов данных и списком задержек (мс)
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if bind:
+        sock.bind((bind, 0))
+    sock.connect((host, port))
+    sock.setblocking(False)
+    
+    data = PACKET_DATA + bytes(max(0, size - 1))
+    sent_packets = 0
+    rtts = []
+    
+    # Все отправители начинают одновременно, независимо от времени запуска процесса
+    time.sleep(max(0, start_at - time.time()))
+    
+    deadline = time.perf_counter() + duration
+    next_probe = 0
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+        
+        if now >= next_probe:
+            next_probe = now + PROBE_INTERVAL
+            try:
+                sock.send(PACKET_PROBE + struct.pack('!d', now))
+            except OSError:
+                pass
+        
+        for _ in range(SEND_BATCH):
+            try:
+                sock.send(data)
+                sent_packets += 1
+            except OSError:
+                # Буфер сокета заполнен - пакет считается неотправленным
+                break
+        
+        while True:
+            try:
+                reply = sock.recv(64)
+            except OSError:
+                break
+            if reply[:1] == PACKET_PROBE:
+                rtts.append((time.perf_counter() - struct.unpack('!d', reply[1:9])[0]) * 1000)
+    
+    # Пакет окончания дублируется на случай потери
+    for _ in range(3):
+        try:
+            sock.send(PACKET_END)
+        except OSError:
+            pass
+        time.sleep(0.05)
+    
+    sock.close()
+    return {'sent_packets': sent_packets, 'rtts': rtts}
+
+def run_receiver(port, peers, timeout):
+    """
+    Принимает пакеты, пока все peers отправителей не сообщат об окончании
+    
+    Returns:
+        Словарь с числом и объемом принятых пакетов данных и временем первого и последнего
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    sock.bind(('0.0.0.0', port))
+    sock.settimeout(0.5)
+    
+    # Сообщаем запускающему процессу, что сокет готов
+    print('ready', flush=True)
+    
+    packets = 0
+    received_bytes = 0
+    first_time = last_time = None
+    finished = set()
+    deadline = time.perf_counter() + timeout
+    
+    while len(finished) < peers and time.perf_counter() < deadline:
+        try:
+            data, address = sock.recvfrom(65535)
+        except socket.timeout:
+            continue
+        
+        kind = data[:1]
+        if kind == PACKET_PROBE:
+            sock.sendto(data, address)
+        elif kind == PACKET_END:
+            finished.add(address)
+        else:
+            now = time.perf_counter()
+            if first_time is None:
+                first_time = now
+            last_time = now
+            packets += 1
+            received_bytes += len(data)
+    
+    sock.close()
+    return {
+        'packets': packets,
+        'bytes': received_bytes,
+        'elapsed': (last_time - first_time) if first_time is not None else 0
+    }
+
+async def teardown_namespaces():
+    """Удаляет тестовые пространства имен (вместе с veth и интерфейсами wg)"""
+    for namespace in (NS_CLIENT, NS_SERVER):
+        await run_command('ip', 'netns', 'del', namespace, check=False)
+
+async def setup_namespaces(mtu, peers):
+    """
+    Создает тестовую сеть: сервер WireGuard с peers пирами в NS_SERVER и по
+    интерфейсу wg на каждого пира в NS_CLIENT
+    """
+    await teardown_namespaces()
+    
+    for namespace in (NS_CLIENT, NS_SERVER):
+        await run_command('ip', 'netns', 'add', namespace)
+        await run_command('ip', '-n', namespace, 'link', 'set', 'lo', 'up')
+    
+    await run_command(
+        'ip', 'link', 'add', VETH_CLIENT, 'netns', NS_CLIENT,
+        'type', 'veth', 'peer', 'name', VETH_SERVER, 'netns', NS_SERVER
+    )
+    for namespace, device, address in ((NS_CLIENT, VETH_CLIENT, VETH_CLIENT_ADDR), (NS_SERVER, VETH_SERVER, VETH_SERVER_ADDR)):
+        await run_command('ip', '-n', namespace, 'addr', 'add', address, 'dev', device)
+        await run_command('ip', '-n', namespace, 'link', 'set', device, 'up')
+    
+    server_endpoint = f"{VETH_SERVER_ADDR.split('/')[0]}:{WG_SERVER_PORT}"
+    
+    # Ключи передаются утилите wg через файлы во временном каталоге
+    with tempfile.TemporaryDirectory() as key_dir:
+        def key_file(name, key):
+            path = os.path.join(key_dir, name)
+            with open(path, 'w') as f:
+                f.write(key)
+            return path
+        
+        server_private, server_public = generate_keypair()
+        await run_command('ip', '-n', NS_SERVER, 'link', 'add', WG_SERVER_INTERFACE, 'type', 'wireguard')
+        await run_command(
+            'ip', 'netns', 'exec', NS_SERVER, 'wg', 'set', WG_SERVER_INTERFACE,
+            'listen-port', str(WG_SERVER_PORT), 'private-key', key_file('server', server_private)
+        )
+        
+        for i in range(peers):
+            client_private, client_public = generate_keypair()
+            client_interface = f"{WG_SERVER_INTERFACE}{i}"
+            
+            await run_command(
+                'ip', '-n', NS_SERVER, 'addr', 'add', f"{TUNNEL_SUBNET_PREFIX}.{i}.1/24", 'dev', WG_SERVER_INTERFACE
+            )
+            await run_command(
+                'ip', 'netns', 'exec', NS_SERVER, 'wg', 'set', WG_SERVER_INTERFACE,
+                'peer', client_public, 'allowed-ips', f"{TUNNEL_SUBNET_PREFIX}.{i}.2/32"
+            )
+            
+            await run_command('ip', '-n', NS_CLIENT, 'link', 'add', client_interface, 'type', 'wireguard')
+            await run_command(
+                'ip', 'netns', 'exec', NS_CLIENT, 'wg', 'set', client_interface,
+                'listen-port', str(WG_SERVER_PORT + 1 + i), 'private-key', key_file(f"client{i}", client_private),
+                'peer', server_public, 'endpoint', server_endpoint,
+                'allowed-ips', f"{TUNNEL_SUBNET_PREFIX}.{i}.0/24"
+            )
+            await run_command(
+                'ip', '-n', NS_CLIENT, 'addr', 'add', f"{TUNNEL_SUBNET_PREFIX}.{i}.2/24", 'dev', client_interface
+            )
+            await run_command('ip', '-n', NS_CLIENT, 'link', 'set', client_interface, 'mtu', str(mtu), 'up')
+    
+    await run_command('ip', '-n', NS_SERVER, 'link', 'set', WG_SERVER_INTERFACE, 'mtu', str(mtu), 'up')
+
+async def _spawn(namespace, *args):
+    """Запускает отправитель или получатель в отдельном процессе (в пространстве имен namespace)"""
+    prefix = ('ip', 'netns', 'exec', namespace) if namespace else ()
+    return await asyncio.create_subprocess_exec(
+        *prefix, sys.executable, '-m', 'utils.tunnel_benchmark', *args,
+        stdout=asyncio.subprocess.PIPE,
+        cwd=BASE_DIR
+    )
+
+async def run_benchmark(mode='loopback', mtu=1420, peers=1, duration=10):
+    """
+    Выполняет один нагрузочный тест
+    
+    Args:
+        mode: wireguard (туннель между пространствами имен) или loopback (UDP без туннеля)
+        mtu: MTU интерфейса туннеля; размер пакета данных - mtu минус заголовки IP и UDP
+        peers: Количество клиентов, одновременно передающих данные
+        duration: Длительность передачи (секунды)
+    
+    Returns:
+        Словарь с полями BenchmarkResult.FIELDS
+    """
+    if mode == 'wireguard':
+        client_namespace, server_namespace = NS_CLIENT, NS_SERVER
+        targets = [(f"{TUNNEL_SUBNET_PREFIX}.{i}.1", f"{TUNNEL_SUBNET_PREFIX}.{i}.2") for i in range(peers)]
+    else:
+        client_namespace = server_namespace = None
+        targets = [('127.0.0.1', None)] * peers
+    
+    processes = []
+    try:
+        if mode == 'wireguard':
+            await setup_namespaces(mtu, peers)
+        
+        receiver = await _spawn(
+            server_namespace, 'receive', '--port', str(BENCH_PORT), '--peers', str(peers),
+            '--timeout', str(START_DELAY + duration + RECEIVE_GRACE)
+        )
+        processes.append(receiver)
+        await asyncio.wait_for(receiver.stdout.readline(), START_DELAY + 10)
+        
+        start_at = time.time() + START_DELAY
+        for host, bind in targets:
+            args = [
+                'send', '--host', host, '--port', str(BENCH_PORT), '--size', str(mtu - IP_UDP_OVERHEAD),
+                '--duration', str(duration), '--start-at', str(start_at)
+            ]
+            if bind:
+                args += ['--bind', bind]
+            processes.append(await _spawn(client_namespace, *args))
+        
+        timeout = START_DELAY + duration + RECEIVE_GRACE + 10
+        outputs = await asyncio.wait_for(asyncio.gather(*(p.communicate() for p in processes)), timeout)
+    finally:
+        for process in processes:
+            if process.returncode is None:
+                process.kill()
+        if mode == 'wireguard':
+            await teardown_namespaces()
+    
+    received = json.loads(outputs[0][0].decode().splitlines()[-1])
+    senders = [json.loads(stdout.decode()) for stdout, _ in outputs[1:]]
+    
+    sent_packets = sum(sender['sent_packets'] for sender in senders)
+    rtts = [rtt for sender in senders for rtt in sender['rtts']]
+    elapsed = received['elapsed'] or duration
+    
+    return {
+        'created_at': int(time.time()),
+        'mode': mode,
+        'mtu': mtu,
+        'peers': peers,
+        'duration': duration,
+        'goodput_mbps': received['bytes'] * 8 / elapsed / 1_000_000,
+        'pps': received['packets'] / elapsed,
+        'loss': 1 - received['packets'] / sent_packets if sent_packets else None,
+        'latency_avg_ms': mean(rtts) if rtts else None,
+        'latency_p95_ms': _percentile(rtts, 95),
+        'cpu_count': os.cpu_count()
+    }
+
+async def run_matrix(mode, mtus, peer_counts, duration, save=True):
+    """Выполняет тесты для всех сочетаний MTU и числа пиров и сохраняет результаты"""
+    model = TunnelBenchmarkModel()
+    if save:
+        await run_migrations()
+    
+    results = []
+    for mtu in mtus:
+        for peers in peer_counts:
+            try:
+                result = await run_benchmark(mode, mtu, peers, duration)
+            except Exception as e:
+                logger.error(f"Ошибка нагрузочного теста (MTU {mtu}, пиров {peers}): {e}")
+                continue
+            
+            if save:
+                await model.save_result(result)
+            results.append(result)
+            print(format_result(result), flush=True)
+    
+    return results
+
+def format_result(result):
+    """Форматирует результат теста одной строкой"""
+    loss = f"{result['loss'] * 100:.2f}%" if result['loss'] is not None else "-"
+    latency = (
+        f"{result['latency_avg_ms']:.2f} мс (p95 {result['latency_p95_ms']:.2f} мс)"
+        if result['latency_avg_ms'] is not None else "-"
+    )
+    return (
+        f"{result['mode']:<9} MTU {result['mtu']:<5} пиров {result['peers']:<3} "
+        f"{result['goodput_mbps']:9.1f} Мбит/с {result['pps']:10.0f} пак/с потери {loss:>7} задержка {latency}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест туннеля WireGuard")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    run_parser = commands.add_parser('run', help="Выполнить тесты и сохранить результаты")
+    run_parser.add_argument('--mode', choices=('wireguard', 'loopback'), default='wireguard')
+    run_parser.add_argument('--mtu', type=int, nargs='+', default=[1420])
+    run_parser.add_argument('--peers', type=int, nargs='+', default=[1])
+    run_parser.add_argument('--duration', type=float, default=10)
+    run_parser.add_argument('--no-save', action='store_true', help="Не сохранять результаты в базу данных")
+    
+    # Служебные команды процессов отправителя и получателя
+    send_parser = commands.add_parser('send')
+    send_parser.add_argument('--host', required=True)
+    send_parser.add_argument('--port', type=int, required=True)
+    send_parser.add_argument('--size', type=int, required=True)
+    send_parser.add_argument('--duration', type=float, required=True)
+    send_parser.add_argument('--start-at', type=float, required=True)
+    send_parser.add_argument('--bind')
+    
+    receive_parser = commands.add_parser('receive')
+    receive_parser.add_argument('--port', type=int, required=True)
+    receive_parser.add_argument('--peers', type=int, required=True)
+    receive_parser.add_argument('--timeout', type=float, required=True)
+    
+    args = parser.parse_args()
+    
+    if args.command == 'send':
+        print(json.dumps(run_sender(args.host, args.port, args.size, args.duration, args.start_at, args.bind)))
+    elif args.command == 'receive':
+        print(json.dumps(run_receiver(args.port, args.peers, args.timeout)))
+    else:
+        if any(peers < 1 or peers > MAX_PEERS for peers in args.peers):
+            parser.error(f"Количество пиров должно быть от 1 до {MAX_PEERS}")
+        if any(mtu <= IP_UDP_OVERHEAD for mtu in args.mtu):
+            parser.error(f"MTU должен быть больше {IP_UDP_OVERHEAD}")
+        
+        try:
+            asyncio.run(run_matrix(args.mode, args.mtu, args.peers, args.duration, save=not args.no_save))
+        finally:
+            Database.close_all()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Пул воркеров обработки обновлений для VPN-бота
+Автор: RUCODER (https://рукодер.рф/vpn)
+"""
+
+import time
+import asyncio
+import logging
+import functools
+from collections import deque
+
+from aiogram import Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+
+from config import UPDATE_WORKERS, UPDATE_QUEUE_SIZE, UPDATE_DRAIN_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Минимальный интервал между предупреждениями о переполнении очереди (секунды)
+BACKPRESSURE_WARNING_INTERVAL = 60
+
+class UpdateWorkerPool:
+    """
+    Обработка обновлений фиксированным числом воркеров
+    
+    Обновления одного чата складываются в его очередь и обрабатываются строго
+    по порядку, одним воркером за раз. Воркеры берут очереди разных чатов по
+    кругу, поэтому долгий обработчик задерживает только свой чат. Когда в очереди
+    max_pending обновлений, put() ждет освобождения места - прием обновлений
+    (getUpdates или ответ на запрос webhook) приостанавливается.
+    """
+    
+    def __init__(self, workers=UPDATE_WORKERS, max_pending=UPDATE_QUEUE_SIZE):
+        self.workers = workers
+        self.max_pending = max(1, max_pending)
+        self.depth = 0
+        self.max_depth = 0
+        self.processed = 0
+        # Очереди обработчиков по чатам {ключ: deque} и ключи чатов, готовых к обработке
+        self._mailboxes = {}
+        self._ready = None
+        self._slots = None
+        self._idle = None
+        self._tasks = []
+        self._last_warning = 0
+    
+    @property
+    def enabled(self):
+        return self.workers > 0
+    
+    def get_stats(self, reset=False):
+        """
+        Возвращает текущую и максимальную глубину очереди и число обработанных обновлений
+        
+        Args:
+            reset: Начать новое окно для максимального значения
+        """
+        stats = {
+            'queue_depth': self.depth,
+            'queue_depth_max': self.max_depth,
+            'processed': self.processed
+        }
+        if reset:
+            self.max_depth = self.depth
+        return stats
+    
+    def start(self):
+        """Запускает воркеры (повторный вызов ничего не делает)"""
+        if self._tasks:
+            return
+        
+        self._ready = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Запущено воркеров обработки обновлений: {self.workers}")
+    
+    async def put(self, key, job):
+        """
+        Ставит обработчик в очередь чата
+        
+        Args:
+            key: Ключ очереди (ID чата или пользователя)
+            job: Функция без аргументов, возвращающая корутину обработки
+        """
+        self.start()
+        
+        if self._slots.locked():
+            now = time.monotonic()
+            if now - self._last_warning >= BACKPRESSURE_WARNING_INTERVAL:
+                self._last_warning = now
+                logger.warning(f"Очередь обновлений заполнена ({self.depth}), прием обновлений приостановлен")
+        
+        await self._slots.acquire()
+        self.depth += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        self._idle.clear()
+        
+        mailbox = self._mailboxes.get(key)
+        if mailbox is None:
+            self._mailboxes[key] = deque([job])
+            self._ready.put_nowait(key)
+        else:
+            # Чат уже ожидает обработки или обрабатывается - порядок сохраняется
+            mailbox.append(job)
+    
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            mailbox = self._mailboxes[key]
+            job = mailbox.popleft()
+            
+            try:
+                await job()
+            except Exception as e:
+                logger.error(f"Ошибка при обработке обновления: {e}")
+            finally:
+                self.processed += 1
+                self.depth -= 1
+                self._slots.release()
+                
+                # Следующее обновление чата встает в конец общей очереди
+                if mailbox:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._mailboxes[key]
+                
+                if self.depth == 0:
+                    self._idle.set()
+    
+    async def stop(self, timeout=UPDATE_DRAIN_TIMEOUT):
+        """Дожидается обработки очереди (не дольше timeout секунд) и останавливает воркеры"""
+        if not self._tasks:
+            return
+        
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не обработано обновлений при остановке: {self.depth}")
+        
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+# Общий экземпляр, показания которого выводятся в панели мониторинга
+update_workers = UpdateWorkerPool()
+
+class WorkerPoolDispatcher(Dispatcher):
+    """
+    Диспетчер, передающий обновления в пул воркеров
+    
+    Обновление ставится в очередь до прохождения middleware, поэтому состояние
+    FSM читается уже после обработки предыдущих обновлений чата.
+    """
+    
+    def __init__(self, *args, pool=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = pool or update_workers
+    
+    @staticmethod
+    def _queue_key(update):
+        chat, user, _ = UserContextMiddleware.resolve_event_context(update)
+        if chat is not None:
+            return chat.id
+        if user is not None:
+            return user.id
+        return None
+    
+    async def feed_update(self, bot, update, **kwargs):
+        if not self.pool.enabled:
+            return await super().feed_update(bot, update, **kwargs)
+        
+        job = functools.partial(Dispatcher.feed_update, self, bot, update, **kwargs)
+        await self.pool.put(self._queue_key(update), job)
+    
+    async def emit_shutdown(self, *args, **kwargs):
+        # Очередь обрабатывается до закрытия хранилища FSM и сессии бота
+        await self.pool.stop()
+        await super().emit_shutdown(*args, **kwargs)
@@ -7,9 +7,9 @@
 """
 
 import os
+import asyncio
 import subprocess
 import logging
-import re
 import tempfile
 import ipaddress
 import secrets
@@ -17,18 +17,65 @@ import base64
 from datetime import datetime
 
 from config import (
+    WG_INTERFACE,
     WG_CONFIG_PATH,
     WG_SERVER_PRIVKEY_PATH,
     WG_SERVER_PUBKEY_PATH,
     SERVER_IP,
     SERVER_PORT,
     DNS_SERVERS,
-    CLIENTS_DIR
+    CLIENTS_DIR,
+    WG_COMMAND_TIMEOUT,
+    WG_RESTART_TIMEOUT,
+    WG_STATUS_TTL
 )
+from utils import wg_keys
+from utils.ip_allocator import IPAllocator
+from utils.wg_config import WireGuardConfig
+from utils.qr_generator import invalidate_config_qr
+from utils.status_cache import StatusCache
 
 logger = logging.getLogger(__name__)
 
+# Конфигурация сервера, общая для всех экземпляров VPNManager
+server_config = WireGuardConfig(WG_CONFIG_PATH)
+
+def get_server_config_ips():
+    """Возвращает все адреса из строк AllowedIPs конфигурации сервера"""
+    return server_config.all_ips()
+
+def parse_wg_show(output):
+    """Разбирает вывод `wg show` в список подключений"""
+    connections = []
+    current_peer = None
+    
+    for line in output.splitlines():
+        line = line.strip()
+        
+        if line.startswith("peer:"):
+            current_peer = {"public_key": line.split("peer:")[1].strip()}
+        elif line.startswith("endpoint:") and current_peer:
+            current_peer["endpoint"] = line.split("endpoint:")[1].strip()
+        elif line.startswith("allowed ips:") and current_peer:
+            current_peer["allowed_ips"] = line.split("allowed ips:")[1].strip()
+        elif line.startswith("latest handshake:") and current_peer:
+            current_peer["latest_handshake"] = line.split("latest handshake:")[1].strip()
+        elif line.startswith("transfer:") and current_peer:
+            transfer_parts = line.split("transfer:")[1].strip().split("received,")
+            if len(transfer_parts) == 2:
+                current_peer["received"] = transfer_parts[0].strip()
+                current_peer["sent"] = transfer_parts[1].strip()
+            
+            # Добавляем пира в список и сбрасываем текущего пира
+            connections.append(current_peer)
+            current_peer = None
+    
+    return connections
+
 class VPNManager:
+    # Карта адресов общая для всех экземпляров, чтобы не выдать один IP дважды
+    ip_allocator = IPAllocator(used_ips=get_server_config_ips)
+    
     def __init__(self):
         # Убедимся, что директория для клиентов существует
         os.makedirs(CLIENTS_DIR, exist_ok=True)
@@ -48,58 +95,27 @@ class VPNManager:
     def generate_keypair(self):
         """Генерирует пару ключей WireGuard"""
         try:
-            # Генерация приватного ключа
-            private_key_proc = subprocess.run(
-                ['wg', 'genkey'],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            private_key = private_key_proc.stdout.strip()
-            
-            # Генерация публичного ключа на основе приватного
-            public_key_proc = subprocess.run(
-                ['wg', 'pubkey'],
-                input=private_key,
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            public_key = public_key_proc.stdout.strip()
-            
-            return private_key, public_key
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Ошибка при генерации ключей WireGuard: {e}")
-            return None, None
+            return wg_keys.generate_keypair()
         except Exception as e:
-            logger.error(f"Неизвестная ошибка при генерации ключей: {e}")
+            logger.error(f"Ошибка при генерации ключей WireGuard: {e}")
             return None, None
     
     def get_next_available_ip(self):
         """Получает следующий доступный IP-адрес для клиента"""
         try:
-            # Чтение конфигурации сервера
-            with open(WG_CONFIG_PATH, 'r') as f:
-                config = f.read()
-            
-            # Поиск всех используемых IP-адресов клиентов
-            ip_pattern = re.compile(r'AllowedIPs\s*=\s*10\.0\.0\.(\d+)/32')
-            used_ips = set(int(match.group(1)) for match in ip_pattern.finditer(config))
-            
-            # Поиск следующего доступного IP
-            for i in range(2, 255):  # 10.0.0.1 зарезервирован для сервера
-                if i not in used_ips:
-                    return f"10.0.0.{i}/32"
-            
-            raise ValueError("Нет доступных IP-адресов в подсети")
+            client_ip = self.ip_allocator.allocate()
+            if not client_ip:
+                raise ValueError(f"Нет доступных IP-адресов в подсети {self.ip_allocator.network}")
+            return client_ip
         except Exception as e:
             logger.error(f"Ошибка при поиске доступного IP: {e}")
             return None
     
-    def create_client_config(self, client_name, client_ip, client_private_key, client_public_key):
+    def create_client_config(self, client_name, client_ip, client_private_key, client_public_key,
+                             server_public_key=None):
         """Создает конфигурационный файл для клиента"""
         try:
-            server_public_key = self.get_server_public_key()
+            server_public_key = server_public_key or self.get_server_public_key()
             if not server_public_key:
                 return None
             
@@ -133,28 +149,92 @@ PersistentKeepalive = 25
             logger.error(f"Ошибка при создании конфигурации клиента: {e}")
             return None
     
+    def apply_peer(self, client_public_key, client_ip):
+        """Добавляет пира в работающий интерфейс без перезапуска службы"""
+        subprocess.run(
+            ['wg', 'set', WG_INTERFACE, 'peer', client_public_key, 'allowed-ips', client_ip],
+            capture_output=True,
+            text=True,
+            check=True
+        )
+    
+    def unapply_peer(self, client_public_key):
+        """Удаляет пира из работающего интерфейса без перезапуска службы"""
+        subprocess.run(
+            ['wg', 'set', WG_INTERFACE, 'peer', client_public_key, 'remove'],
+            capture_output=True,
+            text=True,
+            check=True
+        )
+    
+    def save_peers(self, clients):
+        """
+        Сохраняет пиров клиентов в конфигурацию сервера (без применения к интерфейсу)
+        
+        Returns:
+            Список добавленных пиров (Peer)
+        """
+        added = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with server_config.lock:
+            peers = [
+                server_config.add_peer(client['name'], client['public_key'], client['ip_address'], added)
+                for client in clients
+            ]
+            server_config.save()
+        
+        # Адрес мог быть задан вручную (например, при смене IP клиента)
+        for client in clients:
+            self.ip_allocator.reserve(client['ip_address'])
+        
+        return peers
+    
+    def remove_peer_from_config(self, client_name, client_public_key, release_ips=True):
+        """
+        Удаляет пира клиента из конфигурации сервера и возвращает его адреса в пул
+        
+        Args:
+            release_ips: Освобождать ли адреса пира (False - адреса освободит вызывающий)
+        
+        Returns:
+            Список адресов удаленного пира
+        """
+        # Ищем секцию клиента по публичному ключу (или по имени в комментарии)
+        with server_config.lock:
+            peer = server_config.remove_peer(client_public_key, name=client_name)
+            if peer is None:
+                return []
+            server_config.save()
+        
+        if release_ips:
+            for ip in peer.allowed_ips:
+                self.ip_allocator.release(ip)
+        
+        return peer.allowed_ips
+    
     def add_client_to_server_config(self, client_name, client_public_key, client_ip):
         """Добавляет клиента в конфигурацию сервера"""
         try:
             # Проверяем, существует ли конфигурация сервера
-            if not os.path.exists(WG_CONFIG_PATH):
-                logger.error(f"Конфигурация сервера не найдена: {WG_CONFIG_PATH}")
+            if not os.path.exists(server_config.path):
+                logger.error(f"Конфигурация сервера не найдена: {server_config.path}")
                 return False
             
-            # Формируем конфигурацию клиента для сервера
-            client_config = f"""
-# Клиент: {client_name} - добавлен {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-[Peer]
-PublicKey = {client_public_key}
-AllowedIPs = {client_ip}
-"""
-            
-            # Добавляем конфигурацию клиента в конфигурацию сервера
-            with open(WG_CONFIG_PATH, 'a') as f:
-                f.write(client_config)
+            # Добавляем клиента в конфигурацию сервера
+            self.save_peers([{"name": client_name, "public_key": client_public_key, "ip_address": client_ip}])
             
-            # Применяем изменения с помощью команды wg-quick
-            subprocess.run(['systemctl', 'restart', 'wg-quick@wg0'], check=True)
+            # Применяем изменения к работающему интерфейсу, не разрывая сессии других клиентов.
+            # Перезапуск службы выполняется без блокировки конфигурации
+            try:
+                try:
+                    self.apply_peer(client_public_key, client_ip)
+                except subprocess.CalledProcessError as e:
+                    # Интерфейс не поднят - перезапуск службы загрузит конфигурацию с диска
+                    logger.warning(f"Не удалось применить пира через wg set ({e.stderr}), перезапуск WireGuard")
+                    subprocess.run(['systemctl', 'restart', f'wg-quick@{WG_INTERFACE}'], check=True)
+            except Exception:
+                # Пир не применен - убираем его из конфигурации; адрес освобождает create_client
+                self.remove_peer_from_config(client_name, client_public_key, release_ips=False)
+                raise
             
             return True
         except subprocess.CalledProcessError as e:
@@ -168,41 +248,19 @@ AllowedIPs = {client_ip}
         """Удаляет клиента из конфигурации сервера"""
         try:
             # Проверяем, существует ли конфигурация сервера
-            if not os.path.exists(WG_CONFIG_PATH):
-                logger.error(f"Конфигурация сервера не найдена: {WG_CONFIG_PATH}")
+            if not os.path.exists(server_config.path):
+                logger.error(f"Конфигурация сервера не найдена: {server_config.path}")
                 return False
             
-            # Читаем текущую конфигурацию
-            with open(WG_CONFIG_PATH, 'r') as f:
-                config_lines = f.readlines()
+            # Удаляем секцию клиента и возвращаем его адреса в пул
+            self.remove_peer_from_config(client_name, client_public_key)
             
-            # Ищем и удаляем секцию клиента
-            new_config_lines = []
-            skip_lines = False
-            
-            for line in config_lines:
-                if f"# Клиент: {client_name}" in line:
-                    skip_lines = True
-                    continue
-                
-                if skip_lines and "[Peer]" in line:
-                    continue
-                
-                if skip_lines and "PublicKey" in line and client_public_key in line:
-                    continue
-                
-                if skip_lines and "AllowedIPs" in line:
-                    skip_lines = False
-                    continue
-                
-                new_config_lines.append(line)
-            
-            # Записываем обновленную конфигурацию
-            with open(WG_CONFIG_PATH, 'w') as f:
-                f.writelines(new_config_lines)
-            
-            # Применяем изменения с помощью команды wg-quick
-            subprocess.run(['systemctl', 'restart', 'wg-quick@wg0'], check=True)
+            # Удаляем пира из работающего интерфейса, не затрагивая остальных клиентов
+            try:
+                self.unapply_peer(client_public_key)
+            except subprocess.CalledProcessError as e:
+                # Интерфейс не поднят - пир будет отсутствовать при следующем запуске
+                logger.warning(f"Не удалось удалить пира через wg set: {e.stderr}")
             
             return True
         except subprocess.CalledProcessError as e:
@@ -223,34 +281,7 @@ AllowedIPs = {client_ip}
                 check=True
             )
             
-            output = wg_show.stdout
-            
-            # Парсим вывод команды
-            connections = []
-            current_peer = None
-            
-            for line in output.splitlines():
-                line = line.strip()
-                
-                if line.startswith("peer:"):
-                    current_peer = {"public_key": line.split("peer:")[1].strip()}
-                elif line.startswith("endpoint:") and current_peer:
-                    current_peer["endpoint"] = line.split("endpoint:")[1].strip()
-                elif line.startswith("allowed ips:") and current_peer:
-                    current_peer["allowed_ips"] = line.split("allowed ips:")[1].strip()
-                elif line.startswith("latest handshake:") and current_peer:
-                    current_peer["latest_handshake"] = line.split("latest handshake:")[1].strip()
-                elif line.startswith("transfer:") and current_peer:
-                    transfer_parts = line.split("transfer:")[1].strip().split("received,")
-                    if len(transfer_parts) == 2:
-                        current_peer["received"] = transfer_parts[0].strip()
-                        current_peer["sent"] = transfer_parts[1].strip()
-                    
-                    # Добавляем пира в список и сбрасываем текущего пира
-                    connections.append(current_peer)
-                    current_peer = None
-            
-            return connections
+            return parse_wg_show(wg_show.stdout)
         except subprocess.CalledProcessError as e:
             logger.error(f"Ошибка при получении активных подключений: {e}")
             return []
@@ -262,7 +293,7 @@ AllowedIPs = {client_ip}
         """Проверяет статус службы WireGuard"""
         try:
             status = subprocess.run(
-                ['systemctl', 'status', 'wg-quick@wg0'],
+                ['systemctl', 'status', f'wg-quick@{WG_INTERFACE}'],
                 capture_output=True,
                 text=True
             )
@@ -285,7 +316,7 @@ AllowedIPs = {client_ip}
     def restart_wireguard(self):
         """Перезапускает службу WireGuard"""
         try:
-            subprocess.run(['systemctl', 'restart', 'wg-quick@wg0'], check=True)
+            subprocess.run(['systemctl', 'restart', f'wg-quick@{WG_INTERFACE}'], check=True)
             return True
         except subprocess.CalledProcessError as e:
             logger.error(f"Ошибка при перезапуске WireGuard: {e}")
@@ -310,12 +341,14 @@ AllowedIPs = {client_ip}
             # Создаем конфигурацию клиента
             config_path = self.create_client_config(client_name, client_ip, private_key, public_key)
             if not config_path:
+                self.ip_allocator.release(client_ip)
                 return None
             
             # Добавляем клиента в конфигурацию сервера
             if not self.add_client_to_server_config(client_name, public_key, client_ip):
                 # Удаляем созданную конфигурацию клиента в случае ошибки
                 os.remove(config_path)
+                self.ip_allocator.release(client_ip)
                 return None
             
             return {
@@ -329,6 +362,119 @@ AllowedIPs = {client_ip}
             logger.error(f"Ошибка при создании клиента VPN: {e}")
             return None
     
+    def prepare_clients_bulk(self, client_names):
+        """
+        Создает ключи, адреса и конфигурационные файлы для нескольких клиентов
+        
+        Сервер при этом не изменяется: пиры добавляются одним вызовом apply_clients_bulk
+        после сохранения клиентов в базу данных.
+        
+        Args:
+            client_names: Список имен клиентов
+            
+        Returns:
+            Список словарей клиентов (как у create_client) или None в случае ошибки
+        """
+        server_public_key = self.get_server_public_key()
+        if not server_public_key:
+            return None
+        
+        clients = []
+        try:
+            for client_name in client_names:
+                private_key, public_key = wg_keys.generate_keypair()
+                
+                client_ip = self.ip_allocator.allocate()
+                if not client_ip:
+                    raise ValueError(f"Нет доступных IP-адресов в подсети {self.ip_allocator.network}")
+                
+                client = {
+                    "name": client_name,
+                    "private_key": private_key,
+                    "public_key": public_key,
+                    "ip_address": client_ip,
+                    "config_path": None
+                }
+                clients.append(client)
+                
+                client["config_path"] = self.create_client_config(
+                    client_name, client_ip, private_key, public_key, server_public_key
+                )
+                if not client["config_path"]:
+                    raise ValueError(f"Не удалось создать конфигурацию клиента {client_name}")
+            
+            return clients
+        except Exception as e:
+            logger.error(f"Ошибка при подготовке клиентов VPN: {e}")
+            self.discard_clients_bulk(clients)
+            return None
+    
+    def discard_clients_bulk(self, clients):
+        """Удаляет конфигурации и освобождает адреса клиентов, подготовленных prepare_clients_bulk"""
+        for client in clients:
+            if client.get("config_path"):
+                try:
+                    os.remove(client["config_path"])
+                    os.rmdir(os.path.dirname(client["config_path"]))
+                except OSError:
+                    pass
+            self.ip_allocator.release(client["ip_address"])
+    
+    def apply_clients_bulk(self, clients):
+        """
+        Добавляет подготовленных клиентов в конфигурацию сервера и в работающий интерфейс
+        
+        Конфигурация сервера сохраняется один раз, а все пиры применяются
+        одним вызовом `wg addconf`.
+        """
+        try:
+            if not os.path.exists(server_config.path):
+                logger.error(f"Конфигурация сервера не найдена: {server_config.path}")
+                return False
+            
+            peers = self.save_peers(clients)
+            
+            # wg addconf принимает файл только с секциями [Peer]
+            with tempfile.NamedTemporaryFile('w', suffix='.conf') as peers_file:
+                peers_file.write("".join(peer.render() for peer in peers))
+                peers_file.flush()
+                
+                try:
+                    subprocess.run(
+                        ['wg', 'addconf', WG_INTERFACE, peers_file.name],
+                        capture_output=True,
+                        text=True,
+                        check=True
+                    )
+                except subprocess.CalledProcessError as e:
+                    # Интерфейс не поднят - перезапуск службы загрузит конфигурацию с диска
+                    logger.warning(f"Не удалось применить пиров через wg addconf ({e.stderr}), перезапуск WireGuard")
+                    subprocess.run(['systemctl', 'restart', f'wg-quick@{WG_INTERFACE}'], check=True)
+            
+            return True
+        except subprocess.CalledProcessError as e:
+            logger.error(f"Ошибка при применении конфигурации сервера: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"Ошибка при добавлении клиентов в конфигурацию сервера: {e}")
+            return False
+    
+    def remove_client_files(self, client_name):
+        """Удаляет конфигурацию клиента и его директорию (если она пуста)"""
+        client_dir = os.path.join(CLIENTS_DIR, client_name)
+        if os.path.exists(client_dir):
+            config_path = os.path.join(client_dir, f"{client_name}.conf")
+            if os.path.exists(config_path):
+                os.remove(config_path)
+            invalidate_config_qr(config_path)
+            
+            # Удаляем директорию клиента, если она пуста
+            try:
+                os.rmdir(client_dir)
+            except OSError:
+                # Директория не пуста, оставляем её
+                pass
+    
     def delete_client(self, client_name, client_public_key):
         """Удаляет клиента VPN"""
         try:
@@ -337,18 +483,7 @@ AllowedIPs = {client_ip}
                 return False
             
             # Удаляем файлы конфигурации клиента
-            client_dir = os.path.join(CLIENTS_DIR, client_name)
-            if os.path.exists(client_dir):
-                config_path = os.path.join(client_dir, f"{client_name}.conf")
-                if os.path.exists(config_path):
-                    os.remove(config_path)
-                
-                # Удаляем директорию клиента, если она пуста
-                try:
-                    os.rmdir(client_dir)
-                except OSError:
-                    # Директория не пуста, оставляем её
-                    pass
+            self.remove_client_files(client_name)
             
             return True
         except Exception as e:
@@ -384,24 +519,268 @@ AllowedIPs = {client_ip}
             with open(config_path, 'w') as f:
                 f.writelines(new_config_lines)
             
+            # QR-код старой конфигурации больше не действителен
+            invalidate_config_qr(config_path)
+            
             # Обновляем конфигурацию сервера, если изменился IP
             if client_ip:
-                # Получаем публичный ключ клиента из конфигурации
-                public_key = None
-                with open(config_path, 'r') as f:
-                    config = f.read()
-                    match = re.search(r'\[Peer\].*?PublicKey\s*=\s*(\S+)', config, re.DOTALL)
-                    if match:
-                        public_key = match.group(1)
+                # Секция клиента ищется по имени: в конфигурации клиента есть только ключ сервера
+                with server_config.lock:
+                    peer = server_config.get_by_name(client_name)
+                    old_ips = server_config.set_allowed_ips(peer.public_key, client_ip) if peer else None
+                    if peer:
+                        server_config.save()
                 
-                if public_key:
-                    # Удаляем клиента из конфигурации сервера
-                    self.remove_client_from_server_config(client_name, public_key)
+                if peer:
+                    for ip in old_ips:
+                        self.ip_allocator.release(ip)
+                    self.ip_allocator.reserve(client_ip)
                     
-                    # Добавляем клиента с новым IP
-                    self.add_client_to_server_config(client_name, public_key, client_ip)
+                    # wg set заменяет список адресов пира целиком
+                    try:
+                        self.apply_peer(peer.public_key, client_ip)
+                    except subprocess.CalledProcessError as e:
+                        logger.warning(f"Не удалось изменить адрес пира через wg set: {e.stderr}")
             
             return True
         except Exception as e:
             logger.error(f"Ошибка при обновлении конфигурации клиента: {e}")
             return False
+
+
+async def run_command(*args, timeout=WG_COMMAND_TIMEOUT, check=True):
+    """
+    Выполняет команду без блокировки цикла событий
+    
+    Returns:
+        subprocess.CompletedProcess с декодированными stdout и stderr
+    
+    Raises:
+        subprocess.CalledProcessError: команда завершилась с ошибкой (при check=True)
+        subprocess.TimeoutExpired: команда не завершилась за timeout секунд
+    """
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise subprocess.TimeoutExpired(list(args), timeout)
+    
+    result = subprocess.CompletedProcess(list(args), process.returncode, stdout.decode(), stderr.decode())
+    if check:
+        result.check_returncode()
+    return result
+
+async def fetch_active_connections():
+    """Получает список активных подключений интерфейса"""
+    try:
+        wg_show = await run_command('wg', 'show', WG_INTERFACE)
+        return parse_wg_show(wg_show.stdout)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        logger.error(f"Ошибка при получении активных подключений: {e}")
+        return []
+    except Exception as e:
+        logger.error(f"Неизвестная ошибка при получении активных подключений: {e}")
+        return []
+
+async def fetch_wireguard_status():
+    """Получает статус службы WireGuard"""
+    try:
+        status = await run_command('systemctl', 'status', f'wg-quick@{WG_INTERFACE}', check=False)
+        
+        return {
+            "is_active": "Active: active" in status.stdout,
+            "status_text": status.stdout,
+            "error": status.stderr if status.returncode != 0 else None
+        }
+    except Exception as e:
+        logger.error(f"Ошибка при проверке статуса WireGuard: {e}")
+        return {
+            "is_active": False,
+            "status_text": None,
+            "error": str(e)
+        }
+
+# Снимки состояния WireGuard, общие для обработчиков и мониторинга
+active_connections = StatusCache(fetch_active_connections, WG_STATUS_TTL)
+wireguard_status = StatusCache(fetch_wireguard_status, WG_STATUS_TTL)
+
+def invalidate_status():
+    """Сбрасывает снимки состояния после изменения пиров или перезапуска службы"""
+    active_connections.invalidate()
+    wireguard_status.invalidate()
+
+class AsyncVPNManager(VPNManager):
+    """
+    Асинхронный вариант VPNManager для обработчиков бота
+    
+    Команды wg и systemctl выполняются через asyncio.create_subprocess_exec
+    с ограничением по времени, работа с файлами - в пуле потоков. Изменения
+    конфигурации сервера выполняются последовательно под общей блокировкой.
+    """
+    
+    # Блокировка для операций, изменяющих конфигурацию сервера и интерфейс
+    config_lock = asyncio.Lock()
+    
+    async def _run_sync(self, func, *args):
+        """Выполняет синхронный метод (работа с файлами) в пуле потоков"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, func, *args)
+    
+    async def restart_service(self):
+        """Перезапускает службу WireGuard (ошибки передаются вызывающему)"""
+        await run_command('systemctl', 'restart', f'wg-quick@{WG_INTERFACE}', timeout=WG_RESTART_TIMEOUT)
+    
+    async def add_client_to_server_config(self, client_name, client_public_key, client_ip):
+        """Добавляет клиента в конфигурацию сервера"""
+        try:
+            if not os.path.exists(server_config.path):
+                logger.error(f"Конфигурация сервера не найдена: {server_config.path}")
+                return False
+            
+            async with self.config_lock:
+                await self._run_sync(
+                    self.save_peers,
+                    [{"name": client_name, "public_key": client_public_key, "ip_address": client_ip}]
+                )
+                
+                try:
+                    try:
+                        await run_command('wg', 'set', WG_INTERFACE, 'peer', client_public_key, 'allowed-ips', client_ip)
+                    except subprocess.CalledProcessError as e:
+                        # Интерфейс не поднят - перезапуск службы загрузит конфигурацию с диска
+                        logger.warning(f"Не удалось применить пира через wg set ({e.stderr}), перезапуск WireGuard")
+                        await self.restart_service()
+                except Exception:
+                    # Пир не применен - убираем его из конфигурации; адрес освобождает create_client
+                    await self._run_sync(self.remove_peer_from_config, client_name, client_public_key, False)
+                    raise
+                finally:
+                    invalidate_status()
+            
+            return True
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            logger.error(f"Ошибка при применении конфигурации сервера: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"Ошибка при добавлении клиента в конфигурацию сервера: {e}")
+            return False
+    
+    async def remove_client_from_server_config(self, client_name, client_public_key):
+        """Удаляет клиента из конфигурации сервера"""
+        try:
+            if not os.path.exists(server_config.path):
+                logger.error(f"Конфигурация сервера не найдена: {server_config.path}")
+                return False
+            
+            async with self.config_lock:
+                await self._run_sync(self.remove_peer_from_config, client_name, client_public_key)
+                
+                try:
+                    await run_command('wg', 'set', WG_INTERFACE, 'peer', client_public_key, 'remove')
+                except subprocess.CalledProcessError as e:
+                    # Интерфейс не поднят - пир будет отсутствовать при следующем запуске
+                    logger.warning(f"Не удалось удалить пира через wg set: {e.stderr}")
+                except subprocess.TimeoutExpired as e:
+                    # Пир уже удален из конфигурации и будет отсутствовать после перезапуска службы
+                    logger.warning(f"Не удалось удалить пира через wg set: {e}")
+                finally:
+                    invalidate_status()
+            
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при удалении клиента из конфигурации сервера: {e}")
+            return False
+    
+    async def get_active_connections(self, fresh=False):
+        """Получает список активных подключений (из снимка не старше WG_STATUS_TTL)"""
+        return await active_connections.get(fresh)
+    
+    async def check_wireguard_status(self, fresh=False):
+        """Проверяет статус службы WireGuard (из снимка не старше WG_STATUS_TTL)"""
+        return await wireguard_status.get(fresh)
+    
+    async def restart_wireguard(self):
+        """Перезапускает службу WireGuard"""
+        try:
+            # Перезапуск не должен пересекаться с изменением конфигурации
+            async with self.config_lock:
+                try:
+                    await self.restart_service()
+                finally:
+                    invalidate_status()
+            return True
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            logger.error(f"Ошибка при перезапуске WireGuard: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"Неизвестная ошибка при перезапуске WireGuard: {e}")
+            return False
+    
+    async def create_client(self, client_name):
+        """Создает нового клиента VPN"""
+        try:
+            private_key, public_key = self.generate_keypair()
+            if not private_key or not public_key:
+                return None
+            
+            client_ip = self.get_next_available_ip()
+            if not client_ip:
+                return None
+            
+            config_path = await self._run_sync(
+                self.create_client_config, client_name, client_ip, private_key, public_key
+            )
+            if not config_path:
+                self.ip_allocator.release(client_ip)
+                return None
+            
+            if not await self.add_client_to_server_config(client_name, public_key, client_ip):
+                # Удаляем созданную конфигурацию клиента в случае ошибки
+                await self._run_sync(os.remove, config_path)
+                self.ip_allocator.release(client_ip)
+                return None
+            
+            return {
+                "name": client_name,
+                "private_key": private_key,
+                "public_key": public_key,
+                "ip_address": client_ip,
+                "config_path": config_path
+            }
+        except Exception as e:
+            logger.error(f"Ошибка при создании клиента VPN: {e}")
+            return None
+    
+    async def delete_client(self, client_name, client_public_key):
+        """Удаляет клиента VPN"""
+        try:
+            if not await self.remove_client_from_server_config(client_name, client_public_key):
+                return False
+            
+            await self._run_sync(self.remove_client_files, client_name)
+            
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при удалении клиента VPN: {e}")
+            return False
+    
+    async def prepare_clients_bulk(self, client_names):
+        """Создает ключи, адреса и конфигурационные файлы для нескольких клиентов"""
+        # Переустановка WireGuard перестраивает карту адресов под этой же блокировкой
+        # и не должна выдать адреса, выделяемые для порции
+        async with self.config_lock:
+            return await self._run_sync(super().prepare_clients_bulk, client_names)
+    
+    async def apply_clients_bulk(self, clients):
+        """Добавляет подготовленных клиентов в конфигурацию сервера и в работающий интерфейс"""
+        async with self.config_lock:
+            try:
+                return await self._run_sync(super().apply_clients_bulk, clients)
+            finally:
+                invalidate_status()
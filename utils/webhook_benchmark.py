@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Нагрузочный тест получения обновлений (long polling и webhook) для VPN-бота
+Автор: RUCODER (https://рукодер.рф/vpn)
+
+Локальная замена Bot API (utils.fake_bot_api) создает обновления с заданной
+частотой и задержкой сети в одну сторону. Бот получает их так же, как в main.py:
+через Dispatcher.start_polling или через SimpleRequestHandler за веб-сервером
+aiohttp с keep-alive, установив webhook с max_connections. Измеряется задержка
+от создания обновления до вызова обработчика и число обработанных обновлений
+в секунду.
+
+Запуск из каталога бота:
+    python -m utils.webhook_benchmark --rate 200 --delay 0.025 --duration 10
+    python -m utils.webhook_benchmark --mode webhook --rate 1000 --max-connections 40 100
+"""
+
+import time
+import asyncio
+import secrets
+import logging
+import argparse
+
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+from config import WEBHOOK_PATH, WEBHOOK_MAX_CONNECTIONS, WEBHOOK_KEEPALIVE_TIMEOUT, UPDATE_WORKERS
+from utils.fake_bot_api import FakeBotAPI
+from utils.update_workers import UpdateWorkerPool, WorkerPoolDispatcher
+
+# Число чатов, от которых приходят обновления
+CHATS = 1000
+# Время на обработку оставшихся обновлений после окончания генерации (секунды)
+DRAIN_TIMEOUT = 30
+
+def _percentile(values, percent):
+    """Процентиль по методу ближайшего ранга"""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * percent // 100))
+    return values[int(rank) - 1]
+
+def make_update(i):
+    """Сообщение пользователя, в тексте которого - время создания (perf_counter)"""
+    chat_id = 1_000_000 + i % CHATS
+    return {
+        "message": {
+            "message_id": i + 1,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+            "text": repr(time.perf_counter())
+        }
+    }
+
+async def generate_updates(api, rate, duration):
+    """Создает обновления с частотой rate в течение duration секунд"""
+    total = int(rate * duration)
+    start = time.perf_counter()
+    for i in range(total):
+        delay = start + i / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        api.push_update(make_update(i))
+    return total
+
+async def start_webhook_server(bot, dp, max_connections):
+    """Веб-сервер бота с теми же параметрами, что в main.run_webhook"""
+    secret = secrets.token_urlsafe(32)
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot, secret_token=secret, handle_in_background=not dp.pool.enabled
+    ).register(app, path=WEBHOOK_PATH)
+    
+    runner = web.AppRunner(app, keepalive_timeout=WEBHOOK_KEEPALIVE_TIMEOUT, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    
+    await bot.set_webhook(
+        url=f"http://127.0.0.1:{port}{WEBHOOK_PATH}",
+        secret_token=secret,
+        max_connections=max_connections,
+        drop_pending_updates=True
+    )
+    return runner
+
+async def run_benchmark(mode, rate, duration, delay, max_connections, workers):
+    api = FakeBotAPI(latency=delay)
+    await api.start()
+    bot = api.bot()
+    
+    dp = WorkerPoolDispatcher(pool=UpdateWorkerPool(workers=workers))
+    latencies = []
+    last_handled = 0.0
+    
+    async def on_message(message):
+        nonlocal last_handled
+        last_handled = time.perf_counter()
+        latencies.append(last_handled - float(message.text))
+    
+    dp.message.register(on_message)
+    
+    runner = polling = None
+    try:
+        if mode == 'webhook':
+            runner = await start_webhook_server(bot, dp, max_connections)
+        else:
+            await bot.delete_webhook(drop_pending_updates=True)
+            polling = asyncio.create_task(dp.start_polling(
+                bot, handle_as_tasks=not dp.pool.enabled, handle_signals=False, close_bot_session=False
+            ))
+            # Обновления создаются, когда бот уже ожидает их в getUpdates
+            while not api.get_updates_calls:
+                await asyncio.sleep(0.01)
+        
+        start = time.perf_counter()
+        total = await generate_updates(api, rate, duration)
+        
+        deadline = time.perf_counter() + DRAIN_TIMEOUT
+        while len(latencies) < total and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+    finally:
+        if polling is not None:
+            await dp.stop_polling()
+            await polling
+        if runner is not None:
+            await bot.delete_webhook()
+            await runner.cleanup()
+        await dp.pool.stop()
+        await bot.session.close()
+        await api.stop()
+    
+    handled = len(latencies)
+    return {
+        'mode': mode,
+        'rate': rate,
+        'max_connections': max_connections if mode == 'webhook' else None,
+        'total': total,
+        'handled': handled,
+        'throughput': handled / (last_handled - start) if handled else 0,
+        'median_ms': _percentile(latencies, 50) * 1000 if handled else None,
+        'p95_ms': _percentile(latencies, 95) * 1000 if handled else None
+    }
+
+def format_result(result):
+    mode = result['mode'] if result['max_connections'] is None else f"webhook/{result['max_connections']}"
+    latency = (
+        f"медиана {result['median_ms']:.0f} мс, p95 {result['p95_ms']:.0f} мс"
+        if result['handled'] else "нет обработанных обновлений"
+    )
+    return (
+        f"{mode:<12} {result['rate']:6.0f} обн/с: обработано {result['handled']}/{result['total']} "
+        f"({result['throughput']:.0f} обн/с), {latency}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест получения обновлений")
+    parser.add_argument('--mode', choices=('polling', 'webhook'), nargs='+', default=['polling', 'webhook'])
+    parser.add_argument('--rate', type=float, nargs='+', default=[200], help="Обновлений в секунду")
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--delay', type=float, default=0.025, help="Задержка сети в одну сторону (секунды)")
+    parser.add_argument('--max-connections', type=int, nargs='+', default=[WEBHOOK_MAX_CONNECTIONS])
+    parser.add_argument('--workers', type=int, default=UPDATE_WORKERS, help="Воркеров обработки (0 - задачи)")
+    args = parser.parse_args()
+    
+    if any(rate <= 0 for rate in args.rate) or args.duration <= 0:
+        parser.error("Частота и длительность должны быть положительными")
+    if any(not 1 <= connections <= 100 for connections in args.max_connections):
+        parser.error("max_connections должно быть от 1 до 100")
+    
+    # Сообщения aiogram о каждом обработанном обновлении не выводятся
+    logging.getLogger('aiogram').setLevel(logging.WARNING)
+    
+    for rate in args.rate:
+        for mode in args.mode:
+            for max_connections in (args.max_connections if mode == 'webhook' else [None]):
+                result = asyncio.run(run_benchmark(
+                    mode, rate, args.duration, args.delay, max_connections, args.workers
+                ))
+                print(format_result(result))
+
+if __name__ == "__main__":
+    main()
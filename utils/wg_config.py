@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Модель конфигурации сервера WireGuard (wg0.conf) для VPN-бота
+Автор: RUCODER (https://рукодер.рф/vpn)
+"""
+
+import os
+import re
+import logging
+import tempfile
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Комментарий, которым бот помечает секции клиентов
+CLIENT_COMMENT_RE = re.compile(r'^#\s*Клиент:\s*(\S+)')
+
+class Peer:
+    """Секция [Peer] конфигурации сервера"""
+    
+    def __init__(self, public_key, allowed_ips=None, name=None, header=None, extra=None):
+        self.public_key = public_key
+        self.allowed_ips = list(allowed_ips or [])
+        self.name = name
+        # Строки комментариев перед [Peer] и прочие строки секции сохраняются как есть
+        self.header = list(header or [])
+        self.extra = list(extra or [])
+    
+    def render(self):
+        lines = list(self.header)
+        lines.append("[Peer]")
+        lines.append(f"PublicKey = {self.public_key}")
+        if self.allowed_ips:
+            lines.append(f"AllowedIPs = {', '.join(self.allowed_ips)}")
+        lines.extend(self.extra)
+        return "\n".join(lines) + "\n"
+
+def _host_ip(ip):
+    """Адрес без маски (ключ индекса по IP)"""
+    return ip.split('/')[0].strip()
+
+class WireGuardConfig:
+    """
+    Конфигурация сервера WireGuard, разобранная в память
+    
+    Пиры индексируются по публичному ключу, имени клиента и IP-адресу.
+    Файл перечитывается только при изменении (mtime, размер, inode) и
+    сохраняется атомарно: запись во временный файл, fsync и rename.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.interface_lines = []
+        self.peers = {}
+        self._by_name = {}
+        self._by_ip = {}
+        self._stat = None
+        # Блокировка для последовательности "изменение + save()" из нескольких потоков
+        self.lock = threading.RLock()
+    
+    def _file_stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+    
+    def _index(self, peer):
+        self.peers[peer.public_key] = peer
+        if peer.name:
+            self._by_name[peer.name] = peer
+        for ip in peer.allowed_ips:
+            self._by_ip[_host_ip(ip)] = peer
+    
+    def _unindex(self, peer):
+        self.peers.pop(peer.public_key, None)
+        if peer.name and self._by_name.get(peer.name) is peer:
+            del self._by_name[peer.name]
+        for ip in peer.allowed_ips:
+            if self._by_ip.get(_host_ip(ip)) is peer:
+                del self._by_ip[_host_ip(ip)]
+    
+    def parse(self, text):
+        """Разбирает текст конфигурации"""
+        self.interface_lines = []
+        self.peers = {}
+        self._by_name = {}
+        self._by_ip = {}
+        
+        section = self.interface_lines
+        peer = None
+        
+        for raw_line in text.splitlines():
+            line = raw_line.rstrip()
+            stripped = line.strip()
+            
+            if stripped.lower() == "[peer]":
+                # Комментарии непосредственно перед [Peer] (без пустой строки) относятся к новому пиру
+                header = []
+                while section and not section[-1].strip():
+                    section.pop()
+                while section and section[-1].lstrip().startswith('#'):
+                    header.insert(0, section.pop())
+                
+                if peer is not None:
+                    self._index(peer)
+                
+                name = None
+                for comment in header:
+                    match = CLIENT_COMMENT_RE.match(comment.strip())
+                    if match:
+                        name = match.group(1)
+                
+                peer = Peer(None, name=name, header=header)
+                section = peer.extra
+                continue
+            
+            if peer is not None and '=' in stripped and not stripped.startswith('#'):
+                key, value = (part.strip() for part in stripped.split('=', 1))
+                if key.lower() == "publickey":
+                    peer.public_key = value
+                    continue
+                if key.lower() == "allowedips":
+                    peer.allowed_ips.extend(ip.strip() for ip in value.split(',') if ip.strip())
+                    continue
+            
+            section.append(line)
+        
+        if peer is not None:
+            self._index(peer)
+        
+        # Пустые строки в конце секций не сохраняются: render добавляет свои разделители
+        while self.interface_lines and not self.interface_lines[-1].strip():
+            self.interface_lines.pop()
+        for peer in self.peers.values():
+            while peer.extra and not peer.extra[-1].strip():
+                peer.extra.pop()
+    
+    def render(self):
+        """Формирует текст конфигурации"""
+        parts = ["\n".join(self.interface_lines) + "\n"]
+        for peer in self.peers.values():
+            parts.append("\n" + peer.render())
+        return "".join(parts)
+    
+    def load(self, force=False):
+        """
+        Загружает конфигурацию, если файл изменился с момента последнего чтения
+        
+        Returns:
+            True, если файл существует
+        """
+        with self.lock:
+            stat = self._file_stat()
+            if stat is None:
+                self.parse("")
+                self._stat = None
+                return False
+            
+            if force or stat != self._stat:
+                with open(self.path, 'r') as f:
+                    self.parse(f.read())
+                self._stat = stat
+            
+            return True
+    
+    def save(self):
+        """Атомарно сохраняет конфигурацию (временный файл, fsync, rename)"""
+        with self.lock:
+            directory = os.path.dirname(self.path) or "."
+            fd, tmp_path = tempfile.mkstemp(prefix=".wg-", suffix=".conf", dir=directory)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write(self.render())
+                    f.flush()
+                    os.fsync(f.fileno())
+                # Конфигурация содержит приватный ключ сервера
+                os.chmod(tmp_path, 0o600)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+            
+            # Переименование фиксируется в каталоге
+            try:
+                dir_fd = os.open(directory, os.O_RDONLY)
+                try:
+                    os.fsync(dir_fd)
+                finally:
+                    os.close(dir_fd)
+            except OSError:
+                pass
+            
+            self._stat = self._file_stat()
+    
+    def get_by_key(self, public_key):
+        with self.lock:
+            self.load()
+            return self.peers.get(public_key)
+    
+    def get_by_name(self, name):
+        with self.lock:
+            self.load()
+            return self._by_name.get(name)
+    
+    def get_by_ip(self, ip):
+        with self.lock:
+            self.load()
+            return self._by_ip.get(_host_ip(ip))
+    
+    def all_ips(self):
+        """Все адреса из AllowedIPs пиров"""
+        with self.lock:
+            self.load()
+            return [ip for peer in self.peers.values() for ip in peer.allowed_ips]
+    
+    def add_peer(self, name, public_key, allowed_ips, added=None):
+        """Добавляет (или заменяет) пира; изменения сохраняются вызовом save()"""
+        with self.lock:
+            self.load()
+            existing = self.peers.get(public_key)
+            if existing is not None:
+                self._unindex(existing)
+            
+            added = added or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            peer = Peer(
+                public_key,
+                allowed_ips=[allowed_ips] if isinstance(allowed_ips, str) else allowed_ips,
+                name=name,
+                header=[f"# Клиент: {name} - добавлен {added}"] if name else []
+            )
+            self._index(peer)
+            return peer
+    
+    def remove_peer(self, public_key=None, name=None):
+        """
+        Удаляет пира по публичному ключу (или по имени клиента)
+        
+        Returns:
+            Удаленный пир или None
+        """
+        with self.lock:
+            self.load()
+            peer = self.peers.get(public_key) if public_key else None
+            if peer is None and name:
+                peer = self._by_name.get(name)
+            if peer is not None:
+                self._unindex(peer)
+            return peer
+    
+    def set_allowed_ips(self, public_key, allowed_ips):
+        """
+        Изменяет адреса пира
+        
+        Returns:
+            Прежний список адресов или None, если пир не найден
+        """
+        with self.lock:
+            self.load()
+            peer = self.peers.get(public_key)
+            if peer is None:
+                return None
+            old_ips = peer.allowed_ips
+            self._unindex(peer)
+            peer.allowed_ips = [allowed_ips] if isinstance(allowed_ips, str) else list(allowed_ips)
+            self._index(peer)
+            return old_ips
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Генерация ключей WireGuard (Curve25519) без вызова внешних утилит
+Автор: RUCODER (https://рукодер.рф/vpn)
+"""
+
+import base64
+import secrets
+
+try:
+    from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+    from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+except ImportError:
+    # Без пакета cryptography используется реализация на чистом Python (медленнее)
+    X25519PrivateKey = None
+
+# Параметры кривой Curve25519 (RFC 7748)
+_P = 2 ** 255 - 19
+_A24 = 121665
+_BASE_POINT = (9).to_bytes(32, 'little')
+_MASK_255 = (1 << 255) - 1
+
+def clamp_private_key(key_bytes):
+    """Приводит 32 байта к виду секретного ключа X25519 (как `wg genkey`)"""
+    key = bytearray(key_bytes)
+    key[0] &= 248
+    key[31] &= 127
+    key[31] |= 64
+    return bytes(key)
+
+def _cswap(swap, a, b):
+    """Условный обмен без ветвления по секретному биту"""
+    mask = -swap
+    dummy = mask & (a ^ b)
+    return a ^ dummy, b ^ dummy
+
+def x25519(scalar, u_point):
+    """
+    Умножение точки на скаляр по лестнице Монтгомери (RFC 7748, раздел 5)
+    
+    Args:
+        scalar: 32 байта секретного скаляра (ограничивается внутри)
+        u_point: 32 байта u-координаты точки
+    
+    Returns:
+        32 байта u-координаты результата
+    """
+    k = int.from_bytes(clamp_private_key(scalar), 'little')
+    x1 = int.from_bytes(u_point, 'little') & _MASK_255
+    x2, z2, x3, z3 = 1, 0, x1, 1
+    swap = 0
+    
+    for t in range(254, -1, -1):
+        k_t = (k >> t) & 1
+        swap ^= k_t
+        x2, x3 = _cswap(swap, x2, x3)
+        z2, z3 = _cswap(swap, z2, z3)
+        swap = k_t
+        
+        a = x2 + z2
+        aa = a * a % _P
+        b = x2 - z2
+        bb = b * b % _P
+        e = aa - bb
+        c = x3 + z3
+        d = x3 - z3
+        da = d * a % _P
+        cb = c * b % _P
+        x3 = da + cb
+        x3 = x3 * x3 % _P
+        z3 = da - cb
+        z3 = x1 * (z3 * z3 % _P) % _P
+        x2 = aa * bb % _P
+        z2 = e * (aa + _A24 * e) % _P
+    
+    x2, x3 = _cswap(swap, x2, x3)
+    z2, z3 = _cswap(swap, z2, z3)
+    
+    return (x2 * pow(z2, _P - 2, _P) % _P).to_bytes(32, 'little')
+
+def generate_private_key():
+    """Генерирует приватный ключ в формате base64 (аналог `wg genkey`)"""
+    return base64.b64encode(clamp_private_key(secrets.token_bytes(32))).decode('ascii')
+
+def derive_public_key(private_key):
+    """Вычисляет публичный ключ из приватного в формате base64 (аналог `wg pubkey`)"""
+    private_bytes = base64.b64decode(private_key.strip())
+    if len(private_bytes) != 32:
+        raise ValueError("Приватный ключ WireGuard должен содержать 32 байта")
+    
+    if X25519PrivateKey is not None:
+        public_bytes = X25519PrivateKey.from_private_bytes(private_bytes).public_key().public_bytes(
+            Encoding.Raw, PublicFormat.Raw
+        )
+    else:
+        public_bytes = x25519(private_bytes, _BASE_POINT)
+    
+    return base64.b64encode(public_bytes).decode('ascii')
+
+def generate_keypair():
+    """
+    Генерирует пару ключей WireGuard
+    
+    Returns:
+        Кортеж (приватный_ключ, публичный_ключ) в формате base64
+    """
+    private_key = generate_private_key()
+    return private_key, derive_public_key(private_key)